@@ -3,6 +3,8 @@
 import numpy as np
 from ax.service.ax_client import AxClient, ObjectiveProperties
 from pydantic.v1 import BaseModel
+from color_metrics import rate_colors
+from pseudo_color_mixer import PseudoColorMixer, ColorMixerInput
 
 class RGBValue(BaseModel):
     red: float
@@ -17,21 +19,9 @@ class ColorOptimizerInput(BaseModel):
 
 def color_rating(measured_rgb:RGBValue, target_rgb) -> float:
     """rates a color based on measured color_mixer_output and ColorOptimizerInput"""
-    target_r = target_rgb.red     # Fraunhofer-Green: 0,151,117; Bigmap-Green: 4,92,97
-    target_g = target_rgb.green
-    target_b = target_rgb.blue
-
-    r = measured_rgb.red
-    g = measured_rgb.green
-    b = measured_rgb.blue
-
-    max_error = 3*255
-    r_error = abs(r-target_r)
-    g_error = abs(g-target_g)
-    b_error = abs(b-target_b)
-
-    rating = sum([r_error, g_error, b_error])/max_error
-    return rating
+    # Fraunhofer-Green: 0,151,117; Bigmap-Green: 4,92,97
+    return float(rate_colors([[measured_rgb.red, measured_rgb.green, measured_rgb.blue]],
+                             [target_rgb.red, target_rgb.green, target_rgb.blue])[0])
 
 def optimize_color_mixing(color_optimizer_input: ColorOptimizerInput):
     """
@@ -56,24 +46,26 @@ def optimize_color_mixing(color_optimizer_input: ColorOptimizerInput):
     )
 
 
-    for i in range(19):
+    color_mixer = PseudoColorMixer()
+    for i in range(color_optimizer_input.iterations):
 
         parameterization, trial_index = ax_client.get_next_trial()
 
         print(f"Trial {i+1}: {parameterization}")
 
         # extract parameters
-        measurement_result = subtractive_color_mixing(ColorMixerInput(
+        mixed_rgb = color_mixer.mix(ColorMixerInput(
             red_fraction=parameterization["red_fraction"],
             green_fraction=parameterization["green_fraction"],
             blue_fraction=parameterization["blue_fraction"],
         ))
+        measurement_result = RGBValue(red=mixed_rgb.red_value, green=mixed_rgb.green_value, blue=mixed_rgb.blue_value)
         rating = color_rating(measured_rgb = measurement_result, target_rgb = color_optimizer_input.target_color)
         ax_client.complete_trial(trial_index=trial_index, raw_data={"rating": rating})
 
     best_parameters, metrics = ax_client.get_best_parameters()
 
-    fig = ax_client.get_contour_plot(param_x="x1", param_y="x2", metric_name="hartmann6")
+    fig = ax_client.get_contour_plot(param_x="red_fraction", param_y="green_fraction", metric_name="rating")
     return best_parameters, fig
 
 
@@ -0,0 +1,146 @@
+### renders the beaker images of the color mixer, shared by PseudoColorMixer and beaker_visualization
+from functools import lru_cache
+from io import BytesIO
+from typing import Union
+
+DEFAULT_WIDTH = 100
+
+# geometry of the beaker for DEFAULT_WIDTH, all other sizes are scaled from it
+_HEIGHT = 150
+_BEAKER_BOTTOM_WIDTH = 40
+_BEAKER_TOP_WIDTH = 50
+_BEAKER_HEIGHT = 100
+_BEAKER_Y = 25
+
+_LIQUID_TEMPLATE = '''
+    <polygon points="{x_bottom_left},{y_bottom}
+                     {x_bottom_right},{y_bottom}
+                     {{liquid_x_right}},{{liquid_y}}
+                     {{liquid_x_left}},{{liquid_y}}"
+             fill="{{liquid_color}}"
+             opacity="0.8"/>'''
+
+
+@lru_cache(maxsize=16)
+def _compile_template(width: int):
+    """
+    Builds the static part of the SVG for a given width once.
+
+    Returns:
+        tuple: (SVG template with a {liquid} placeholder, liquid polygon template, geometry dict)
+    """
+    scale = width / DEFAULT_WIDTH
+    height = _HEIGHT * scale
+    beaker_bottom_width = _BEAKER_BOTTOM_WIDTH * scale
+    beaker_top_width = _BEAKER_TOP_WIDTH * scale
+    beaker_height = _BEAKER_HEIGHT * scale
+    beaker_x = (width - beaker_bottom_width) // 2
+    beaker_y = _BEAKER_Y * scale
+    rim_offset = (beaker_top_width - beaker_bottom_width) // 2
+    geometry = dict(beaker_x=beaker_x, beaker_y=beaker_y, beaker_height=beaker_height,
+                    beaker_bottom_width=beaker_bottom_width, rim_offset=rim_offset)
+
+    svg_template = f'''<?xml version="1.0" encoding="UTF-8"?>
+<svg width="{width:g}" height="{height:g}" xmlns="http://www.w3.org/2000/svg">
+    <!-- Hintergrund -->
+    <rect width="{width:g}" height="{height:g}" fill="white"/>
+
+    <!-- Becherglas (Trapezform) -->
+    <polygon points="{beaker_x:g},{beaker_y + beaker_height:g}
+                     {beaker_x + beaker_bottom_width:g},{beaker_y + beaker_height:g}
+                     {beaker_x + rim_offset + beaker_bottom_width:g},{beaker_y:g}
+                     {beaker_x - rim_offset:g},{beaker_y:g}"
+             fill="none"
+             stroke="black"
+             stroke-width="3"/>
+
+    <!-- Flüssigkeit (falls vorhanden) -->{{liquid}}
+
+    <!-- Becherrand (oben) -->
+    <line x1="{beaker_x - rim_offset - 5 * scale:g}"
+          y1="{beaker_y:g}"
+          x2="{beaker_x + rim_offset + beaker_bottom_width + 5 * scale:g}"
+          y2="{beaker_y:g}"
+          stroke="black"
+          stroke-width="4"/>
+
+    <!-- Ausgießer -->
+    <path d="M {beaker_x + rim_offset + beaker_bottom_width + 5 * scale:g} {beaker_y:g}
+             Q {beaker_x + rim_offset + beaker_bottom_width + 15 * scale:g} {beaker_y - 5 * scale:g}
+             {beaker_x + rim_offset + beaker_bottom_width + 20 * scale:g} {beaker_y + 5 * scale:g}"
+          fill="none"
+          stroke="black"
+          stroke-width="2"/>
+</svg>'''
+
+    liquid_template = _LIQUID_TEMPLATE.format(x_bottom_left=f"{beaker_x:g}",
+                                              x_bottom_right=f"{beaker_x + beaker_bottom_width:g}",
+                                              y_bottom=f"{beaker_y + beaker_height:g}")
+    return svg_template, liquid_template, geometry
+
+
+@lru_cache(maxsize=4096)
+def _render(filling_percent: float, liquid_color: str, width: int) -> str:
+    svg_template, liquid_template, geometry = _compile_template(width)
+    liquid = ""
+    if filling_percent > 0:
+        beaker_height = geometry["beaker_height"]
+        liquid_height = (filling_percent / 100) * beaker_height
+        liquid_y = geometry["beaker_y"] + beaker_height - liquid_height
+        liquid_x_left = geometry["beaker_x"] - geometry["rim_offset"] * (liquid_height / beaker_height)
+        liquid_x_right = (geometry["beaker_x"] + geometry["beaker_bottom_width"]
+                          + geometry["rim_offset"] * (liquid_height / beaker_height))
+        liquid = liquid_template.format(liquid_x_left=f"{liquid_x_left:g}", liquid_x_right=f"{liquid_x_right:g}",
+                                        liquid_y=f"{liquid_y:g}", liquid_color=liquid_color)
+    return svg_template.format(liquid=liquid)
+
+
+@lru_cache(maxsize=4096)
+def _render_bytes(filling_percent: float, liquid_color: str, width: int) -> bytes:
+    return _render(filling_percent, liquid_color, width).encode('utf-8')
+
+
+def render_beaker_svg(filling_percent: float, liquid_color: str, width: int = DEFAULT_WIDTH,
+                      as_bytes: bool = False) -> Union[str, bytes]:
+    """
+    Renders an SVG image of a beaker filled with liquid. Results are cached, nothing is written to disk.
+
+    Args:
+        filling_percent (float): filling level in percent (0-100)
+        liquid_color (str): color of the liquid (e.g. 'blue', '#FF0000', 'rgb(255,0,0)')
+        width (int): width of the image in px, the height is 1.5 times the width
+        as_bytes (bool): return utf-8 encoded bytes instead of a string
+
+    Returns:
+        str or bytes: SVG code
+    """
+    # clamp the filling level and normalize the color so equal beakers share one cache entry
+    filling_percent = float(max(0, min(100, filling_percent)))
+    if liquid_color.startswith("#"):
+        liquid_color = liquid_color.upper()
+    if as_bytes:
+        return _render_bytes(filling_percent, liquid_color, int(width))
+    return _render(filling_percent, liquid_color, int(width))
+
+
+def svg_io(svg_code: Union[str, bytes], name: str = "beaker_image.svg") -> BytesIO:
+    """Wraps SVG code in a named in-memory file, e.g. for WikiFileController.put or pn.pane.SVG"""
+    if isinstance(svg_code, str):
+        svg_code = svg_code.encode('utf-8')
+    svg_file = BytesIO(svg_code)
+    svg_file.name = name
+    return svg_file
+
+
+def save_svg(svg_code: Union[str, bytes], filename: str):
+    """Writes SVG code to a file."""
+    if isinstance(svg_code, bytes):
+        svg_code = svg_code.decode('utf-8')
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(svg_code)
+    print(f"SVG-Datei '{filename}' wurde erstellt.")
+
+
+def clear_cache():
+    _render.cache_clear()
+    _render_bytes.cache_clear()
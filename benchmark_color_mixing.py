@@ -0,0 +1,56 @@
+### micro-benchmark: scalar vs. vectorized subtractive color mixing
+import argparse
+import time
+
+import numpy as np
+
+from pseudo_color_mixer import (PseudoColorMixer, ColorMixerInput, rgb_to_hex, rgb_to_hex_array,
+                                subtractive_color_mixing_batch)
+
+
+def random_fractions(n: int, seed: int = 0) -> np.ndarray:
+    """Draws n random mixtures with red + green + blue <= 1 (remainder is water)."""
+    rng = np.random.default_rng(seed)
+    fractions = rng.dirichlet(np.ones(4), size=n)
+    return fractions[:, :3]
+
+
+def run_scalar(color_mixer: PseudoColorMixer, fractions: np.ndarray):
+    hex_colors = []
+    for red_fraction, green_fraction, blue_fraction in fractions.tolist():
+        rgb_value = color_mixer.subtractive_color_mixing(ColorMixerInput(red_fraction=red_fraction,
+                                                                         green_fraction=green_fraction,
+                                                                         blue_fraction=blue_fraction))
+        hex_colors.append(rgb_to_hex(rgb_value))
+    return hex_colors
+
+
+def run_batch(fractions: np.ndarray):
+    rgb_array = subtractive_color_mixing_batch(fractions)
+    return rgb_to_hex_array(rgb_array)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scalar and vectorized color mixing.")
+    parser.add_argument("--n", type=int, default=10**6, help="number of mixtures")
+    parser.add_argument("--scalar-n", type=int, default=None,
+                        help="number of mixtures for the (slow) scalar path, extrapolated to n. Defaults to n.")
+    args = parser.parse_args()
+
+    fractions = random_fractions(args.n)
+    scalar_n = args.scalar_n or args.n
+
+    start = time.perf_counter()
+    batch_hex = run_batch(fractions)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar_hex = run_scalar(PseudoColorMixer(), fractions[:scalar_n])
+    scalar_time = (time.perf_counter() - start) * args.n / scalar_n
+
+    assert list(batch_hex[:scalar_n]) == scalar_hex, "scalar and vectorized results differ"
+
+    print(f"mixtures:   {args.n}")
+    print(f"scalar:     {scalar_time:.3f} s" + (" (extrapolated)" if scalar_n != args.n else ""))
+    print(f"vectorized: {batch_time:.3f} s")
+    print(f"speedup:    {scalar_time / batch_time:.0f}x")
@@ -0,0 +1,171 @@
+### offline closed-loop benchmark: suggest -> mix -> rate with Ax against the PseudoColorMixer simulator
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+import numpy as np
+from ax.modelbridge.factory import Models
+from ax.modelbridge.generation_strategy import GenerationStep, GenerationStrategy
+from ax.utils.common.logger import set_stderr_log_level
+
+from color_metrics import METRICS, rate_colors
+from color_optimizer import PARAMETER_NAMES, build_generation_strategy, create_ax_client
+from pseudo_color_mixer import PseudoColorMixer, ColorMixerInput, hex_to_rgb_array
+
+# Fraunhofer-Green, Bigmap-Green and a few colors the mixer can reach
+DEFAULT_TARGETS = ["#009775", "#045C61", "#7F3FBF", "#BFBF40", "#4080FF"]
+
+
+def sobol_botorch_strategy() -> GenerationStrategy:
+    return GenerationStrategy(steps=[
+        GenerationStep(model=Models.SOBOL, num_trials=6, min_trials_observed=3),
+        GenerationStep(model=Models.BOTORCH_MODULAR, num_trials=-1),
+    ])
+
+
+def sobol_strategy() -> GenerationStrategy:
+    return GenerationStrategy(steps=[GenerationStep(model=Models.SOBOL, num_trials=-1)])
+
+
+# generation strategies that can be compared, name: factory
+STRATEGIES: Dict[str, Callable[[], GenerationStrategy]] = {
+    "botorch": lambda: build_generation_strategy(max_parallelism=1),
+    "sobol+botorch": sobol_botorch_strategy,
+    "sobol": sobol_strategy,
+}
+
+
+def run_closed_loop(strategy: str, target: str, seed: int, iterations: int = 20, metric: str = "l1",
+                    threshold: float = None, initial_experiments: int = 3) -> dict:
+    """
+    Runs one optimization against the simulator.
+
+    Args:
+        strategy: key of STRATEGIES
+        target: hex code of the target color
+        seed: random seed of the AxClient
+        iterations: number of suggest -> mix -> rate iterations
+        metric: rating metric, one of the values of color_metrics.METRICS
+        threshold: rating at which the target counts as reached
+        initial_experiments: random experiments that exist before the optimization starts, like the
+            historical experiments in the wiki. Strategies without an initialization step need them.
+
+    Returns:
+        dict: configuration, per iteration timings and the convergence curve (best rating so far)
+    """
+    ax_client = create_ax_client(STRATEGIES[strategy](), random_seed=seed, verbose_logging=False)
+    color_mixer = PseudoColorMixer()
+    target_rgb = hex_to_rgb_array([target])[0]
+
+    def rate(parameterization) -> float:
+        rgb_value = color_mixer.mix(ColorMixerInput(**parameterization))
+        return float(rate_colors([[rgb_value.red_value, rgb_value.green_value, rgb_value.blue_value]],
+                                 target_rgb, metric=metric)[0])
+
+    # the same initial experiments for every strategy with the same seed
+    initial_fractions = np.random.default_rng(seed).dirichlet(np.ones(4), size=initial_experiments)[:, :3]
+    for fractions in initial_fractions.tolist():
+        parameterization, trial_index = ax_client.attach_trial(dict(zip(PARAMETER_NAMES, fractions)))
+        ax_client.complete_trial(trial_index=trial_index, raw_data={"rating": rate(parameterization)})
+
+    records = []
+    best_rating = float("inf")
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        iteration_start = time.perf_counter()
+        parameterization, trial_index = ax_client.get_next_trial()
+        generator_run = ax_client.experiment.trials[trial_index].generator_run
+        rating = rate(parameterization)
+        ax_client.complete_trial(trial_index=trial_index, raw_data={"rating": rating})
+        best_rating = min(best_rating, rating)
+        records.append(dict(iteration=iteration,
+                            model=generator_run._model_key,
+                            wall_time=time.perf_counter() - iteration_start,
+                            fit_time=generator_run.fit_time or 0.0,
+                            gen_time=generator_run.gen_time or 0.0,
+                            rating=rating,
+                            best_rating=best_rating,
+                            parameters=[parameterization[name] for name in PARAMETER_NAMES]))
+    reached = [record["iteration"] + 1 for record in records
+               if threshold is not None and record["best_rating"] <= threshold]
+    return dict(strategy=strategy, target=target, seed=seed, metric=metric, iterations=iterations,
+                threshold=threshold, initial_experiments=initial_experiments,
+                total_time=time.perf_counter() - start,
+                best_rating=best_rating,
+                experiments_to_threshold=reached[0] if reached else None,
+                records=records)
+
+
+def _init_worker():
+    # one process per core, so every process computes single threaded
+    import torch
+    torch.set_num_threads(1)
+    set_stderr_log_level(logging.WARNING)
+
+
+def run_benchmark(strategies: List[str], targets: List[str], seeds: List[int], iterations: int = 20,
+                  metric: str = "l1", threshold: float = None, initial_experiments: int = 3,
+                  max_workers: int = None, output: str = "benchmark_results.jsonl") -> List[dict]:
+    """Runs every strategy/target/seed combination on a process pool and appends each run to output as a json line."""
+    configs = [dict(strategy=strategy, target=target, seed=seed, iterations=iterations, metric=metric,
+                    threshold=threshold, initial_experiments=initial_experiments)
+               for strategy in strategies for target in targets for seed in seeds]
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool, \
+            open(output, 'a', encoding='utf-8') as f:
+        futures = {pool.submit(run_closed_loop, **config): config for config in configs}
+        for future in as_completed(futures):
+            config = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error in run {config}: {e}")
+                continue
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            results.append(result)
+            print(f"{len(results)}/{len(configs)} {result['strategy']} {result['target']} seed {result['seed']}: "
+                  f"best rating {result['best_rating']:.4f} in {result['total_time']:.1f} s")
+    return results
+
+
+def summarize(results: List[dict]):
+    """Prints latency and number of experiments needed per strategy."""
+    print(f"{'strategy':<15}{'runs':>6}{'best rating':>13}{'to threshold':>14}"
+          f"{'s/iteration':>13}{'fit s':>9}{'gen s':>9}")
+    for strategy in sorted({result["strategy"] for result in results}):
+        runs = [result for result in results if result["strategy"] == strategy]
+        records = [record for result in runs for record in result["records"]]
+        reached = [result["experiments_to_threshold"] for result in runs
+                   if result["experiments_to_threshold"] is not None]
+        to_threshold = f"{np.mean(reached):.1f} ({len(reached)}/{len(runs)})" if reached else "-"
+        print(f"{strategy:<15}{len(runs):>6}"
+              f"{np.mean([result['best_rating'] for result in runs]):>13.4f}"
+              f"{to_threshold:>14}"
+              f"{np.mean([record['wall_time'] for record in records]):>13.3f}"
+              f"{np.mean([record['fit_time'] for record in records]):>9.3f}"
+              f"{np.mean([record['gen_time'] for record in records]):>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark generation strategies in closed loop against the simulator.")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument("--targets", nargs="+", default=DEFAULT_TARGETS, help="target colors as hex codes")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeds per strategy and target")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--metric", default="l1", choices=list(METRICS.values()))
+    parser.add_argument("--threshold", type=float, default=0.01, help="rating at which a target counts as reached")
+    parser.add_argument("--initial-experiments", type=int, default=3,
+                        help="random experiments attached before the optimization starts")
+    parser.add_argument("--max-workers", type=int, default=None, help="processes, defaults to the number of cores")
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.strategies, args.targets, list(range(args.seeds)), iterations=args.iterations,
+                            metric=args.metric, threshold=args.threshold,
+                            initial_experiments=args.initial_experiments, max_workers=args.max_workers,
+                            output=args.output)
+    summarize(results)
@@ -0,0 +1,61 @@
+### startup time and resident memory of every role, each built in a fresh interpreter against the fake wiki
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from roles import ROLES
+
+# modules that dominate the startup of a role
+HEAVY_MODULES = ["torch", "botorch", "ax", "plotly", "pandas", "scipy", "panel"]
+
+CHILD = """
+import json, os, resource, sys, tempfile, time
+from fake_osw import FakeOSW
+from experiment_cache import ExperimentCache
+import roles
+
+roles_to_build = {roles!r}
+osw_obj = FakeOSW.create(latency=0.0)
+osw_obj.populate({n}, n_pending={n} // 20)
+repository = None
+if roles.needs_repository(roles_to_build):
+    repository = roles.create_repository(osw_obj, ExperimentCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite")))
+    repository.refresh()
+# the fake wiki and the dataset are set up before, only the imports and panels of the roles are timed
+start = time.perf_counter()
+panels = [roles.build(role, osw_obj, repository) for role in roles_to_build]
+build_time = time.perf_counter() - start
+print(json.dumps(dict(build=build_time,
+                      # kB on linux
+                      max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                      loaded=[name for name in {heavy!r} if name in sys.modules])))
+"""
+
+
+def measure(roles, n: int = 1000) -> dict:
+    """Builds the roles in a new interpreter and returns its build time, process time, max RSS and heavy modules."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD.format(roles=list(roles), n=n, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"building {roles} failed:\n{result.stderr}")
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["process"] = time.perf_counter() - start
+    return measurement
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures startup time and memory of every role.")
+    parser.add_argument("--n", type=int, default=1000, help="synthetic experiments in the fake wiki")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per role, the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'role':<16}{'build [s]':>10}{'process [s]':>13}{'max RSS [MB]':>14}  loaded")
+    for roles in [[role] for role in ROLES] + [ROLES]:
+        runs = [measure(roles, n=args.n) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["build"])
+        label = roles[0] if len(roles) == 1 else "all"
+        print(f"{label:<16}{best['build']:>10.2f}{min(run['process'] for run in runs):>13.2f}"
+              f"{best['max_rss_mb']:>14.0f}  {', '.join(best['loaded'])}")
@@ -0,0 +1,64 @@
+### throughput of 1..n mixer daemons that share the open tasks of one fake wiki, like daemons on several machines
+### with different connections
+import argparse
+import time
+
+from fake_osw import FakeOSW, FakeSite
+from mixer_daemon import MixerDaemon
+from task_leases import LEASE_OWNER_PROPERTY
+
+
+def open_tasks(backend) -> int:
+    with backend.lock:
+        return sum(1 for page in backend.pages.values() if page["jsondata"].get("execution_trigger"))
+
+
+def run(n_workers: int, n_tasks: int, latency: float, settle: float, max_claims: int, jitter: float = 0.0) -> dict:
+    """
+    Executes n_tasks open tasks with n_workers daemons and returns the throughput and duplicate executions.
+    The wiki calls of daemon i take up to i / (n_workers - 1) * jitter seconds longer, so the daemons range from
+    a steady to an erratic connection, which is when leases can be overwritten.
+    """
+    osw_obj = FakeOSW.create(latency=latency, seed=0)
+    osw_obj.populate(0, n_pending=n_tasks)
+    # every daemon has its own OSW instance on the same wiki, so nothing is shared within the process
+    sites = [FakeSite(osw_obj.backend, jitter=i / max(n_workers - 1, 1) * jitter, seed=i) for i in range(n_workers)]
+    daemons = [MixerDaemon(FakeOSW.construct(site=site), settle=settle, max_claims=max_claims) for site in sites]
+    start = time.perf_counter()
+    for daemon in daemons:
+        daemon.start()
+    while open_tasks(osw_obj.backend) > 0:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    for daemon in daemons:
+        daemon.stop()
+    documented = sum(daemon.executor.counters["store"].processed for daemon in daemons)
+    # executed but not documented, because another daemon had claimed the task meanwhile
+    lost = sum(daemon.executor.counters["store"].errors for daemon in daemons)
+    with osw_obj.backend.lock:
+        leased = sum(1 for page in osw_obj.backend.pages.values()
+                     if any(statement.get("property") == LEASE_OWNER_PROPERTY
+                            for statement in page["jsondata"].get("statements", [])))
+    return dict(workers=n_workers, seconds=elapsed, tasks_per_second=n_tasks / elapsed,
+                duplicates=documented + lost - n_tasks, documented_twice=documented - n_tasks,
+                leftover_leases=leased)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of several mixer daemons sharing one fake wiki.")
+    parser.add_argument("--tasks", type=int, default=400, help="open tasks")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of daemons")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per wiki call")
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="up to this many extra seconds per wiki call, the more the higher the daemon's number")
+    parser.add_argument("--settle", type=float, default=0.5)
+    parser.add_argument("--max-claims", type=int, default=8)
+    args = parser.parse_args()
+
+    baseline = None
+    for n_workers in args.workers:
+        result = run(n_workers, args.tasks, args.latency, args.settle, args.max_claims, jitter=args.jitter)
+        baseline = baseline or result["tasks_per_second"] / n_workers
+        print(f"{n_workers} worker(s): {result['seconds']:.1f} s, {result['tasks_per_second']:.1f} tasks/s "
+              f"({result['tasks_per_second'] / baseline:.1f}x one worker), {result['duplicates']} executed twice "
+              f"({result['documented_twice']} documented twice), {result['leftover_leases']} leftover leases")
@@ -0,0 +1,312 @@
+### documents finished color mixing results in bulk: concurrent image uploads and one store_entity call per flush
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from typing import Dict, List
+
+from osw.core import OSW
+from osw.model.entity import PseudoColoredLiquid, PseudoColorMixing, RGBValue
+from osw.utils.wiki import get_full_title
+import experiment_trace
+import metrics
+from pseudo_color_mixer import (OPERATION_ERRORS, OPERATION_SECONDS, STORED_ENTITIES, PseudoColorMixer,
+                                ColorMixerInput)
+from task_leases import clear_lease, load_uncached, read_lease
+from task_polling import get_shared_open_task_query
+
+PENDING_RESULTS = metrics.gauge("bulk_documenter_pending_results", "Spooled results waiting for the next flush.")
+FLUSH_SECONDS = metrics.histogram("bulk_documenter_flush_seconds", "Duration of flushes that documented results.")
+
+
+class SpooledResult:
+    """A finished result waiting for documentation. It is mirrored to a json file in the spool directory."""
+
+    def __init__(self, result_id: str, beaker_image_uuid: uuid.UUID, svg_bytes: bytes,
+                 process_instance: PseudoColorMixing, output_instance: PseudoColoredLiquid, uploaded: bool = False,
+                 lease_owner: str = None, attempts: int = 0):
+        self.result_id = result_id
+        self.beaker_image_uuid = beaker_image_uuid
+        self.svg_bytes = svg_bytes
+        self.process_instance = process_instance
+        self.output_instance = output_instance
+        self.uploaded = uploaded
+        # owner of the lease on the task when it was spooled, None if it was not claimed
+        self.lease_owner = lease_owner
+        # failed uploads and stores
+        self.attempts = attempts
+
+    def to_json(self) -> str:
+        return json.dumps(dict(result_id=self.result_id,
+                               beaker_image_uuid=str(self.beaker_image_uuid),
+                               svg=self.svg_bytes.decode('utf-8'),
+                               process=self.process_instance.json(exclude_none=True),
+                               output=self.output_instance.json(exclude_none=True),
+                               uploaded=self.uploaded,
+                               lease_owner=self.lease_owner,
+                               attempts=self.attempts))
+
+    @classmethod
+    def from_json(cls, text: str) -> "SpooledResult":
+        data = json.loads(text)
+        return cls(result_id=data["result_id"],
+                   beaker_image_uuid=uuid.UUID(data["beaker_image_uuid"]),
+                   svg_bytes=data["svg"].encode('utf-8'),
+                   process_instance=PseudoColorMixing.parse_raw(data["process"]),
+                   output_instance=PseudoColoredLiquid.parse_raw(data["output"]),
+                   uploaded=data["uploaded"],
+                   lease_owner=data.get("lease_owner"),
+                   attempts=data.get("attempts", 0))
+
+
+class BulkDocumenter:
+    """
+    Gathers finished color mixing results and documents them in bulk. A flush happens when max_batch_size
+    results are waiting or max_delay seconds have passed. It uploads the beaker images with at most
+    max_upload_workers parallel uploads and stores all process and output entities with one store_entity call.
+    Every result is written to spool_dir before submit() returns and removed after it was stored,
+    so results of a crashed process are documented by the next documenter that uses the same spool_dir.
+    A spooled task is still flagged for execution on the wiki, so its title stays in progress in the open task
+    query of osw_obj until the flush stored it. A claimed task keeps its lease on the wiki until then. Right
+    before storing, the flush checks that the task is still flagged and that its lease is still the one of the
+    worker that spooled the result. Results of tasks that another worker documented or claimed in the meantime
+    (e.g. after the lease expired) are dropped.
+    A result whose upload or store failed max_attempts times is given up: its task is handed out again and, with
+    a TaskQuarantine, the failure is recorded, so a task that can not be documented is quarantined eventually.
+    """
+
+    def __init__(self, color_mixer: PseudoColorMixer, osw_obj: OSW, max_batch_size: int = 50,
+                 max_delay: float = 10.0, max_upload_workers: int = 4, spool_dir: str = "documentation_spool",
+                 max_attempts: int = 5, quarantine=None):
+        self.color_mixer = color_mixer
+        self.osw_obj = osw_obj
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_upload_workers = max_upload_workers
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.quarantine = quarantine
+        self._pending: Dict[str, SpooledResult] = {}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._flush_requested = Event()
+        self._stop_event = Event()
+        self.thread: Thread = None
+        self.flush_count = 0
+        self.documented_count = 0
+        self.open_task_query = get_shared_open_task_query(osw_obj)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.recover()
+        PENDING_RESULTS.set_function(lambda: self.pending_count)
+
+    ## spool
+
+    def _spool_path(self, result_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{result_id}.json")
+
+    def _write_spool(self, result: SpooledResult):
+        # write to a temporary file first, so a crash never leaves a half written entry
+        path = self._spool_path(result.result_id)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(result.to_json())
+        os.replace(path + ".tmp", path)
+
+    def recover(self) -> int:
+        """Loads results that were spooled but not documented, e.g. by a crashed process."""
+        recovered = 0
+        for filename in sorted(os.listdir(self.spool_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, filename), encoding='utf-8') as f:
+                    result = SpooledResult.from_json(f.read())
+            except Exception as e:
+                print(f"Error reading spooled result {filename}: {e}")
+                continue
+            with self._lock:
+                if result.result_id not in self._pending:
+                    self._pending[result.result_id] = result
+                    recovered += 1
+            # still flagged for execution on the wiki until the flush, loops of this process must not take it
+            self.open_task_query.mark_in_progress([get_full_title(result.process_instance)])
+        if recovered:
+            print(f"Recovered {recovered} spooled results.")
+            self._flush_requested.set()
+        return recovered
+
+    ## submission
+
+    def submit(self, inp: ColorMixerInput, rgb_value: RGBValue, svg_bytes: bytes,
+               process_instance: PseudoColorMixing = None):
+        """
+        Spools a result for the next flush. Titles are assigned now, so links to the entities are valid after the flush.
+
+        Returns:
+            SpooledResult: the spooled result with its process and output entity
+        """
+        beaker_image_uuid = uuid.uuid4()
+        beaker_image_wf = self.color_mixer.create_beaker_image_file(self.osw_obj, beaker_image_uuid)
+        process_instance, output_instance = self.color_mixer.create_documentation_entities(
+            inp, rgb_value, get_full_title(beaker_image_wf), process_instance=process_instance)
+        # the lease is checked with the flush, the documented process is stored without it
+        lease_owner = read_lease(process_instance)[0]
+        clear_lease(process_instance)
+
+        result = SpooledResult(result_id=uuid.uuid4().hex, beaker_image_uuid=beaker_image_uuid,
+                               svg_bytes=svg_bytes, process_instance=process_instance,
+                               output_instance=output_instance, lease_owner=lease_owner)
+        self._write_spool(result)
+        with self._lock:
+            self._pending[result.result_id] = result
+            if len(self._pending) >= self.max_batch_size:
+                self._flush_requested.set()
+        return result
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    ## flush
+
+    def _drop(self, result: SpooledResult):
+        """Removes a result that is not documented, its task is handed out again."""
+        with self._lock:
+            self._pending.pop(result.result_id, None)
+        try:
+            os.remove(self._spool_path(result.result_id))
+        except FileNotFoundError:
+            pass
+        self.open_task_query.release(get_full_title(result.process_instance))
+
+    def _failed(self, result: SpooledResult, error: Exception):
+        """Counts a failed upload or store of a result and gives it up after max_attempts."""
+        result.attempts += 1
+        if result.attempts < self.max_attempts:
+            self._write_spool(result)
+            return
+        title = get_full_title(result.process_instance)
+        print(f"Giving up documenting {title} after {result.attempts} attempts: {error}")
+        self._drop(result)
+        if self.quarantine is not None:
+            self.quarantine.record_failure(title, error)
+
+    def _check_tasks(self, batch: List[SpooledResult]) -> List[SpooledResult]:
+        """
+        Drops the results of tasks that are no longer flagged for execution, e.g. documented by another worker,
+        or whose lease on the wiki is no longer the one they were spooled with.
+        """
+        titles = [get_full_title(result.process_instance) for result in batch]
+        try:
+            current = load_uncached(self.osw_obj, titles)
+        except Exception as e:
+            print(f"Error checking {len(titles)} tasks, retrying with the next flush: {e}")
+            return []
+        checked = []
+        for title, result in zip(titles, batch):
+            # a process that is not on the wiki yet was documented without a task
+            process = current.get(title)
+            # or it was stored by an earlier flush of this result that failed afterwards
+            if process is None or get_full_title(result.output_instance) in (getattr(process, "output", None) or []):
+                checked.append(result)
+            elif not getattr(process, "execution_trigger", True):
+                print(f"{title} is no longer flagged for execution, its result is not documented")
+                self._drop(result)
+            elif read_lease(process)[0] != result.lease_owner:
+                print(f"{title} was claimed by another worker, its result is not documented")
+                self._drop(result)
+            else:
+                checked.append(result)
+        return checked
+
+    def _upload(self, result: SpooledResult) -> bool:
+        try:
+            beaker_image_wf = self.color_mixer.create_beaker_image_file(self.osw_obj, result.beaker_image_uuid)
+            self.color_mixer.upload_beaker_image(beaker_image_wf, result.svg_bytes)
+        except Exception as e:
+            print(f"Error uploading beaker image {result.beaker_image_uuid}: {e}")
+            self._failed(result, e)
+            return False
+        result.uploaded = True
+        experiment_trace.record(result.process_instance, "uploaded")
+        self._write_spool(result)
+        return True
+
+    def flush(self) -> int:
+        """
+        Documents all pending results. Results whose image upload failed stay pending for the next flush.
+
+        Returns:
+            int: number of documented results
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch: List[SpooledResult] = list(self._pending.values())
+            if not batch:
+                return 0
+            start = time.perf_counter()
+
+            to_upload = [result for result in batch if not result.uploaded]
+            if to_upload:
+                with ThreadPoolExecutor(max_workers=self.max_upload_workers) as pool:
+                    list(pool.map(self._upload, to_upload))
+            batch = [result for result in batch if result.uploaded]
+            if batch:
+                batch = self._check_tasks(batch)
+            if not batch:
+                return 0
+
+            entities = []
+            for result in batch:
+                experiment_trace.record(result.process_instance, "documented")
+                entities += [result.process_instance, result.output_instance]
+            try:
+                with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="store"):
+                    self.osw_obj.store_entity(OSW.StoreEntityParam(entities=entities, overwrite=True))
+            except Exception as e:
+                print(f"Error storing {len(entities)} entities, retrying with the next flush: {e}")
+                for result in batch:
+                    self._failed(result, e)
+                return 0
+
+            with self._lock:
+                for result in batch:
+                    self._pending.pop(result.result_id, None)
+            # the stored processes are no longer flagged for execution, the open task query can hand them out again
+            for result in batch:
+                self.open_task_query.release(get_full_title(result.process_instance))
+            for result in batch:
+                try:
+                    os.remove(self._spool_path(result.result_id))
+                except FileNotFoundError:
+                    pass
+            self.flush_count += 1
+            self.documented_count += len(batch)
+            STORED_ENTITIES.inc(len(entities))
+            for result in batch:
+                experiment_trace.observe(result.process_instance)
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+            return len(batch)
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._flush_requested.wait(self.max_delay)
+            self._flush_requested.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        """Starts flushing in the background."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self._stop_event.clear()
+        self.thread = Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the background flushing after a final flush."""
+        self._stop_event.set()
+        self._flush_requested.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -2,112 +2,237 @@ from pseudo_color_mixer import PseudoColorMixer, ColorMixerInput, PseudoColorMix
 from osw.model.entity import RGBValue
 from osw.express import OswExpress
 from osw.core import OSW
+from experiment_repository import ExperimentRepository
+from experiment_cache import ExperimentDataset
+from pseudo_color_mixer import rgb_to_hex_array
 import panel as pn
-import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
 from io import BytesIO
 import time
 from threading import Thread
 from datetime import datetime
 
+RENDER_MODES = ["single trace", "one trace per experiment"]
+HOVER_TEMPLATE = ("red: %{x}<br>green: %{y}<br>blue: %{z}<br>"
+                  "rgb(%{customdata[0]}, %{customdata[1]}, %{customdata[2]})<extra></extra>")
+# traces with new experiments that are pushed before the figure is rebuilt
+MAX_APPENDED_TRACES = 50
+
+
+def downsample_indices(fractions: np.ndarray, max_points: int, resolution: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Selects at most max_points experiments that cover the fraction space: the space is split into
+    resolution^3 cells and every occupied cell gets one point before any cell gets a second one, so sparse
+    regions stay visible while dense ones are thinned out.
+
+    Args:
+        fractions: (N, 3) red/green/blue fractions
+        max_points: number of points to keep
+        resolution: cells per axis
+        seed: seed of the order within a cell, fixed so the same points are kept between updates
+
+    Returns:
+        np.ndarray: sorted indices of the kept experiments
+    """
+    n = len(fractions)
+    if n <= max_points:
+        return np.arange(n)
+    cells = np.clip((fractions * resolution).astype(int), 0, resolution - 1)
+    cell_ids = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    tie_break = np.random.default_rng(seed).random(n)
+    # rank of every point within its cell, in random order
+    order = np.lexsort((tie_break, cell_ids))
+    sorted_ids = cell_ids[order]
+    cell_starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ranks = np.empty(n, dtype=int)
+    ranks[order] = np.arange(n) - np.repeat(cell_starts, np.diff(np.r_[cell_starts, n]))
+    return np.sort(np.lexsort((tie_break, ranks))[:max_points])
+
+
+## Plotly validates every color string of a marker color array one by one, which takes seconds for 100k points.
+## Colors are therefore quantized to a fixed palette, the markers get the palette index as one numeric array and
+## the palette is one colorscale in the layout, shared by all traces.
+
+PALETTE_LEVELS = 12
+
+
+def palette_indices(rgb: np.ndarray, levels: int = PALETTE_LEVELS) -> np.ndarray:
+    """Index of every color (0-255) in the palette of levels^3 quantized colors."""
+    quantized = np.round(np.clip(rgb, 0, 255) / 255 * (levels - 1)).astype(np.uint16)
+    return (quantized[:, 0] * levels + quantized[:, 1]) * levels + quantized[:, 2]
+
+
+def palette_coloraxis(levels: int = PALETTE_LEVELS) -> dict:
+    """Layout coloraxis that maps palette indices to their colors."""
+    codes = np.arange(levels ** 3)
+    palette = np.stack([codes // levels ** 2, codes // levels % levels, codes % levels], axis=1) * 255 / (levels - 1)
+    colorscale = [[i / (len(codes) - 1), hex_color] for i, hex_color in enumerate(rgb_to_hex_array(palette))]
+    return dict(colorscale=colorscale, cmin=0, cmax=len(codes) - 1, showscale=False)
+
+
 class ColorDatabaseVisualizationPanel():
-    def __init__(self, osw_obj:OSW=None):
+    def __init__(self, osw_obj:OSW=None, repository: ExperimentRepository = None):
         self.osw_obj = osw_obj
+        self.repository = repository if repository is not None else ExperimentRepository(osw_obj)
+        self.fig = None
+        # traces (as dicts) and layout of the single trace figure
+        self.traces = []
+        self.layout = {}
+        # the dataset the figure shows, and the points appended to it since it was built
+        self.shown_dataset: ExperimentDataset = None
+        self.appended_points = 0
         self.build_panel()
+        # show the known experiments right away and push new ones whenever the dataset changes
         self.update_visualization()
+        self.repository.subscribe(self.dataset_changed)
+        self.refresh()
 
     def build_panel(self):
 
+        # a new figure with the same traces only sends the arrays that changed to the browsers
         self.visualization_panel = pn.pane.Plotly()
-
-        self.visualization_col = pn.Column(self.visualization_panel)
+        self.count_markdown = pn.pane.Markdown("")
+        self.render_mode_select = pn.widgets.Select(name="render mode", options=RENDER_MODES, value="single trace",
+                                                    width=200)
+        self.max_points_input = pn.widgets.IntInput(name="max. points", value=20000, start=1000, step=1000,
+                                                    width=200)
+        self.render_mode_select.param.watch(lambda event: self.update_visualization(), "value")
+        self.max_points_input.param.watch(lambda event: self.update_visualization(), "value")
+
+        self.visualization_col = pn.Column(self.count_markdown, self.visualization_panel)
         self.update_visualization_button = pn.widgets.Button(name = "update visualization")
         self.update_visualization_button.on_click(self.update_visualization_callback)
 
 
-        self.controls_col = pn.Column(self.update_visualization_button)
+        self.controls_col = pn.Column(self.update_visualization_button, self.render_mode_select,
+                                      self.max_points_input)
         self.main_row = pn.Row(self.visualization_col , self.controls_col)
 
     def __panel__(self):
         return self.main_row
 
     def get_inputs_outputs(self):
-        ## query for all PseudoColorMixing processes
-        query = """[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]]
-               |?ShallBeExecuted=execute
-               |?HasRedMixtureFraction=red_fraction
-               |?HasGreenMixtureFraction=green_fraction
-               |?HasBlueMixtureFraction=blue_fraction
-               |?HasOutput.HasColor.HasRedValue=red_value
-               |?HasOutput.HasColor.HasGreenValue=green_value
-               |?HasOutput.HasColor.HasBlueValue=blue_value"""
-        res = self.osw_obj.mw_site.api("ask", query=query, format="json", limit=1000)
-        print(res)
-
-        res_dict = res["query"]["results"]
-
-        ## convert them to PseudoColorMixing objects and RGBValue objects
-
-        self.processes = []
-        self.rgb_values = []
-        for fullpagename, process_dict in res_dict.items():
-            printout_dict = process_dict["printouts"]
+        ## take the PseudoColorMixing processes from the shared repository
+        self.dataset = self.repository.dataset
 
-            try:
-                process = PseudoColorMixing(
-                    label = [{"language":"en", "text": "a temporary pseudo color mixing process"}],
-                    red_fraction=printout_dict["red_fraction"][0],
-                    green_fraction=printout_dict["green_fraction"][0],
-                    blue_fraction=printout_dict["blue_fraction"][0],
-                    name=fullpagename)
-
-
-                rgb_value = RGBValue(red_value=printout_dict["red_value"][0],
-                                        green_value=printout_dict["green_value"][0],
-                                        blue_value=printout_dict["blue_value"][0],
-                                        name=f"{fullpagename}/HasOutput.HasColor")
-                self.processes.append(process)
-                self.rgb_values.append(rgb_value)
-
-            except Exception as e:
-                print(f"Error processing {fullpagename}: {e}")
+    def refresh(self):
+        """Fetches new experiments in the background, the visualization is updated if there are any."""
+        if self.osw_obj is not None:
+            self.repository.refresh_in_background()
 
     def update_visualization(self):
-        """Updates the visualization panel with the current processes and RGB values."""
+        """Rebuilds the figure from the current dataset, this sends the whole figure to every browser."""
 
         self.get_inputs_outputs()
-
-        self.fig = px.scatter_3d(x=[process.red_fraction for process in self.processes],
-                                 y=[process.green_fraction for process in self.processes],
-                                 z=[process.blue_fraction for process in self.processes],
-                                 color = [f"rgb({int(rgb_value.red_value)}, {int(rgb_value.green_value)},"
-                                          f" {int(rgb_value.blue_value)}) {i}" for
-                                          i,rgb_value in enumerate(self.rgb_values)], # i added index to color to avoid duplicates
-                                 color_discrete_sequence = [f"rgb({int(rgb_value.red_value)}, {int(rgb_value.green_value)},"
-                                          f" {int(rgb_value.blue_value)})" for
-                                          rgb_value in self.rgb_values],
-                                 labels = [str(i) for i in range(len(self.processes))],
-                            )
+        if self.render_mode_select.value == "single trace":
+            self.fig = self.single_trace_figure()
+        else:
+            self.fig = self.per_experiment_figure()
+        self.shown_dataset = self.dataset
+        self.appended_points = 0
+        self.visualization_panel.object = self.fig
+        self.update_count()
+
+    def dataset_changed(self, dataset: ExperimentDataset):
+        """
+        Pushes only the new experiments and the pending layer to the figure if experiments were appended
+        to the shown dataset: the new ones become a trace of their own, the existing traces and the layout
+        stay as they are, so the browsers only receive the new points. Otherwise, or once the appended points
+        exceed a tenth of max. points, the figure is rebuilt (and downsampled) as a whole.
+        """
+        shown = self.shown_dataset
+        if (self.render_mode_select.value != "single trace" or shown is None or len(dataset) < len(shown)
+                or dataset.pages[:len(shown)] != shown.pages
+                or len(self.traces) - 2 >= MAX_APPENDED_TRACES
+                or self.appended_points + len(dataset) - len(shown) > self.max_points_input.value // 10):
+            self.update_visualization()
+            return
+        self.dataset = dataset
+        if len(dataset) > len(shown):
+            new = slice(len(shown), len(dataset))
+            self.traces.append(self._experiment_trace(dataset.fractions[new], dataset.rgb[new]))
+            self.appended_points += new.stop - new.start
+        self.traces[1] = self._pending_trace(dataset)
+        self.shown_dataset = dataset
+        # the pane takes the arrays out of the figure it gets, so every update gets a new one
+        self.fig = go.Figure(data=self.traces, layout=self.layout)
+        self.visualization_panel.object = self.fig
+        self.update_count()
+
+    def update_count(self):
+        if self.render_mode_select.value != "single trace":
+            self.count_markdown.object = f"{len(self.dataset)} experiments"
+            return
+        shown = sum(len(trace["x"]) for trace in self.traces if trace.get("name") != "pending")
+        self.count_markdown.object = (f"{shown} of {len(self.dataset)} experiments shown, "
+                                      f"{len(self.dataset.pending_pages)} pending")
+
+    @staticmethod
+    def _experiment_trace(fractions: np.ndarray, rgb: np.ndarray) -> dict:
+        # rounding keeps the json small, a thousandth is below what can be seen in the plot
+        fractions = np.round(fractions, 3)
+        return dict(type="scatter3d", x=fractions[:, 0], y=fractions[:, 1], z=fractions[:, 2],
+                    mode="markers", showlegend=False,
+                    marker=dict(color=palette_indices(rgb), coloraxis="coloraxis", size=3),
+                    # the exact measured color for the hover, as bytes instead of strings
+                    customdata=np.round(rgb).astype(np.uint8),
+                    hovertemplate=HOVER_TEMPLATE)
+
+    @staticmethod
+    def _pending_trace(dataset: ExperimentDataset) -> dict:
+        # planned experiments as their own layer, it changes without touching the measured ones
+        fractions = np.round(dataset.pending_fractions, 3)
+        return dict(type="scatter3d", name="pending", x=fractions[:, 0], y=fractions[:, 1], z=fractions[:, 2],
+                    mode="markers", showlegend=False,
+                    marker=dict(color="black", size=6, symbol="diamond"),
+                    hovertemplate="pending<br>red: %{x}<br>green: %{y}<br>blue: %{z}<extra></extra>")
+
+    def single_trace_figure(self) -> go.Figure:
+        """All experiments as one trace with a color per point, downsampled to max. points."""
+        indices = downsample_indices(self.dataset.fractions, self.max_points_input.value)
+        self.traces = [self._experiment_trace(self.dataset.fractions[indices], self.dataset.rgb[indices]),
+                       self._pending_trace(self.dataset)]
+        self.layout = dict(coloraxis=palette_coloraxis(),
+                           # keep the camera when the data is updated
+                           uirevision="experiments",
+                           scene=dict(xaxis=dict(title="red fraction", range=[0, 1]),
+                                      yaxis=dict(title="green fraction", range=[0, 1]),
+                                      zaxis=dict(title="blue fraction", range=[0, 1])))
+        return go.Figure(data=self.traces, layout=self.layout)
+
+    def per_experiment_figure(self) -> go.Figure:
+        """One trace per experiment, only usable for a few thousand experiments."""
+        # plotly.express loads pandas, only this view needs it
+        import plotly.express as px
+
+        self.processes = self.dataset.processes()
+        self.rgb_values = self.dataset.rgb_values()
+        fig = px.scatter_3d(x=[process.red_fraction for process in self.processes],
+                            y=[process.green_fraction for process in self.processes],
+                            z=[process.blue_fraction for process in self.processes],
+                            color = [f"rgb({int(rgb_value.red_value)}, {int(rgb_value.green_value)},"
+                                     f" {int(rgb_value.blue_value)}) {i}" for
+                                     i,rgb_value in enumerate(self.rgb_values)], # i added index to color to avoid duplicates
+                            color_discrete_sequence = [f"rgb({int(rgb_value.red_value)}, {int(rgb_value.green_value)},"
+                                     f" {int(rgb_value.blue_value)})" for
+                                     rgb_value in self.rgb_values],
+                            labels = [str(i) for i in range(len(self.processes))],
+                       )
 
         #TODO: add planned experiments as black thick dots!
         #TODO: make dots clickable
 
-        self.fig.update_layout(showlegend=False,
+        fig.update_layout(showlegend=False,
                           scene=dict(xaxis_title="red fraction",
                                      yaxis_title="green fraction",
                                      zaxis_title="blue fraction"))
-
-        old_panel = self.visualization_panel
-
-        self.visualization_panel = pn.pane.Plotly(self.fig,
-                                     #**widget_args,
-                                    )
-        self.visualization_col.remove(old_panel)
-        self.visualization_col.append(self.visualization_panel)  # Add the new visualization panel
+        return fig
 
 
     def update_visualization_callback(self,event):
         self.update_visualization()
+        self.refresh()
 
 
 
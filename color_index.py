@@ -0,0 +1,99 @@
+### nearest-experiment search over the measured colors of the finished experiments
+import time
+from typing import Dict, List
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from color_metrics import rate_colors, srgb_to_lab
+from experiment_cache import ExperimentDataset
+
+
+class ColorIndex:
+    """
+    KD-trees over the measured colors of an ExperimentDataset, so the experiments closest to a target color are
+    found without rating all of them. The RGB tree is searched with the Manhattan distance, which orders like the
+    l1 rating, the CIELAB tree with the euclidean distance, which is ΔE76. ΔE2000 has no tree of its own: the
+    closest experiments in CIELAB are re-ranked with it.
+    Like the dataset, an index is never changed. An index for a dataset that only appended experiments to the
+    previous one reuses its trees and searches the appended experiments brute force, until there are more than
+    rebuild_threshold of them.
+    """
+
+    def __init__(self, dataset: ExperimentDataset, previous: "ColorIndex" = None, rebuild_threshold: int = 256):
+        self.dataset = dataset
+        self.rebuild_threshold = rebuild_threshold
+        if previous is not None and self._extends(previous):
+            self._rgb_tree, self._lab_tree = previous._rgb_tree, previous._lab_tree
+            self.tree_size = previous.tree_size
+        else:
+            self.tree_size = len(dataset)
+            self._rgb_tree = cKDTree(dataset.rgb) if self.tree_size else None
+            self._lab_tree = cKDTree(srgb_to_lab(dataset.rgb)) if self.tree_size else None
+
+    def _extends(self, previous: "ColorIndex") -> bool:
+        size = previous.tree_size
+        return (size > 0 and size <= len(self.dataset) <= size + self.rebuild_threshold
+                and self.dataset.pages[:size] == previous.dataset.pages[:size])
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def nearest(self, target_rgb, k: int = 5, metric: str = "l1") -> List[Dict]:
+        """
+        Finds the finished experiments whose measured color is closest to the target.
+
+        Args:
+            target_rgb: red/green/blue values (0-255) of the target
+            k: number of experiments
+            metric: rating metric, one of the values of color_metrics.METRICS
+
+        Returns:
+            list: up to k dicts with page, fractions, rgb and rating, best first
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        target_rgb = np.asarray(target_rgb, dtype=float).reshape(3)
+        candidates = self._tree_candidates(target_rgb, k, metric)
+        # appended experiments are few, they are candidates as well
+        candidates = np.concatenate([candidates, np.arange(self.tree_size, len(self))])
+        ratings = rate_colors(self.dataset.rgb[candidates], target_rgb, metric=metric)
+        order = np.argsort(ratings, kind="stable")[:k]
+        return [dict(page=self.dataset.pages[i], fractions=self.dataset.fractions[i], rgb=self.dataset.rgb[i],
+                     rating=float(rating))
+                for i, rating in zip(candidates[order].tolist(), ratings[order].tolist())]
+
+    def _tree_candidates(self, target_rgb: np.ndarray, k: int, metric: str) -> np.ndarray:
+        k = min(k, self.tree_size)
+        if k == 0:
+            return np.zeros(0, dtype=int)
+        if metric == "l1":
+            _, indices = self._rgb_tree.query(target_rgb, k=k, p=1)
+        elif metric == "delta_e76":
+            _, indices = self._lab_tree.query(srgb_to_lab(target_rgb)[0], k=k)
+        else:
+            # ΔE76 and ΔE2000 mostly agree on what is close, more candidates cover the rest (not guaranteed,
+            # but no miss among the top 5 for 300 random targets in 100k random colors)
+            _, indices = self._lab_tree.query(srgb_to_lab(target_rgb)[0], k=min(8 * k + 32, self.tree_size))
+        return np.atleast_1d(indices)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n = 100000
+    dataset = ExperimentDataset(pages=[f"Item:OSW{i}" for i in range(n)],
+                                fractions=rng.dirichlet(np.ones(4), size=n)[:, :3],
+                                rgb=rng.uniform(0, 255, size=(n, 3)))
+    start = time.perf_counter()
+    index = ColorIndex(dataset)
+    print(f"built index over {n} experiments in {(time.perf_counter() - start) * 1000:.1f} ms")
+    targets = rng.uniform(0, 255, size=(1000, 3))
+    for metric in ["l1", "delta_e76", "delta_e2000"]:
+        start = time.perf_counter()
+        for target in targets:
+            result = index.nearest(target, k=5, metric=metric)
+        per_query = (time.perf_counter() - start) / len(targets) * 1000
+        brute_force = rate_colors(dataset.rgb, targets[-1], metric=metric).min()
+        print(f"{metric}: {per_query:.3f} ms per query, best {result[0]['rating']:.4f} "
+              f"(brute force {brute_force:.4f})")
@@ -0,0 +1,125 @@
+### vectorized color difference metrics for rating measured colors against a target color
+import numpy as np
+
+# metrics that can be selected for rating, label: name
+METRICS = {
+    "L1 (RGB)": "l1",
+    "ΔE76 (CIELAB)": "delta_e76",
+    "ΔE2000 (CIELAB)": "delta_e2000",
+}
+
+# sRGB (D65) -> CIE XYZ
+_RGB_TO_XYZ = np.array([[0.4124564, 0.3575761, 0.1804375],
+                        [0.2126729, 0.7151522, 0.0721750],
+                        [0.0193339, 0.1191920, 0.9503041]])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+
+def _as_colors(colors) -> np.ndarray:
+    return np.asarray(colors, dtype=float).reshape(-1, 3)
+
+
+def srgb_to_linear(rgb) -> np.ndarray:
+    """Converts sRGB values (0-255) to linear RGB (0-1), exact also for values between integers."""
+    scaled = np.clip(rgb, 0, 255) / 255
+    return np.where(scaled <= 0.04045, scaled / 12.92, ((scaled + 0.055) / 1.055) ** 2.4)
+
+
+def srgb_to_lab(rgb) -> np.ndarray:
+    """
+    Converts sRGB colors to CIELAB (D65).
+
+    Args:
+        rgb: array-like of shape (N, 3) with red/green/blue values (0-255)
+
+    Returns:
+        np.ndarray: array of shape (N, 3) with L*, a*, b*
+    """
+    xyz = srgb_to_linear(_as_colors(rgb)) @ _RGB_TO_XYZ.T / _WHITE_D65
+    delta = 6 / 29
+    f = np.where(xyz > delta ** 3, np.cbrt(xyz), xyz / (3 * delta ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16,
+                     500 * (f[:, 0] - f[:, 1]),
+                     200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def l1_rating(measured_rgb, target_rgb) -> np.ndarray:
+    """Sum of absolute RGB differences, normalized to 0-1. Lower is better."""
+    max_error = 3 * 255
+    return np.abs(_as_colors(measured_rgb) - _as_colors(target_rgb)).sum(axis=1) / max_error
+
+
+def delta_e76(measured_rgb, target_rgb) -> np.ndarray:
+    """CIE 1976 color difference (euclidean distance in CIELAB). Lower is better."""
+    return np.linalg.norm(srgb_to_lab(measured_rgb) - srgb_to_lab(target_rgb), axis=1)
+
+
+def delta_e2000_lab(lab_1, lab_2) -> np.ndarray:
+    """CIEDE2000 color difference between CIELAB colors."""
+    lab_1, lab_2 = _as_colors(lab_1), _as_colors(lab_2)
+    L1, a1, b1 = lab_1[:, 0], lab_1[:, 1], lab_1[:, 2]
+    L2, a2, b2 = lab_2[:, 0], lab_2[:, 1], lab_2[:, 2]
+
+    c_mean_7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(c_mean_7 / (c_mean_7 + 25 ** 7)))
+    a1_p, a2_p = (1 + g) * a1, (1 + g) * a2
+    c1_p, c2_p = np.hypot(a1_p, b1), np.hypot(a2_p, b2)
+    h1_p = np.degrees(np.arctan2(b1, a1_p)) % 360
+    h2_p = np.degrees(np.arctan2(b2, a2_p)) % 360
+    chroma_zero = c1_p * c2_p == 0
+
+    delta_L_p = L2 - L1
+    delta_C_p = c2_p - c1_p
+    delta_h_p = h2_p - h1_p
+    delta_h_p = np.where(delta_h_p > 180, delta_h_p - 360, np.where(delta_h_p < -180, delta_h_p + 360, delta_h_p))
+    delta_h_p = np.where(chroma_zero, 0, delta_h_p)
+    delta_H_p = 2 * np.sqrt(c1_p * c2_p) * np.sin(np.radians(delta_h_p / 2))
+
+    L_mean_p = (L1 + L2) / 2
+    c_mean_p = (c1_p + c2_p) / 2
+    h_sum = h1_p + h2_p
+    h_mean_p = np.where(np.abs(h1_p - h2_p) <= 180, h_sum / 2,
+                        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    h_mean_p = np.where(chroma_zero, h_sum, h_mean_p)
+
+    t = (1 - 0.17 * np.cos(np.radians(h_mean_p - 30)) + 0.24 * np.cos(np.radians(2 * h_mean_p))
+         + 0.32 * np.cos(np.radians(3 * h_mean_p + 6)) - 0.20 * np.cos(np.radians(4 * h_mean_p - 63)))
+    delta_theta = 30 * np.exp(-((h_mean_p - 275) / 25) ** 2)
+    c_mean_p_7 = c_mean_p ** 7
+    r_c = 2 * np.sqrt(c_mean_p_7 / (c_mean_p_7 + 25 ** 7))
+    s_l = 1 + 0.015 * (L_mean_p - 50) ** 2 / np.sqrt(20 + (L_mean_p - 50) ** 2)
+    s_c = 1 + 0.045 * c_mean_p
+    s_h = 1 + 0.015 * c_mean_p * t
+    r_t = -np.sin(np.radians(2 * delta_theta)) * r_c
+
+    return np.sqrt((delta_L_p / s_l) ** 2 + (delta_C_p / s_c) ** 2 + (delta_H_p / s_h) ** 2
+                   + r_t * (delta_C_p / s_c) * (delta_H_p / s_h))
+
+
+def delta_e2000(measured_rgb, target_rgb) -> np.ndarray:
+    """CIEDE2000 color difference of sRGB colors. Lower is better."""
+    return delta_e2000_lab(srgb_to_lab(measured_rgb), srgb_to_lab(target_rgb))
+
+
+_METRIC_FUNCTIONS = {
+    "l1": l1_rating,
+    "delta_e76": delta_e76,
+    "delta_e2000": delta_e2000,
+}
+
+
+def rate_colors(measured_rgb, target_rgb, metric: str = "l1") -> np.ndarray:
+    """
+    Rates measured colors against a target color. Lower is better.
+
+    Args:
+        measured_rgb: array-like of shape (N, 3) with red/green/blue values (0-255)
+        target_rgb: array-like with the red/green/blue values of the target, shape (3,) or (N, 3)
+        metric: one of the values of METRICS
+
+    Returns:
+        np.ndarray: N ratings
+    """
+    if metric not in _METRIC_FUNCTIONS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {list(_METRIC_FUNCTIONS)}")
+    return _METRIC_FUNCTIONS[metric](measured_rgb, target_rgb)
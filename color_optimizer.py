@@ -0,0 +1,235 @@
+### long-lived Ax experiment for finding the mixing ratio of a target color
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import metrics
+
+# Ax loads torch and BoTorch, which takes seconds and hundreds of MB. It is imported on first use, so importing
+# this module (e.g. for PARAMETER_NAMES) stays cheap.
+if TYPE_CHECKING:
+    from ax.modelbridge.generation_strategy import GenerationStrategy
+    from ax.service.ax_client import AxClient
+
+PARAMETERS = [
+    {"name": "red_fraction", "type": "range", "bounds": [0.0, 1.0]},
+    {"name": "green_fraction", "type": "range", "bounds": [0.0, 1.0]},
+    {"name": "blue_fraction", "type": "range", "bounds": [0.0, 1.0]},
+]
+PARAMETER_NAMES = [parameter["name"] for parameter in PARAMETERS]
+PARAMETER_CONSTRAINTS = ["red_fraction + green_fraction + blue_fraction <= 1.0"]
+
+STEP_SECONDS = metrics.histogram("optimizer_step_seconds", "Duration of attaching trials, fitting and generation.")
+ATTACHED_TRIALS = metrics.counter("optimizer_attached_trials_total", "Experiments attached as completed trials.")
+ATTACH_ERRORS = metrics.counter("optimizer_attach_errors_total", "Experiments that could not be attached.")
+
+
+def preload():
+    """Imports Ax, e.g. from a background thread after startup, so the first suggestion request does not wait."""
+    start = time.perf_counter()
+    from ax.modelbridge.factory import Models  # noqa: F401
+    from ax.service.ax_client import AxClient  # noqa: F401
+    print(f"Loaded Ax in {time.perf_counter() - start:.1f} s.")
+
+
+def build_generation_strategy(max_parallelism: int = 3) -> "GenerationStrategy":
+    from ax.modelbridge.factory import Models
+    from ax.modelbridge.generation_strategy import GenerationStep, GenerationStrategy
+
+    return GenerationStrategy(
+        steps=[
+            # GenerationStep(
+            #     model=Models.SOBOL,
+            #     num_trials=4,  # how many sobol trials to perform (rule of thumb: 2 * number of params)
+            #     min_trials_observed=3,
+            #     max_parallelism=5,
+            #     model_kwargs={"seed": 999},
+            # ),
+            GenerationStep(
+                #model=Models.SAASBO, #a bit slow
+                model=Models.BOTORCH_MODULAR,
+                num_trials=-1,
+                max_parallelism=max_parallelism,
+                # start refits from the hyperparameters of the previous fit
+                model_kwargs={"warm_start_refit": True},
+            ),
+        ]
+    )
+
+
+def create_ax_client(generation_strategy: "GenerationStrategy" = None, random_seed: int = None,
+                     verbose_logging: bool = True) -> "AxClient":
+    """Creates an AxClient with the color mixing experiment."""
+    from ax.service.ax_client import AxClient, ObjectiveProperties
+
+    ax_client = AxClient(generation_strategy=generation_strategy, random_seed=random_seed,
+                         verbose_logging=verbose_logging)
+    ax_client.create_experiment(
+        name="color_mixing_simulation",
+        parameters=PARAMETERS,
+        objectives={
+            "rating": ObjectiveProperties(minimize=True),
+        },
+        parameter_constraints=PARAMETER_CONSTRAINTS,
+    )
+    return ax_client
+
+
+class IncrementalColorOptimizer:
+    """
+    Keeps one Ax experiment alive across suggestion requests for the same target.
+    Experiments are attached once, keyed by their process page name, so a request after one new experiment
+    attaches one trial. The generation strategy keeps its fitted model between requests, and Ax only refits
+    it when new data arrived, starting from the previous hyperparameters.
+    Ratings depend on the target, so a new target (or rating) starts a new experiment.
+    """
+
+    def __init__(self, max_parallelism: int = 3):
+        self.max_parallelism = max_parallelism
+        self.target_key = None
+        self.ax_client: "AxClient" = None
+        self.trial_index_by_page: Dict[str, int] = {}
+        self.skipped_pages = set()
+        # generated trials that were not handed in (yet), page of the handed in trials
+        self.generated_trials: List[int] = []
+        self.handed_in_trials: Dict[str, int] = {}
+        self.seed_candidate: Optional[Dict] = None
+        self.timings: Dict[str, float] = {}
+
+    def set_target(self, target_key) -> bool:
+        """
+        Selects the target the ratings refer to.
+
+        Returns:
+            bool: True if a new experiment was started
+        """
+        if self.ax_client is not None and target_key == self.target_key:
+            return False
+        self.target_key = target_key
+        self.ax_client = create_ax_client(build_generation_strategy(self.max_parallelism))
+        self.trial_index_by_page = {}
+        self.skipped_pages = set()
+        self.generated_trials = []
+        self.handed_in_trials = {}
+        self.seed_candidate = None
+        return True
+
+    def set_seed_candidate(self, parameters: Dict):
+        """
+        Sets a candidate that is suggested before any generated one, e.g. the analytic solution for the target
+        in the simulator. It is suggested again until it was handed in.
+        """
+        self.seed_candidate = parameters
+
+    def unseen_pages(self, pages: List[str]) -> List[int]:
+        """Returns the indices of pages that are not attached yet."""
+        return [i for i, page in enumerate(pages)
+                if page not in self.trial_index_by_page and page not in self.skipped_pages]
+
+    def attach(self, pages: List[str], fractions, ratings) -> int:
+        """
+        Attaches finished experiments that are not part of the experiment yet.
+        Experiments that were suggested by this optimizer complete their own trial instead.
+
+        Args:
+            pages: process page names
+            fractions: (N, 3) red/green/blue fractions
+            ratings: N ratings
+
+        Returns:
+            int: number of attached trials
+        """
+        start = time.perf_counter()
+        attached = 0
+        for page, (red_fraction, green_fraction, blue_fraction), rating in zip(pages, fractions, ratings):
+            if page in self.trial_index_by_page or page in self.skipped_pages:
+                continue
+            try:
+                if page in self.handed_in_trials:
+                    trial_index = self.handed_in_trials.pop(page)
+                else:
+                    _, trial_index = self.ax_client.attach_trial(parameters={"red_fraction": float(red_fraction),
+                                                                             "green_fraction": float(green_fraction),
+                                                                             "blue_fraction": float(blue_fraction)},
+                                                                 run_metadata={"page": page})
+                self.ax_client.complete_trial(trial_index=trial_index, raw_data={"rating": float(rating)})
+            except Exception as e:
+                print(f"Error attaching {page}: {e}")
+                ATTACH_ERRORS.inc()
+                self.skipped_pages.add(page)
+                continue
+            self.trial_index_by_page[page] = trial_index
+            attached += 1
+        self.timings["attach"] = time.perf_counter() - start
+        STEP_SECONDS.observe(self.timings["attach"], step="attach")
+        ATTACHED_TRIALS.inc(attached)
+        return attached
+
+    def abandon_generated_trials(self):
+        """Abandons generated trials that were not handed in, so they stop counting as running."""
+        for trial_index in self.generated_trials:
+            self.ax_client.abandon_trial(trial_index=trial_index, reason="not handed in")
+        self.generated_trials = []
+
+    def fit(self):
+        start = time.perf_counter()
+        # without data there is nothing to fit, the seed candidate can still be suggested
+        if self.trial_index_by_page:
+            self.ax_client.fit_model()
+        self.timings["fit"] = time.perf_counter() - start
+        STEP_SECONDS.observe(self.timings["fit"], step="fit")
+
+    def generate(self, n: int = 1) -> Dict[int, Dict]:
+        """
+        Generates up to n suggestions, each with the ones before as pending points.
+        n is limited by max_parallelism minus the trials that are handed in but not finished yet.
+        Every suggestion becomes its own trial, so results can complete them one by one.
+
+        Args:
+            n: number of suggestions
+
+        Returns:
+            dict: parametrization by trial index
+        """
+        from ax.exceptions.generation_strategy import MaxParallelismReachedException
+
+        self.abandon_generated_trials()
+        start = time.perf_counter()
+        limit, _ = self.ax_client.get_current_trial_generation_limit()
+        if limit == 0:
+            raise MaxParallelismReachedException(model_name=self.ax_client.generation_strategy.name,
+                                                 num_running=self.max_parallelism)
+        if limit > 0:
+            n = min(n, limit)
+        suggestions = {}
+        if self.seed_candidate is not None:
+            parameters, trial_index = self.ax_client.attach_trial(parameters=self.seed_candidate,
+                                                                  run_metadata={"seed_candidate": True})
+            self.generated_trials.append(trial_index)
+            suggestions[trial_index] = parameters
+            n -= 1
+        # the model needs data, without it the seed candidate is the only suggestion
+        if n > 0 and not (suggestions and not self.trial_index_by_page):
+            # one trial per arm, generated by the generation strategy, so they count against max_parallelism
+            trials, _ = self.ax_client.get_next_trials(max_trials=n)
+            self.generated_trials += list(trials)
+            suggestions.update(trials)
+        self.timings["generate"] = time.perf_counter() - start
+        STEP_SECONDS.observe(self.timings["generate"], step="generate")
+        return suggestions
+
+    def hand_in(self, trial_index: int, page: str):
+        """Remembers that a generated trial was handed in as page, so its result completes the trial."""
+        if trial_index in self.generated_trials:
+            self.generated_trials.remove(trial_index)
+        self.handed_in_trials[page] = trial_index
+        if self.ax_client.get_trial(trial_index).run_metadata.get("seed_candidate"):
+            self.seed_candidate = None
+
+    def observed_fractions(self) -> List[List[float]]:
+        """Fractions of the completed trials, the data of the model."""
+        return [[trial.arm.parameters[name] for name in PARAMETER_NAMES]
+                for trial in self.ax_client.experiment.trials.values() if trial.status.is_completed]
+
+    def best_tried_parameters(self) -> Optional[Dict]:
+        best = self.ax_client.get_best_parameters(use_model_predictions=False)
+        return best[0] if best is not None else None
@@ -1,41 +1,194 @@
 ## script to clear the pseudo_color_mixing database
 
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Iterator, List, Set
+
 from osw.core import OSW
 from osw.express import OswExpress
 from osw.core import WtSite
 
-if __name__ == "__main__":
-    osw_obj = OswExpress(# domain="demo.open-semantic-lab.org"
-            # domain = "mat-o-lab.open-semantic-lab.org",
-            domain="wiki-dev.open-semantic-lab.org"
-    )
+PSEUDO_COLOR_MIXING_QUERY = "[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]]"  # PseudoColorMixing
+# PseudoColoredLiquid, with the beaker images that are deleted together with the liquids
+PSEUDO_COLORED_LIQUID_QUERY = "[[Category:OSW50daf688f7694863a0e319a0a978079f]]|?HasImage=image_id"
+
+
+class PurgeJournal:
+    """
+    Append-only files of deleted and of failed titles. A purge that is started again skips the deleted ones, even if
+    the query index still lists them for a while, and retries the failed ones first: images are only found through
+    their liquid, so a failed image would not be found again once its liquid is deleted.
+    """
+
+    def __init__(self, path: str = "purge_journal.txt"):
+        self.path = path
+        self.failed_path = path + ".failed"
+        self.titles = self._read(self.path)
+        self.failed_titles = self._read(self.failed_path) - self.titles
+        self._lock = Lock()
+
+    @staticmethod
+    def _read(path: str) -> Set[str]:
+        if not os.path.exists(path):
+            return set()
+        with open(path, encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def _append(self, path: str, titles: List[str]):
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(f"{title}\n" for title in titles)
+
+    def add(self, titles: List[str]):
+        with self._lock:
+            self._append(self.path, titles)
+            self.titles.update(titles)
 
+    def add_failed(self, titles: List[str]):
+        with self._lock:
+            self._append(self.failed_path, titles)
 
-    pseudo_color_mixing_ids = osw_obj.site.semantic_search("[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]]") ##
-    # PseudoColorMixing
-    pseudo_colored_liquid_ids = osw_obj.site.semantic_search("[[Category:OSW50daf688f7694863a0e319a0a978079f]]")
-    ###PseudoColoredLiquid
+    def remove(self):
+        """Removes the journal after a complete purge."""
+        for path in (self.path, self.failed_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-    ## query for all PseudoColoredLiquid instances to get their images
-    query = """[[Category:OSW50daf688f7694863a0e319a0a978079f]]
-        |?HasImage=image_id"""
-    res = osw_obj.mw_site.api("ask", query=query, format="json", limit=1000)
-    print(res)
 
-    res_dict = res["query"]["results"]
-    image_ids = []
-    for liquid_id, sub_dict in res_dict.items():
-        for image_id_dict in sub_dict["printouts"]["image_id"]:
-            image_ids.append(image_id_dict["fulltext"])
+class BulkPurge:
+    """
+    Deletes pages by title without loading them. Titles are streamed through paginated ask queries, each result page
+    is deleted in chunks of chunk_size titles on a pool of workers threads before the next page is queried.
+    Deleted pages drop out of the query result, so the query is repeated at the same offset until a result page
+    only has pages that stay (failed or skipped ones), instead of paging through a result that shrinks.
+    A dry run pages through the result.
+    """
 
-    print("image_ids", image_ids)
+    def __init__(self, osw_obj: OSW, chunk_size: int = 50, workers: int = 8, page_size: int = 500,
+                 dry_run: bool = False, journal: PurgeJournal = None, max_failures: int = 1000):
+        self.osw_obj = osw_obj
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.journal = journal if journal is not None else PurgeJournal()
+        self.max_failures = max_failures
+        self.found = 0
+        self.deleted = 0
+        self.failed: Set[str] = set()
+        self.started = None
+        self._lock = Lock()
 
-    ## delete all items and ids:
-    delete_ids = image_ids + pseudo_color_mixing_ids + pseudo_colored_liquid_ids
+    def iter_result_pages(self, query: str) -> Iterator[Dict[str, dict]]:
+        """Yields the results (title: printouts) of the query page by page, without titles deleted before."""
+        offset = 0
+        while True:
+            res = self.osw_obj.mw_site.api("ask", query=f"{query}|limit={self.page_size}|offset={offset}",
+                                           format="json")
+            # an empty result is an empty list
+            results = res["query"]["results"] or {}
+            new = {title: result.get("printouts", {}) for title, result in results.items()
+                   if title not in self.journal.titles and title not in self.failed}
+            if new:
+                yield new
+            # deleted titles drop out of the result, so the same offset is queried again. Every title before the
+            # offset is one that stays (failed, or deleted but still listed by the query index).
+            if self.dry_run or not new:
+                if "query-continue-offset" not in res:
+                    return
+                offset = res["query-continue-offset"]
 
-    delete_entities_download = osw_obj.load_entity(OSW.LoadEntityParam(titles = delete_ids))
+    def delete_chunk(self, titles: List[str]):
+        try:
+            results = self.osw_obj.site.delete_page(WtSite.DeletePageParam(
+                page=titles, comment="purge of pseudo color mixing", parallel=False, debug=False))
+        except Exception as e:
+            print(f"Error deleting {len(titles)} pages starting with {titles[0]}: {e}")
+            results = []
+        # delete_page warns about a page it could not delete and returns None for it instead of raising
+        results = results or []
+        failed = [title for i, title in enumerate(titles) if i >= len(results) or results[i] is None]
+        deleted = [title for i, title in enumerate(titles) if i < len(results) and results[i] is not None]
+        if failed:
+            self.journal.add_failed(failed)
+        self.journal.add(deleted)
+        with self._lock:
+            self.failed.update(failed)
+            self.deleted += len(deleted)
 
-    ## delete all entities
-    osw_obj.delete_entity(delete_entities_download.entities)
+    def delete(self, titles: List[str], pool: ThreadPoolExecutor):
+        self.found += len(titles)
+        if self.dry_run:
+            return
+        chunks = [titles[i:i + self.chunk_size] for i in range(0, len(titles), self.chunk_size)]
+        list(pool.map(self.delete_chunk, chunks))
+        if len(self.failed) > self.max_failures:
+            raise RuntimeError(f"{len(self.failed)} pages could not be deleted, run again to resume")
+
+    def report(self, label: str):
+        elapsed = time.perf_counter() - self.started
+        if self.dry_run:
+            print(f"[dry run] {label}: {self.found} pages would be deleted")
+            return
+        print(f"{label}: deleted {self.deleted} of {self.found} found pages, {len(self.failed)} failed, "
+              f"{self.deleted / elapsed if elapsed > 0 else 0.0:.1f} pages/s")
+
+    def run(self) -> int:
+        """
+        Deletes all PseudoColoredLiquid instances with their beaker images, then all PseudoColorMixing instances.
+
+        Returns:
+            int: number of deleted (dry run: found) pages
+        """
+        self.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if self.journal.failed_titles:
+                self.delete(sorted(self.journal.failed_titles), pool)
+                self.report("failed pages of the last run")
+            for result_page in self.iter_result_pages(PSEUDO_COLORED_LIQUID_QUERY):
+                titles = list(result_page)
+                for printouts in result_page.values():
+                    titles += [image["fulltext"] for image in printouts.get("image_id", [])
+                               if image["fulltext"] not in self.journal.titles]
+                self.delete(titles, pool)
+                self.report("liquids and images")
+            for result_page in self.iter_result_pages(PSEUDO_COLOR_MIXING_QUERY):
+                self.delete(list(result_page), pool)
+                self.report("processes")
+        if not self.dry_run and not self.failed:
+            self.journal.remove()
+        return self.found if self.dry_run else self.deleted
+
+
+def delete_all_pseudo_color_mixing(osw_obj: OSW, dry_run: bool = False, **kwargs) -> int:
+    """Deletes all PseudoColorMixing and PseudoColoredLiquid instances and the beaker images of the liquids."""
+    return BulkPurge(osw_obj, dry_run=dry_run, **kwargs).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deletes all pseudo color mixing processes, liquids and images.")
+    parser.add_argument("--dry-run", action="store_true", help="only count the pages that would be deleted")
+    parser.add_argument("--chunk-size", type=int, default=50, help="pages per delete call")
+    parser.add_argument("--workers", type=int, default=8, help="parallel delete calls")
+    parser.add_argument("--page-size", type=int, default=500, help="titles per ask query")
+    parser.add_argument("--journal", default="purge_journal.txt",
+                        help="file of deleted titles, a purge started again resumes from it")
+    parser.add_argument("--fake", type=int, default=None, metavar="N",
+                        help="purge an in-process fake wiki with N synthetic experiments (testing)")
+    args = parser.parse_args()
 
-    print("done")
\ No newline at end of file
+    if args.fake is not None:
+        from fake_osw import FakeOSW
+        osw_obj = FakeOSW.create(latency=0.0)
+        osw_obj.populate(args.fake)
+    else:
+        osw_obj = OswExpress(# domain="demo.open-semantic-lab.org"
+                # domain = "mat-o-lab.open-semantic-lab.org",
+                domain="wiki-dev.open-semantic-lab.org"
+        )
+    delete_all_pseudo_color_mixing(osw_obj, dry_run=args.dry_run, chunk_size=args.chunk_size,
+                                   workers=args.workers, page_size=args.page_size,
+                                   journal=PurgeJournal(args.journal))
+    print("done")
@@ -0,0 +1,248 @@
+### local sqlite cache of all PseudoColorMixing experiments, synced incrementally from the wiki
+import sqlite3
+import time
+from datetime import datetime, timezone
+from threading import Lock, Thread
+from typing import Callable, List
+
+import numpy as np
+
+from osw.model.entity import RGBValue, PseudoColorMixing
+import metrics
+
+PSEUDO_COLOR_MIXING_CATEGORY = "Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211"
+
+ASK_SECONDS = metrics.histogram("smw_ask_seconds", "Duration of semantic mediawiki queries.")
+ASK_ERRORS = metrics.counter("smw_ask_errors_total", "Failed semantic mediawiki queries.")
+SYNCED_ROWS = metrics.counter("experiment_cache_synced_rows_total", "Experiments fetched by incremental syncs.")
+
+EXPERIMENT_PRINTOUTS = """
+               |?ShallBeExecuted=execute
+               |?HasRedMixtureFraction=red_fraction
+               |?HasGreenMixtureFraction=green_fraction
+               |?HasBlueMixtureFraction=blue_fraction
+               |?HasOutput.HasColor.HasRedValue=red_value
+               |?HasOutput.HasColor.HasGreenValue=green_value
+               |?HasOutput.HasColor.HasBlueValue=blue_value
+               |?Modification date=modified"""
+
+_TRUE_VALUES = (True, "t", "true", "1", 1)
+
+
+def _first(printout_dict, key, default=None):
+    values = printout_dict.get(key) or []
+    return values[0] if values else default
+
+
+def parse_experiment_results(res_dict) -> List[tuple]:
+    """
+    Converts the results of an ask query with EXPERIMENT_PRINTOUTS to rows of
+    (page, execute, red_fraction, green_fraction, blue_fraction, red_value, green_value, blue_value, modified).
+    Color values are None for experiments that were not executed yet.
+    """
+    rows = []
+    if not res_dict:
+        # SMW returns an empty list instead of an empty object if nothing matches
+        return rows
+    for fullpagename, process_dict in res_dict.items():
+        printout_dict = process_dict["printouts"]
+        try:
+            modified = _first(printout_dict, "modified")
+            if isinstance(modified, dict):
+                modified = modified.get("timestamp")
+            rgb = [_first(printout_dict, key) for key in ("red_value", "green_value", "blue_value")]
+            if any(value is None for value in rgb):
+                rgb = [None, None, None]
+            else:
+                rgb = [float(value) for value in rgb]
+            rows.append((fullpagename,
+                         int(_first(printout_dict, "execute", False) in _TRUE_VALUES),
+                         float(printout_dict["red_fraction"][0]),
+                         float(printout_dict["green_fraction"][0]),
+                         float(printout_dict["blue_fraction"][0]),
+                         *rgb,
+                         float(modified) if modified is not None else 0.0))
+        except Exception as e:
+            print(f"Error processing {fullpagename}: {e}")
+    return rows
+
+
+class ExperimentDataset:
+    """
+    Snapshot of all experiments as arrays.
+    Finished experiments have a measured color, pending ones are flagged for execution and have none yet.
+    """
+
+    def __init__(self, pages: List[str], fractions: np.ndarray, rgb: np.ndarray,
+                 pending_pages: List[str] = None, pending_fractions: np.ndarray = None):
+        self.pages = pages
+        self.fractions = fractions
+        self.rgb = rgb
+        self.pending_pages = pending_pages or []
+        self.pending_fractions = pending_fractions if pending_fractions is not None else np.zeros((0, 3))
+
+    @classmethod
+    def from_rows(cls, rows) -> "ExperimentDataset":
+        """Builds a dataset from rows in the format of parse_experiment_results."""
+        finished = [row for row in rows if row[5] is not None]
+        pending = [row for row in rows if row[5] is None and row[1]]
+        return cls(pages=[row[0] for row in finished],
+                   fractions=np.array([row[2:5] for row in finished], dtype=float).reshape(-1, 3),
+                   rgb=np.array([row[5:8] for row in finished], dtype=float).reshape(-1, 3),
+                   pending_pages=[row[0] for row in pending],
+                   pending_fractions=np.array([row[2:5] for row in pending], dtype=float).reshape(-1, 3))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def processes(self) -> List[PseudoColorMixing]:
+        """The finished experiments as (temporary) PseudoColorMixing objects."""
+        return [PseudoColorMixing(label=[{"language": "en", "text": "a temporary pseudo color mixing process"}],
+                                  red_fraction=red_fraction,
+                                  green_fraction=green_fraction,
+                                  blue_fraction=blue_fraction,
+                                  name=page)
+                for page, (red_fraction, green_fraction, blue_fraction) in zip(self.pages, self.fractions.tolist())]
+
+    def rgb_values(self) -> List[RGBValue]:
+        """The measured colors of the finished experiments as RGBValue objects."""
+        return [RGBValue(red_value=red_value, green_value=green_value, blue_value=blue_value,
+                         name=f"{page}/HasOutput.HasColor")
+                for page, (red_value, green_value, blue_value) in zip(self.pages, self.rgb.tolist())]
+
+
+class ExperimentCache:
+    """
+    Stores the fractions and measured colors of all PseudoColorMixing processes in a local sqlite file.
+    sync() only asks the wiki for processes modified since the last sync, so its cost scales with the number
+    of new or changed experiments. Deleted processes are only noticed by full_resync().
+    """
+
+    # SMW compares modification dates in seconds, re-fetching a small overlap is cheaper than missing an edit
+    SYNC_OVERLAP = 60
+
+    def __init__(self, path: str = "experiment_cache.sqlite", page_size: int = 500):
+        self.path = path
+        self.page_size = page_size
+        self._sync_lock = Lock()
+        self.thread: Thread = None
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS experiments (
+                                    page TEXT PRIMARY KEY,
+                                    execute INTEGER,
+                                    red_fraction REAL, green_fraction REAL, blue_fraction REAL,
+                                    red_value REAL, green_value REAL, blue_value REAL,
+                                    modified REAL)""")
+            connection.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    ## reading
+
+    def rows(self) -> List[tuple]:
+        with self._connect() as connection:
+            return connection.execute("""SELECT page, execute, red_fraction, green_fraction, blue_fraction,
+                                                red_value, green_value, blue_value, modified
+                                         FROM experiments ORDER BY modified, page""").fetchall()
+
+    def load(self) -> ExperimentDataset:
+        """Returns the cached experiments without contacting the wiki."""
+        return ExperimentDataset.from_rows(self.rows())
+
+    @property
+    def last_sync(self) -> float:
+        """Modification timestamp of the newest synced process, 0 if the cache is empty."""
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM sync_state WHERE key = 'last_modified'").fetchone()
+        return row[0] if row else 0.0
+
+    ## writing
+
+    def upsert(self, rows: List[tuple], advance_sync: bool = True):
+        """
+        Inserts or replaces rows in the format of parse_experiment_results.
+        Rows that did not come from the wiki (e.g. results documented by this process) must not advance the
+        sync state, otherwise changes of other processes in between would be skipped.
+        """
+        if not rows:
+            return
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if not advance_sync:
+                return
+            newest = max(row[8] for row in rows)
+            connection.execute("""INSERT INTO sync_state VALUES ('last_modified', ?)
+                                  ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value)""", (newest,))
+
+    def delete(self, pages: List[str]):
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM experiments WHERE page = ?", [(page,) for page in pages])
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM experiments")
+            connection.execute("DELETE FROM sync_state")
+
+    ## syncing
+
+    def _query(self, since: float) -> str:
+        query = f"[[{PSEUDO_COLOR_MIXING_CATEGORY}]]"
+        if since > 0:
+            since_date = datetime.fromtimestamp(max(since - self.SYNC_OVERLAP, 0), tz=timezone.utc)
+            query += f"[[Modification date::>{since_date.strftime('%Y-%m-%dT%H:%M:%S')}]]"
+        return query + EXPERIMENT_PRINTOUTS + "\n               |sort=Modification date|order=asc"
+
+    def sync(self, osw_obj) -> int:
+        """
+        Fetches processes that were modified since the last sync, page by page.
+        Concurrent calls wait for the running sync instead of querying again.
+
+        Returns:
+            int: number of fetched rows
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            # another thread is syncing, wait for it and use its result
+            with self._sync_lock:
+                return 0
+        try:
+            query = self._query(self.last_sync)
+            offset = 0
+            fetched = 0
+            while offset is not None:
+                with ASK_SECONDS.time(ASK_ERRORS, query="experiments"):
+                    res = osw_obj.mw_site.api("ask", query=f"{query}|limit={self.page_size}|offset={offset}",
+                                              format="json")
+                rows = parse_experiment_results(res["query"]["results"])
+                self.upsert(rows)
+                fetched += len(rows)
+                SYNCED_ROWS.inc(len(rows))
+                offset = res.get("query-continue-offset")
+            return fetched
+        finally:
+            self._sync_lock.release()
+
+    def full_resync(self, osw_obj) -> int:
+        """Drops the cache and fetches all processes again, e.g. after processes were deleted."""
+        with self._sync_lock:
+            self.clear()
+        return self.sync(osw_obj)
+
+    def sync_in_background(self, osw_obj, on_done: Callable[[int], None] = None) -> Thread:
+        """Runs sync() in a thread and calls on_done with the number of fetched rows."""
+        def run():
+            start = time.perf_counter()
+            try:
+                fetched = self.sync(osw_obj)
+            except Exception as e:
+                print("Error syncing experiment cache:", e)
+                return
+            print(f"Synced {fetched} experiments in {time.perf_counter() - start:.2f} s")
+            if on_done is not None:
+                on_done(fetched)
+
+        if self.thread is not None and self.thread.is_alive():
+            return self.thread
+        self.thread = Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
@@ -0,0 +1,177 @@
+### one in-process owner of the experiment dataset, shared by all served panels
+import time
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Callable, List
+
+import numpy as np
+
+from experiment_cache import ExperimentCache, ExperimentDataset
+
+# the index loads scipy, it is built when experiments are first searched
+if TYPE_CHECKING:
+    from color_index import ColorIndex
+
+
+class ExperimentRepository:
+    """
+    Owns the dataset of all PseudoColorMixing experiments for every panel of the process.
+    The dataset is an immutable snapshot that is replaced as a whole, so readers never see a half updated state.
+    get_dataset() refreshes it when it is older than ttl seconds. Concurrent refresh requests are coalesced:
+    one thread syncs the cache while the others wait for its result.
+    """
+
+    def __init__(self, osw_obj=None, experiment_cache: ExperimentCache = None, ttl: float = 30.0):
+        self.osw_obj = osw_obj
+        self.experiment_cache = experiment_cache if experiment_cache is not None else ExperimentCache()
+        self.ttl = ttl
+        self.dataset: ExperimentDataset = self.experiment_cache.load()
+        self._color_index: "ColorIndex" = None
+        self.loaded_at = 0.0  # the cache may be outdated, so the first get_dataset() refreshes
+        self.version = 0
+        self._lock = Lock()
+        self._refresh_done: Event = None
+        self._stop_auto_refresh: Event = None
+        self._listeners: List[Callable[[ExperimentDataset], None]] = []
+
+    ## reading
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    def get_dataset(self, max_age: float = None) -> ExperimentDataset:
+        """Returns the dataset, refreshing it first if it is older than max_age (default: ttl) seconds."""
+        max_age = self.ttl if max_age is None else max_age
+        if self.osw_obj is not None and self.age > max_age:
+            self.refresh()
+        return self.dataset
+
+    def nearest_experiments(self, target_rgb, k: int = 5, metric: str = "l1") -> List[dict]:
+        """The k finished experiments whose measured color is closest to the target, see ColorIndex.nearest."""
+        return self.color_index.nearest(target_rgb, k=k, metric=metric)
+
+    @property
+    def color_index(self) -> "ColorIndex":
+        """The index of the current dataset, built on first use after a change from the index built before."""
+        from color_index import ColorIndex
+
+        with self._lock:
+            dataset, color_index = self.dataset, self._color_index
+        if color_index is None or color_index.dataset is not dataset:
+            color_index = ColorIndex(dataset, previous=color_index)
+            with self._lock:
+                if self.dataset is dataset:
+                    self._color_index = color_index
+        return color_index
+
+    ## refreshing
+
+    def refresh(self) -> ExperimentDataset:
+        """Syncs the cache with the wiki. If a refresh is already running, waits for it instead."""
+        with self._lock:
+            leader = self._refresh_done is None
+            if leader:
+                self._refresh_done = Event()
+            refresh_done = self._refresh_done
+        if not leader:
+            refresh_done.wait()
+            return self.dataset
+
+        try:
+            fetched = self.experiment_cache.sync(self.osw_obj)
+            if fetched > 0 or self.loaded_at == 0.0:
+                # loaded under the lock, so an experiment added meanwhile is either in the cache or added after
+                with self._lock:
+                    dataset = self._set_dataset(self.experiment_cache.load())
+                self._notify(dataset)
+            self.loaded_at = time.monotonic()
+        except Exception as e:
+            print("Error refreshing experiments:", e)
+        finally:
+            with self._lock:
+                self._refresh_done = None
+            refresh_done.set()
+        return self.dataset
+
+    def refresh_in_background(self) -> Thread:
+        thread = Thread(target=self.refresh, daemon=True)
+        thread.start()
+        return thread
+
+    def start_auto_refresh(self, interval: float = None) -> Thread:
+        """
+        Refreshes every interval (default: ttl) seconds, so listeners get new experiments without anyone asking,
+        e.g. a visualization left open on a lab monitor. A refresh only loads what changed since the last one.
+        """
+        interval = self.ttl if interval is None else interval
+        self.stop_auto_refresh()
+        stop = self._stop_auto_refresh = Event()
+
+        def run():
+            while not stop.wait(interval):
+                if self.osw_obj is not None:
+                    self.refresh()
+
+        thread = Thread(target=run, daemon=True, name="experiment-auto-refresh")
+        thread.start()
+        return thread
+
+    def stop_auto_refresh(self):
+        if self._stop_auto_refresh is not None:
+            self._stop_auto_refresh.set()
+            self._stop_auto_refresh = None
+
+    ## writing
+
+    def add_experiment(self, page: str, fractions, rgb):
+        """
+        Adds a finished experiment, e.g. one that was just documented, without asking the wiki.
+        If the experiment was pending it is moved to the finished ones.
+        """
+        fractions = [float(value) for value in fractions]
+        rgb = [float(value) for value in rgb]
+        self.experiment_cache.upsert([(page, 0, *fractions, *rgb, time.time())], advance_sync=False)
+        with self._lock:
+            dataset = self.dataset
+            keep = [i for i, pending_page in enumerate(dataset.pending_pages) if pending_page != page]
+            finished = [i for i, finished_page in enumerate(dataset.pages) if finished_page != page]
+            new_dataset = ExperimentDataset(pages=[dataset.pages[i] for i in finished] + [page],
+                                            fractions=np.vstack([dataset.fractions[finished], [fractions]]),
+                                            rgb=np.vstack([dataset.rgb[finished], [rgb]]),
+                                            pending_pages=[dataset.pending_pages[i] for i in keep],
+                                            pending_fractions=dataset.pending_fractions[keep])
+            self._set_dataset(new_dataset)
+        self._notify(new_dataset)
+
+    def add_pending_experiments(self, pages: List[str], fractions):
+        """Adds experiments that were handed in for execution, without asking the wiki."""
+        fractions = np.asarray(fractions, dtype=float).reshape(-1, 3)
+        self.experiment_cache.upsert([(page, 1, *row, None, None, None, time.time())
+                                      for page, row in zip(pages, fractions.tolist())], advance_sync=False)
+        with self._lock:
+            dataset = self.dataset
+            new_dataset = ExperimentDataset(pages=dataset.pages, fractions=dataset.fractions, rgb=dataset.rgb,
+                                            pending_pages=dataset.pending_pages + list(pages),
+                                            pending_fractions=np.vstack([dataset.pending_fractions, fractions]))
+            self._set_dataset(new_dataset)
+        self._notify(new_dataset)
+
+    ## change notification
+
+    def subscribe(self, callback: Callable[[ExperimentDataset], None]):
+        """Registers a callback that is called with the new dataset whenever it changes."""
+        self._listeners.append(callback)
+
+    def _set_dataset(self, dataset: ExperimentDataset) -> ExperimentDataset:
+        # the caller holds _lock from reading the old dataset until here, so no concurrent change is lost
+        self.dataset = dataset
+        self.version += 1
+        return dataset
+
+    def _notify(self, dataset: ExperimentDataset):
+        # outside the lock, listeners may read the repository
+        for callback in list(self._listeners):
+            try:
+                callback(dataset)
+            except Exception as e:
+                print("Error notifying experiment listener:", e)
@@ -0,0 +1,112 @@
+### per-experiment timestamps of the closed loop, stored as statements of the PseudoColorMixing process
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import numpy as np
+from osw.core import OSW
+from osw.model.entity import DataStatement
+
+import metrics
+
+# the hops of an experiment: suggested by the optimizer, handed in, found by a loop, loaded, mixed,
+# image uploaded, result documented
+TRACE_EVENTS = ["suggested", "stored", "detected", "loaded", "mixed", "uploaded", "documented"]
+TRACE_PROPERTIES = {event: f"Has{event.capitalize()}Timestamp" for event in TRACE_EVENTS}
+_EVENT_BY_PROPERTY = {prop: event for event, prop in TRACE_PROPERTIES.items()}
+
+# name, start event, end event. Queue hops are waiting time, service hops are work of a worker.
+# Timestamps of different machines are compared, so hops across machines include their clock offset.
+HOPS = [
+    ("hand-in", "suggested", "stored", "operator"),
+    ("detection", "stored", "detected", "queue"),
+    ("pickup", "detected", "loaded", "queue"),
+    ("mixing", "loaded", "mixed", "service"),
+    ("upload", "mixed", "uploaded", "service"),
+    ("documentation", "uploaded", "documented", "service"),
+    ("queue wait", "stored", "loaded", "total"),
+    ("service time", "loaded", "documented", "total"),
+    ("end to end", "stored", "documented", "total"),
+]
+
+HOP_SECONDS = metrics.histogram("experiment_hop_seconds", "Time between two trace events of documented experiments.")
+
+
+def _property(statement) -> str:
+    # loaded without a model the statements are dicts
+    return statement.get("property") if isinstance(statement, dict) else getattr(statement, "property", None)
+
+
+def record(process, event: str, timestamp: float = None) -> float:
+    """
+    Sets the timestamp of an event on the process, replacing the one of an earlier execution.
+
+    Args:
+        process: PseudoColorMixing entity
+        event: one of TRACE_EVENTS
+        timestamp: unix time, defaults to now
+
+    Returns:
+        float: the recorded timestamp
+    """
+    timestamp = datetime.now(timezone.utc).timestamp() if timestamp is None else timestamp
+    prop = TRACE_PROPERTIES[event]
+    value = datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+    statements = [statement for statement in (process.statements or []) if _property(statement) != prop]
+    process.statements = statements + [DataStatement(property=prop, value=value)]
+    return timestamp
+
+
+def read(process) -> Dict[str, float]:
+    """Returns the recorded timestamps (unix time) of the process by event."""
+    trace = {}
+    for statement in process.statements or []:
+        prop = _property(statement)
+        if prop in _EVENT_BY_PROPERTY:
+            value = statement["value"] if isinstance(statement, dict) else statement.value
+            try:
+                trace[_EVENT_BY_PROPERTY[prop]] = datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                continue
+    return trace
+
+
+def hop_durations(trace: Dict[str, float]) -> Dict[str, float]:
+    """Duration in seconds of every hop whose start and end are in the trace."""
+    return {name: trace[end] - trace[start] for name, start, end, _ in HOPS if start in trace and end in trace}
+
+
+def observe(process):
+    """Adds the hops of a documented process to the experiment_hop_seconds histogram."""
+    for hop, duration in hop_durations(read(process)).items():
+        HOP_SECONDS.observe(max(duration, 0.0), hop=hop)
+
+
+def load_traces(osw_obj: OSW, titles: List[str], chunk_size: int = 100) -> List[Dict[str, float]]:
+    """Loads the processes in batches and returns their traces, processes without trace are left out."""
+    traces = []
+    for i in range(0, len(titles), chunk_size):
+        result = osw_obj.load_entity(OSW.LoadEntityParam(titles=titles[i:i + chunk_size]))
+        for process in result.entities:
+            trace = read(process) if process is not None else {}
+            if trace:
+                traces.append(trace)
+    return traces
+
+
+def hop_statistics(traces: List[Dict[str, float]], percentiles=(50, 90, 99)) -> List[Dict]:
+    """
+    Percentiles of every hop over many traces.
+
+    Returns:
+        list: per hop a dict with hop, kind, count, the percentiles (p50, ...) and max in seconds
+    """
+    statistics = []
+    durations = [hop_durations(trace) for trace in traces]
+    for name, _, _, kind in HOPS:
+        values = np.array([duration[name] for duration in durations if name in duration])
+        entry = dict(hop=name, kind=kind, count=len(values))
+        for percentile in percentiles:
+            entry[f"p{percentile}"] = float(np.percentile(values, percentile)) if len(values) else None
+        entry["max"] = float(values.max()) if len(values) else None
+        statistics.append(entry)
+    return statistics
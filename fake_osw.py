@@ -0,0 +1,533 @@
+### in-process stand-in for an OSW instance, e.g. to load test the panels and loops without a wiki
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List
+from warnings import warn
+
+import numpy as np
+
+from osw.core import OSW, WtSite
+from osw.model import entity as model
+from osw.model.entity import Label, PseudoColorMixing
+from osw.utils.wiki import get_full_title, get_title
+from osw.wiki_tools import semantic_search
+from pseudo_color_mixer import PseudoColorMixer, ColorMixerInput, rgb_to_hex
+from beaker_renderer import render_beaker_svg
+
+# SMW property: (jsondata key, datatype)
+PROPERTIES = {
+    "ShallBeExecuted": ("execution_trigger", "boolean"),
+    "HasRedMixtureFraction": ("red_fraction", "number"),
+    "HasGreenMixtureFraction": ("green_fraction", "number"),
+    "HasBlueMixtureFraction": ("blue_fraction", "number"),
+    "HasOutput": ("output", "page"),
+    "HasImage": ("image", "page"),
+    "HasTool": ("tool", "page"),
+    "HasColor": ("color", "subobject"),
+    "HasRedValue": ("red_value", "number"),
+    "HasGreenValue": ("green_value", "number"),
+    "HasBlueValue": ("blue_value", "number"),
+}
+MODIFICATION_DATE = "Modification date"
+WIKI_FILE_CATEGORY = "Category:OSW11a53cdfbdc24524bf8ac435cbf65d9d"
+
+_CONDITION = re.compile(r"\[\[(.+?)\]\]", re.DOTALL)
+_COMPARATOR = re.compile(r"^(>>|<<|>|<|!|≥|≤)?(.*)$", re.DOTALL)
+
+
+class FakeOSWError(Exception):
+    """Injected failure of a fake wiki call."""
+
+
+def _parse_date(value: str) -> float:
+    return datetime.fromisoformat(value.strip()).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _parse_value(value: str):
+    value = value.strip()
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _compare(actual, comparator: str, expected) -> bool:
+    try:
+        if comparator in (">", "≥"):
+            return actual >= expected
+        if comparator in ("<", "≤"):
+            return actual <= expected
+        if comparator == ">>":
+            return actual > expected
+        if comparator == "<<":
+            return actual < expected
+    except TypeError:
+        return False
+    if comparator == "!":
+        return actual != expected
+    return actual == expected
+
+
+def parse_ask_query(query: str):
+    """
+    Splits an ask query into its conditions, printouts and options.
+
+    Returns:
+        tuple: ([(property, comparator, value)], [(property chain, label)], {option: value})
+    """
+    parts = query.split("|")
+    conditions = []
+    for condition in _CONDITION.findall(parts[0]):
+        if "::" in condition:
+            prop, _, value = condition.partition("::")
+            comparator, value = _COMPARATOR.match(value.strip()).groups()
+            conditions.append((prop.strip(), comparator or "", value))
+        else:
+            conditions.append((condition.strip(), "", None))
+    printouts = []
+    options = {}
+    for part in parts[1:]:
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith("?"):
+            chain, _, label = part[1:].partition("=")
+            printouts.append((chain.strip(), (label or chain).strip()))
+        else:
+            key, _, value = part.partition("=")
+            options[key.strip()] = value.strip()
+    return conditions, printouts, options
+
+
+class FakeWikiBackend:
+    """
+    The pages and files of the fake wiki. Every wiki call goes through simulate(), which adds the
+    configured latency (latency + latency_per_item * number of items) and fails with probability error_rate.
+    """
+
+    def __init__(self, domain: str = "fake.open-semantic-lab.org", latency: float = 0.0,
+                 latency_per_item: float = 0.0, error_rate: float = 0.0, default_limit: int = 50,
+                 max_limit: int = 5000, seed: int = None):
+        self.domain = domain
+        self.latency = latency
+        self.latency_per_item = latency_per_item
+        self.error_rate = error_rate
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        # full title: dict(jsondata, cls, modified)
+        self.pages: Dict[str, dict] = {}
+        self.files: Dict[str, bytes] = {}
+        self.call_counts = Counter()
+        self.lock = Lock()
+        self._random = random.Random(seed)
+        self._throttled = True
+
+    def simulate(self, operation: str, items: int = 1):
+        with self.lock:
+            self.call_counts[operation] += 1
+            fail = self._throttled and self._random.random() < self.error_rate
+        if self._throttled and (self.latency or self.latency_per_item):
+            time.sleep(self.latency + self.latency_per_item * items)
+        if fail:
+            raise FakeOSWError(f"injected error in {operation}")
+
+    @contextmanager
+    def unthrottled(self):
+        """Disables latency and error injection, e.g. while populating the wiki."""
+        self._throttled = False
+        try:
+            yield
+        finally:
+            self._throttled = True
+
+    ## pages
+
+    def put_page(self, title: str, jsondata: dict, cls=None, modified: float = None):
+        with self.lock:
+            self.pages[title] = dict(jsondata=jsondata, cls=cls,
+                                     modified=time.time() if modified is None else modified)
+
+    def delete_page(self, title: str) -> bool:
+        with self.lock:
+            self.files.pop(title, None)
+            return self.pages.pop(title, None) is not None
+
+    ## ask queries
+
+    def _values(self, title: str, chain: List[str]) -> List[tuple]:
+        """Resolves a property chain like HasOutput.HasColor.HasRedValue to (datatype, value) pairs."""
+        page = self.pages.get(title)
+        if page is None:
+            return []
+        if chain[0] == MODIFICATION_DATE:
+            return [("date", page["modified"])]
+        objects = [(title, page["jsondata"])]
+        values = []
+        subobjects = {}
+        for i, prop in enumerate(chain):
+            if prop not in PROPERTIES:
+                return []
+            key, datatype = PROPERTIES[prop]
+            values = []
+            for owner, jsondata in objects:
+                value = jsondata.get(key)
+                for item in (value if isinstance(value, list) else [value]):
+                    if item is None:
+                        continue
+                    if datatype == "subobject":
+                        # subobjects are reported by their id owner#key
+                        subobjects[f"{owner}#{key}"] = item
+                        item = f"{owner}#{key}"
+                    values.append((datatype, item))
+            if i == len(chain) - 1:
+                break
+            # follow pages and subobjects to the next property of the chain
+            objects = []
+            for datatype, value in values:
+                if datatype == "page" and value in self.pages:
+                    objects.append((value, self.pages[value]["jsondata"]))
+                elif datatype == "subobject" and isinstance(subobjects[value], dict):
+                    objects.append((value, subobjects[value]))
+        return values
+
+    def _matches(self, title: str, conditions) -> bool:
+        page = self.pages[title]
+        for prop, comparator, value in conditions:
+            if value is None:
+                # category condition
+                if prop.startswith("Category:") and prop not in page["jsondata"].get("type", []):
+                    return False
+                continue
+            if prop == MODIFICATION_DATE:
+                if not _compare(page["modified"], comparator, _parse_date(value)):
+                    return False
+                continue
+            expected = _parse_value(value)
+            if not any(_compare(actual, comparator, expected) for _, actual in self._values(title, [prop])):
+                return False
+        return True
+
+    def _format(self, datatype: str, value):
+        if datatype == "boolean":
+            return "t" if value else "f"
+        if datatype in ("page", "subobject"):
+            return self._page_info(value)
+        if datatype == "date":
+            return {"timestamp": str(int(value)),
+                    "raw": datetime.fromtimestamp(value, tz=timezone.utc).strftime("1/%Y/%m/%d/%H/%M/%S/0")}
+        return value
+
+    def _page_info(self, title: str) -> dict:
+        return {"fulltext": title, "fullurl": f"https://{self.domain}/wiki/{title}", "namespace": 0,
+                "exists": "1" if title.split("#")[0] in self.pages else "", "displaytitle": ""}
+
+    def ask(self, query: str) -> dict:
+        """Answers an ask query in the json format of the SMW ask api."""
+        conditions, printouts, options = parse_ask_query(query)
+        limit = min(int(options.get("limit", self.default_limit)), self.max_limit)
+        offset = int(options.get("offset", 0))
+        with self.lock:
+            titles = [title for title in self.pages if self._matches(title, conditions)]
+            if options.get("sort") == MODIFICATION_DATE:
+                titles.sort(key=lambda title: (self.pages[title]["modified"], title))
+            else:
+                titles.sort()
+            if options.get("order", "asc").lower() in ("desc", "descending"):
+                titles.reverse()
+            page_titles = titles[offset:offset + limit]
+            results = {}
+            for title in page_titles:
+                result = self._page_info(title)
+                result["printouts"] = {label: [self._format(datatype, value)
+                                               for datatype, value in self._values(title, chain.split("."))]
+                                       for chain, label in printouts}
+                results[title] = result
+        response = {"query": {
+            "printrequests": [{"label": label, "key": chain} for chain, label in printouts],
+            # like SMW, an empty result is an empty list instead of an empty object
+            "results": results if results else [],
+            "serializer": "SMW\\Serializers\\QueryResultSerializer",
+            "version": 2,
+            "meta": {"hash": "", "count": len(page_titles), "offset": offset, "source": "", "time": "0.000"}}}
+        if offset + limit < len(titles):
+            response["query-continue-offset"] = offset + limit
+        return response
+
+
+class FakeMwSite:
+    """The parts of mwclient.Site that are used here."""
+
+    def __init__(self, backend: FakeWikiBackend):
+        self.backend = backend
+        self.scheme = "https"
+        self.host = backend.domain
+        self.path = "/w/"
+
+    def api(self, action: str, *args, **kwargs) -> dict:
+        if action != "ask":
+            raise NotImplementedError(f"api action '{action}' is not supported by the fake wiki")
+        self.backend.simulate("ask")
+        return self.backend.ask(kwargs["query"])
+
+    def upload(self, file=None, filename: str = None, **kwargs) -> dict:
+        self.backend.simulate("upload")
+        data = file.read()
+        with self.backend.lock:
+            self.backend.files[f"File:{filename}"] = data if isinstance(data, bytes) else data.encode('utf-8')
+        return {"result": "Success", "filename": filename}
+
+
+class FakeSite:
+    """
+    The parts of WtSite that are used here, including its page cache. Entity calls of this client take latency
+    plus a random share of jitter seconds on top of the backend latency, e.g. a worker on a slow connection.
+    """
+
+    def __init__(self, backend: FakeWikiBackend, latency: float = 0.0, jitter: float = 0.0, seed: int = None):
+        self.backend = backend
+        self.mw_site = FakeMwSite(backend)
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._cache_enabled = False
+        self._page_cache: Dict[str, dict] = {}
+
+    def simulate(self, operation: str, items: int = 1):
+        if self.backend._throttled and (self.latency or self.jitter):
+            time.sleep(self.latency + self._random.uniform(0, self.jitter))
+        self.backend.simulate(operation, items=items)
+
+    def enable_cache(self):
+        self._cache_enabled = True
+
+    def disable_cache(self):
+        self._cache_enabled = False
+
+    def get_cache_enabled(self) -> bool:
+        return self._cache_enabled
+
+    def clear_cache(self):
+        self._page_cache = {}
+
+    def get_page_data(self, title: str) -> dict:
+        """The stored page like WtSite.get_page: from the page cache if it is enabled and has the page."""
+        if self._cache_enabled and title in self._page_cache:
+            return self._page_cache[title]
+        with self.backend.lock:
+            page = self.backend.pages.get(title)
+            # a snapshot, like a downloaded page
+            page = None if page is None else dict(page, jsondata=json.loads(json.dumps(page["jsondata"])))
+        if self._cache_enabled:
+            self._page_cache[title] = page
+        return page
+
+    def semantic_search(self, query):
+        # the real implementation, on top of the fake ask api
+        return semantic_search(self.mw_site, query)
+
+    def delete_page(self, param, comment: str = None) -> list:
+        """
+        Like WtSite.delete_page: one call per page, a page that can not be deleted is warned about and its
+        result is None instead of raising.
+        """
+        if not isinstance(param, WtSite.DeletePageParam):
+            param = WtSite.DeletePageParam(page=param)
+        results = []
+        for page in param.page:
+            title = page if isinstance(page, str) else page.title
+            try:
+                self.simulate("delete_page")
+                self.backend.delete_page(title)
+            except Exception as e:
+                warn(f"Page '{title}' could not be deleted. The following Exception occurred:\n{e}")
+                results.append(None)
+                continue
+            # the result of mwclient's Page.delete
+            results.append(dict(title=title, reason=param.comment))
+        return results
+
+
+class FakeOSW(OSW):
+    """
+    Drop-in replacement of an OSW instance backed by a FakeWikiBackend.
+    Loaded entities are instances of the classes they were stored with.
+    """
+
+    @classmethod
+    def create(cls, **backend_kwargs) -> "FakeOSW":
+        """Creates a fake OSW with an empty wiki, see FakeWikiBackend for the arguments."""
+        # construct() skips the validation of site, which has to be a WtSite
+        return cls.construct(site=FakeSite(FakeWikiBackend(**backend_kwargs)))
+
+    @property
+    def backend(self) -> FakeWikiBackend:
+        return self.site.backend
+
+    @property
+    def domain(self) -> str:
+        return self.backend.domain
+
+    def load_entity(self, entity_title):
+        if isinstance(entity_title, str):
+            param = OSW.LoadEntityParam(titles=[entity_title])
+        elif isinstance(entity_title, list):
+            param = OSW.LoadEntityParam(titles=entity_title)
+        else:
+            param = entity_title
+        self.site.simulate("load_entity", items=len(param.titles))
+
+        # the cache handling of OSW.load_entity: disable_cache turns the page cache on for the call when it was
+        # off, so a page that was loaded before is returned as it was then
+        cache_state = self.site.get_cache_enabled()
+        if param.disable_cache:
+            self.site.disable_cache()
+        if not cache_state and param.disable_cache:
+            self.site.enable_cache()
+        entities = []
+        for title in param.titles:
+            page = self.site.get_page_data(title)
+            entity = None
+            if page is not None:
+                cls = param.model_to_use or page["cls"] or model.Entity
+                entity = cls(**json.loads(json.dumps(page["jsondata"])))
+                if getattr(entity, "meta", None) is None:
+                    entity.meta = model.Meta()
+                if entity.meta.wiki_page is None:
+                    entity.meta.wiki_page = model.WikiPage()
+                namespace, _, entity.meta.wiki_page.title = title.rpartition(":")
+                entity.meta.wiki_page.namespace = namespace or None
+            entities.append(entity)
+        if cache_state:
+            self.site.enable_cache()
+        else:
+            self.site.disable_cache()
+
+        if isinstance(entity_title, str):
+            return entities[0] if entities else None
+        if isinstance(entity_title, list):
+            return entities
+        return OSW.LoadEntityResult.construct(entities=entities)
+
+    def store_entity(self, param):
+        if not isinstance(param, OSW.StoreEntityParam):
+            param = OSW.StoreEntityParam(entities=param)
+        self.site.simulate("store_entity", items=len(param.entities))
+        for entity in param.entities:
+            title = f"{param.namespace}:{get_title(entity)}" if param.namespace else get_full_title(entity)
+            jsondata = json.loads(entity.json(exclude_none=True))
+            jsondata.pop("meta", None)
+            with self.backend.lock:
+                existing = self.backend.pages.get(title)
+            # the overwrite rules of OSW.store_entity
+            overwrite = getattr(param.overwrite, "value", param.overwrite)
+            if existing is not None and overwrite != "replace remote":
+                if overwrite == "keep existing":
+                    print(f"Entity '{title}' already exists and won't be stored "
+                          f"with overwrite set to 'keep existing'!")
+                    continue
+                remote = {key: value for key, value in existing["jsondata"].items()
+                          if value not in (None, "", [], {})}
+                # True: local properties win, False / only empty: remote properties win
+                jsondata = {**remote, **jsondata} if overwrite is True else {**jsondata, **remote}
+            self.backend.put_page(title, jsondata, cls=type(entity))
+        return OSW.StoreEntityResult.construct(change_id=param.change_id, pages={})
+
+    def delete_entity(self, entity, comment: str = None):
+        if not isinstance(entity, OSW.DeleteEntityParam):
+            entity = OSW.DeleteEntityParam(entities=entity)
+        self.site.simulate("delete_entity", items=len(entity.entities))
+        for entity_ in entity.entities:
+            title = get_full_title(entity_)
+            if self.backend.delete_page(title):
+                print(f"Entity deleted: https://{self.domain}/wiki/{title}")
+            else:
+                print(f"Entity '{title}' does not exist!")
+
+    def install_dependencies(self, dependencies: Dict[str, str] = None):
+        print("The fake wiki has no schemas to install.")
+
+    ## synthetic data
+
+    def populate(self, n_finished: int, n_pending: int = 0, seed: int = 0, span: float = 86400.0):
+        """
+        Fills the wiki with synthetic experiments: finished PseudoColorMixing processes with their
+        PseudoColoredLiquid output and beaker image, and pending processes that are flagged for execution.
+        Modification dates are spread over the last span seconds. Latency and errors are not injected.
+        """
+        rng = np.random.default_rng(seed)
+        color_mixer = PseudoColorMixer()
+        fractions = rng.dirichlet(np.ones(4), size=n_finished + n_pending)[:, :3]
+        modified = np.sort(time.time() - span * rng.random(n_finished + n_pending))
+        with self.backend.unthrottled():
+            for i, (red_fraction, green_fraction, blue_fraction) in enumerate(fractions.tolist()):
+                inp = ColorMixerInput(red_fraction=red_fraction, green_fraction=green_fraction,
+                                      blue_fraction=blue_fraction)
+                if i >= n_finished:
+                    process = PseudoColorMixing(label=[Label(text="Pseudo Color Mixing (synthetic)", lang="en")],
+                                                uuid=str(uuid.UUID(int=int(rng.integers(2 ** 63)) << 64 | i)),
+                                                red_fraction=red_fraction, green_fraction=green_fraction,
+                                                blue_fraction=blue_fraction, execution_trigger=True)
+                    self._put_synthetic(process, modified[i])
+                    continue
+                rgb_value = color_mixer.mix(inp)
+                image_uuid = uuid.UUID(int=int(rng.integers(2 ** 63)) << 64 | i)
+                image_title = f"File:OSW{image_uuid.hex}.svg"
+                self.backend.put_page(image_title, dict(uuid=str(image_uuid), type=[WIKI_FILE_CATEGORY],
+                                                        label=[dict(text="Beaker Image (synthetic)", lang="en")]),
+                                      cls=getattr(model, "WikiFile", None), modified=modified[i])
+                self.backend.files[image_title] = render_beaker_svg(80, rgb_to_hex(rgb_value), as_bytes=True)
+                process, output = color_mixer.create_documentation_entities(inp, rgb_value, image_title)
+                self._put_synthetic(output, modified[i])
+                self._put_synthetic(process, modified[i])
+
+    def _put_synthetic(self, entity, modified: float):
+        jsondata = json.loads(entity.json(exclude_none=True))
+        jsondata.pop("meta", None)
+        self.backend.put_page(get_full_title(entity), jsondata, cls=type(entity), modified=float(modified))
+
+
+if __name__ == "__main__":
+    ## load test: sync the experiment cache and work through the open tasks against the fake wiki
+    import os
+    import tempfile
+    from experiment_cache import ExperimentCache
+    from task_executor import PipelinedTaskExecutor
+
+    parser = argparse.ArgumentParser(description="Load test against an in-process fake wiki.")
+    parser.add_argument("--finished", type=int, default=5000, help="synthetic finished experiments")
+    parser.add_argument("--pending", type=int, default=200, help="synthetic open tasks")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per wiki call")
+    parser.add_argument("--latency-per-item", type=float, default=0.005, help="seconds per entity of a wiki call")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    osw_obj = FakeOSW.create(latency=args.latency, latency_per_item=args.latency_per_item,
+                             error_rate=args.error_rate, seed=0)
+    start = time.perf_counter()
+    osw_obj.populate(args.finished, args.pending)
+    print(f"populated {len(osw_obj.backend.pages)} pages in {time.perf_counter() - start:.1f} s")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        experiment_cache = ExperimentCache(os.path.join(tmp_dir, "experiment_cache.sqlite"))
+        start = time.perf_counter()
+        fetched = experiment_cache.sync(osw_obj)
+        print(f"synced {fetched} experiments in {time.perf_counter() - start:.2f} s")
+
+    executor = PipelinedTaskExecutor(PseudoColorMixer(), osw_obj, concurrency={"upload": 8, "store": 8})
+    start = time.perf_counter()
+    n_tasks = executor.run_batch()
+    print(f"executed {n_tasks} tasks in {time.perf_counter() - start:.1f} s")
+    for stage_stats in executor.stats():
+        print(stage_stats)
+    executor.stop_workers()
+    print("wiki calls:", dict(osw_obj.backend.call_counts))
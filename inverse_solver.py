@@ -0,0 +1,107 @@
+### analytic inverse of the simulated color mixer: fractions for target colors and the reachable gamut
+import itertools
+from typing import List
+
+import numpy as np
+
+from pseudo_color_mixer import MIXING_MATRIX, hex_to_rgb_array, rgb_to_hex_array
+
+# constraints of the mixing simplex as rows of A f <= b: -f_i <= 0 and f_r + f_g + f_b <= 1
+_CONSTRAINT_A = np.vstack([-np.eye(3), np.ones((1, 3))])
+_CONSTRAINT_B = np.array([0.0, 0.0, 0.0, 1.0])
+
+
+def _face_solutions():
+    """
+    For every face of the simplex (a set of active constraints), the linear map that gives the least squares
+    solution of f @ M = a on that face: f = a @ G + h. The KKT system only depends on the face, so it is solved
+    once here instead of once per target.
+    """
+    gram = MIXING_MATRIX @ MIXING_MATRIX.T
+    faces = []
+    for k in range(4):
+        for active in itertools.combinations(range(4), k):
+            A = _CONSTRAINT_A[list(active)]
+            kkt = np.block([[gram, A.T], [A, np.zeros((k, k))]])
+            if np.linalg.matrix_rank(kkt) < 3 + k:
+                continue
+            kkt_inv = np.linalg.inv(kkt)
+            # f = K11 @ M @ a + K12 @ b, written for row vectors a
+            G = (kkt_inv[:3, :3] @ MIXING_MATRIX).T
+            h = kkt_inv[:3, 3:] @ _CONSTRAINT_B[list(active)]
+            faces.append((G, h))
+    return np.stack([G for G, _ in faces]), np.stack([h for _, h in faces])
+
+
+_FACE_G, _FACE_H = _face_solutions()
+
+
+class InverseSolution:
+    """Solutions for a batch of targets. All attributes are arrays with one row per target."""
+
+    def __init__(self, target_rgb: np.ndarray, fractions: np.ndarray, rgb: np.ndarray, tolerance: float):
+        self.target_rgb = target_rgb
+        self.fractions = fractions
+        self.rgb = rgb
+        self.distance = np.linalg.norm(rgb - target_rgb, axis=1)
+        self.reachable = self.distance <= tolerance
+
+    def __len__(self):
+        return len(self.fractions)
+
+    def parameters(self, i: int = 0) -> dict:
+        """The fractions of target i as parameters of the optimizer."""
+        red_fraction, green_fraction, blue_fraction = self.fractions[i].tolist()
+        return {"red_fraction": red_fraction, "green_fraction": green_fraction, "blue_fraction": blue_fraction}
+
+    def hex_colors(self) -> List[str]:
+        """The nearest reachable colors as hex codes."""
+        return list(rgb_to_hex_array(self.rgb))
+
+
+def solve_fractions(target_rgb, tolerance: float = 1.0) -> InverseSolution:
+    """
+    Finds the fractions whose simulated color is closest (least squares in RGB) to each target,
+    subject to fractions >= 0 and red + green + blue <= 1.
+
+    Args:
+        target_rgb: array-like of shape (N, 3) or (3,) with red/green/blue values (0-255)
+        tolerance: RGB distance up to which a target counts as reachable
+
+    Returns:
+        InverseSolution: fractions, nearest reachable colors, distances and reachability
+    """
+    target_rgb = np.asarray(target_rgb, dtype=float).reshape(-1, 3)
+    absorbed = 1 - target_rgb / 255
+    # candidate solution on every face, shape (faces, N, 3)
+    candidates = absorbed @ _FACE_G + _FACE_H[:, None, :]
+    feasible = (candidates >= -1e-9).all(axis=2) & (candidates.sum(axis=2) <= 1 + 1e-9)
+    residual = ((candidates @ MIXING_MATRIX - absorbed) ** 2).sum(axis=2)
+    # the problem is convex, so the best feasible face solution is the optimum
+    best = np.where(feasible, residual, np.inf).argmin(axis=0)
+    fractions = np.clip(candidates[best, np.arange(len(target_rgb))], 0, 1)
+    rgb = (1 - fractions @ MIXING_MATRIX) * 255
+    return InverseSolution(target_rgb, fractions, rgb, tolerance)
+
+
+def solve_hex(hex_colors, tolerance: float = 1.0) -> InverseSolution:
+    """solve_fractions for hex color codes."""
+    if isinstance(hex_colors, str):
+        hex_colors = [hex_colors]
+    return solve_fractions(hex_to_rgb_array(hex_colors), tolerance=tolerance)
+
+
+if __name__ == "__main__":
+    import time
+
+    solution = solve_hex(["#009777", "#045C61", "#7F3FBF", "#FFFFFF", "#000000"])
+    for i in range(len(solution)):
+        print(f"target {solution.target_rgb[i]} -> fractions {np.round(solution.fractions[i], 4)}, "
+              f"nearest {solution.hex_colors()[i]}, distance {solution.distance[i]:.1f}, "
+              f"reachable: {solution.reachable[i]}")
+
+    targets = np.random.default_rng(0).uniform(0, 255, size=(10**6, 3))
+    start = time.perf_counter()
+    solution = solve_fractions(targets)
+    print(f"solved {len(targets)} targets in {time.perf_counter() - start:.2f} s, "
+          f"{solution.reachable.mean():.1%} reachable")
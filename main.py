@@ -1,22 +1,33 @@
-from pseudo_color_mixer_panel import PseudoColorMixerPanel
-from pseudo_color_mixer import PseudoColorMixer
-from color_database_visualization_panel import ColorDatabaseVisualizationPanel
-from suggestion_panel import SuggestionPanel
-from osw.express import OswExpress
-import panel as pn
+from metrics import DEFAULT_PORT as DEFAULT_METRICS_PORT, start_metrics_server
+from roles import ROLE_PORTS, ROLES, serve
+import argparse
 
 
 if __name__ == "__main__":
-    color_mixer = PseudoColorMixer()
-    osw_obj = OswExpress(
-        domain="wiki-dev.open-semantic-lab.org"
-    )
-    mixer_panel = PseudoColorMixerPanel(color_mixer, osw_obj=osw_obj)
-    pn.serve(mixer_panel, port=20200, threaded=True)
+    parser = argparse.ArgumentParser(description="Serves the mixer, visualization, suggestion and trace panels.")
+    parser.add_argument("--role", nargs="+", choices=ROLES, default=ROLES,
+                        help="panels to serve, e.g. '--role mixer' for a mixer worker that does not load the "
+                             "optimizer (default: all)")
+    parser.add_argument("--fake", type=int, default=None, metavar="N",
+                        help="serve against an in-process fake wiki with N synthetic experiments (load testing)")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="seconds per call of the fake wiki")
+    parser.add_argument("--metrics-port", type=int, default=DEFAULT_METRICS_PORT,
+                        help="port of the Prometheus metrics endpoint (/metrics), 0 disables it")
+    args = parser.parse_args()
 
-    visualizer_panel = ColorDatabaseVisualizationPanel(osw_obj=osw_obj)
-    pn.serve(visualizer_panel, port=20201, threaded=True)
-
-    suggestion_panel = SuggestionPanel(osw_obj=osw_obj)
-    pn.serve(suggestion_panel, port=20202, threaded=True)
+    if args.metrics_port:
+        start_metrics_server(port=args.metrics_port)
+        print(f"Serving metrics at http://localhost:{args.metrics_port}/metrics")
 
+    if args.fake is not None:
+        from fake_osw import FakeOSW
+        osw_obj = FakeOSW.create(latency=args.fake_latency)
+        osw_obj.populate(args.fake, n_pending=args.fake // 20)
+    else:
+        from osw.express import OswExpress
+        osw_obj = OswExpress(
+            domain="wiki-dev.open-semantic-lab.org"
+        )
+    serve(args.role, osw_obj)
+    for role in args.role:
+        print(f"Serving {role} at http://localhost:{ROLE_PORTS[role]}")
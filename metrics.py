@@ -0,0 +1,282 @@
+### process wide timers, counters and gauges of the hot paths, served in the Prometheus text format
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Tuple
+
+# seconds, from an in-memory mix (microseconds) to a model fit or a large store_entity call (seconds)
+DEFAULT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DEFAULT_PORT = 20203
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = [(name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """A named metric with one value per label combination."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = Lock()
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines of all label combinations."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. processed tasks or errors. Rates (tasks per minute) follow from rate()."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. a queue depth. It can be set or read from a function when scraped."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Tuple, float] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._functions.pop(key, None)
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Reads the value from function() on every scrape, replacing an earlier function for the same labels."""
+        key = _label_key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+            self._functions[key] = function
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """Durations in cumulative buckets with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # per label combination: [count per bucket (not cumulative), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, errors: Counter = None, **labels) -> "Timer":
+        """Times a block or function, see Timer."""
+        return Timer(self, errors, labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_label_key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Timer:
+    """
+    Context manager and decorator that observes the duration in a histogram. If the block raises, the duration is
+    observed as well and the errors counter (if any) is increased with the same labels.
+    """
+
+    def __init__(self, histogram: Histogram, errors: Counter, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None and self.errors is not None:
+            self.errors.inc(**self.labels)
+        return False
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            # a new timer per call, so concurrent calls do not share the start time
+            with Timer(self.histogram, self.errors, self.labels):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+## registry
+
+_registry: Dict[str, Metric] = {}
+_registry_lock = Lock()
+
+
+def _get_or_create(cls, name: str, documentation: str, **kwargs) -> Metric:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric {name} is already registered as {metric.type}")
+        return metric
+
+
+def counter(name: str, documentation: str) -> Counter:
+    """Returns the counter with this name, registering it on first use."""
+    return _get_or_create(Counter, name, documentation)
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    """Returns the gauge with this name, registering it on first use."""
+    return _get_or_create(Gauge, name, documentation)
+
+
+def histogram(name: str, documentation: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Returns the histogram with this name, registering it on first use."""
+    return _get_or_create(Histogram, name, documentation, buckets=buckets)
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+## endpoint
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood the output
+        pass
+
+
+def start_metrics_server(port: int = DEFAULT_PORT, address: str = "") -> ThreadingHTTPServer:
+    """
+    Serves the metrics at http://<address>:<port>/metrics from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
+
+
+if __name__ == "__main__":
+    import urllib.request
+
+    durations = histogram("example_seconds", "Duration of the example operation.")
+    errors = counter("example_errors_total", "Failed example operations.")
+    try:
+        with durations.time(errors, operation="fail"):
+            raise RuntimeError("example")
+    except RuntimeError:
+        pass
+    start = time.perf_counter()
+    for i in range(100000):
+        with durations.time(errors, operation="noop"):
+            pass
+    print(f"overhead per timed block: {(time.perf_counter() - start) / 100000 * 1e6:.2f} µs")
+    server = start_metrics_server(port=0)
+    print(urllib.request.urlopen(f"http://localhost:{server.server_port}/metrics").read().decode())
+    server.shutdown()
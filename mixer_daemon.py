@@ -0,0 +1,105 @@
+### headless worker that executes open PseudoColorMixing tasks, any number of them can run on several machines
+import argparse
+import signal
+from threading import Event
+from typing import Dict
+
+from osw.core import OSW
+
+from metrics import DEFAULT_PORT as DEFAULT_METRICS_PORT, start_metrics_server
+from pseudo_color_mixer import PseudoColorMixer
+from task_executor import PipelinedTaskExecutor
+from task_leases import LeaseClaimer
+from task_quarantine import TaskQuarantine
+
+
+class MixerDaemon:
+    """
+    Runs a PipelinedTaskExecutor without a UI. Every daemon claims its tasks with a lease on the task entity,
+    so the open tasks are shared between all daemons (and continuous loops of mixer panels with a claimer).
+    A task executed twice is unlikely but possible, see LeaseClaimer. A daemon that stops or crashes leaves its
+    leases to expire, then other daemons take over.
+    Tasks that fail back off and are quarantined after max_attempts, see TaskQuarantine.
+    """
+
+    def __init__(self, osw_obj: OSW, owner: str = None, lease_duration: float = 60.0, settle: float = 1.0,
+                 max_claims: int = 8, concurrency: Dict[str, int] = None, documenter=None,
+                 max_attempts: int = 5, base_delay: float = 30.0):
+        self.quarantine = TaskQuarantine(osw_obj, max_attempts=max_attempts, base_delay=base_delay)
+        if documenter is not None and documenter.quarantine is None:
+            documenter.quarantine = self.quarantine
+        self.claimer = LeaseClaimer(osw_obj, owner=owner, duration=lease_duration, settle=settle,
+                                    max_claims=max_claims, quarantine=self.quarantine)
+        self.executor = PipelinedTaskExecutor(PseudoColorMixer(), osw_obj, concurrency=concurrency,
+                                              documenter=documenter, claimer=self.claimer,
+                                              quarantine=self.quarantine)
+        self.stopped = Event()
+
+    @property
+    def owner(self) -> str:
+        return self.claimer.owner
+
+    def start(self):
+        self.stopped.clear()
+        self.executor.start_continuous_loop()
+        print(f"Mixer daemon {self.owner} started.")
+
+    def stop(self):
+        """Finishes the tasks in the pipeline and stops."""
+        self.executor.stop_continuous_loop()
+        self.stopped.set()
+        print(f"Mixer daemon {self.owner} stopped.")
+
+    def run_forever(self):
+        """Runs until SIGINT or SIGTERM."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopped.set())
+        self.start()
+        try:
+            while not self.stopped.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stats(self):
+        return self.executor.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Executes open pseudo color mixing tasks without a UI.")
+    parser.add_argument("--lease", type=float, default=60.0, help="seconds a claimed task is reserved")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="minimum seconds between writing leases and reading them back, it is longer when "
+                             "loading and storing takes longer")
+    parser.add_argument("--max-claims", type=int, default=8, help="tasks claimed per poll")
+    parser.add_argument("--max-attempts", type=int, default=5, help="failed attempts before a task is quarantined")
+    parser.add_argument("--retry-delay", type=float, default=30.0,
+                        help="seconds before the second attempt, doubled with every further attempt")
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--store-workers", type=int, default=4)
+    parser.add_argument("--metrics-port", type=int, default=DEFAULT_METRICS_PORT,
+                        help="port of the Prometheus metrics endpoint (/metrics), 0 disables it. "
+                             "Daemons on the same machine need different ports.")
+    parser.add_argument("--fake", type=int, default=None, metavar="N",
+                        help="run against an in-process fake wiki with N open tasks (testing)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        start_metrics_server(port=args.metrics_port)
+        print(f"Serving metrics at http://localhost:{args.metrics_port}/metrics")
+
+    if args.fake is not None:
+        from fake_osw import FakeOSW
+        osw_obj = FakeOSW.create(latency=0.05)
+        osw_obj.populate(0, n_pending=args.fake)
+    else:
+        from osw.express import OswExpress
+        osw_obj = OswExpress(
+            domain="wiki-dev.open-semantic-lab.org"
+        )
+    daemon = MixerDaemon(osw_obj, lease_duration=args.lease, settle=args.settle, max_claims=args.max_claims,
+                         concurrency={"upload": args.upload_workers, "store": args.store_workers},
+                         max_attempts=args.max_attempts, base_delay=args.retry_delay)
+    daemon.run_forever()
+    for stage_stats in daemon.stats():
+        print(stage_stats)
@@ -1,8 +1,11 @@
 import uuid
 
+import numpy as np
 from pydantic.v1 import BaseModel, Field
 from beaker_visualization import create_beaker_svg
-from typing import Optional
+from beaker_renderer import render_beaker_svg, save_svg, svg_io
+from task_polling import OPEN_TASK_QUERY, AdaptivePollingScheduler, get_shared_open_task_query
+from typing import List, Optional
 from osw.core import OSW
 from osw.express import OswExpress
 from osw.model.entity import PseudoColoredLiquid, PseudoColorMixing, Label, RGBValue
@@ -10,9 +13,17 @@ from osw.controller.file.local import LocalFileController
 from osw.controller.file.wiki import WikiFileController
 from osw.utils.wiki import get_full_title
 from datetime import datetime
-from io import BytesIO
 import time
 from threading import Thread
+import experiment_trace
+import metrics
+
+# the hot paths of mixing and documentation, shared with the task executor and the bulk documenter
+OPERATION_SECONDS = metrics.histogram("color_mixing_operation_seconds",
+                                      "Duration of mixing, beaker rendering, image upload and entity storage.")
+OPERATION_ERRORS = metrics.counter("color_mixing_operation_errors_total",
+                                   "Failed mixing, rendering, upload and storage operations.")
+STORED_ENTITIES = metrics.counter("color_mixing_stored_entities_total", "Entities stored with store_entity.")
 
 
 class ColorMixerInput(BaseModel):
@@ -53,6 +64,86 @@ def rgb_to_hex(rgb_value: RGBValue):
 
     return f"#{r:02x}{g:02x}{b:02x}".upper()
 
+
+def hex_to_RGBValue(hex_color: str) -> RGBValue:
+    """Converts a hex color string to an RGBValue object."""
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return RGBValue(red_value=r, green_value=g, blue_value=b)
+
+
+# row i holds the channels absorbed by color i: red absorbs green and blue, green absorbs red and blue, ...
+MIXING_MATRIX = np.array([[0.0, 1.0, 1.0],
+                          [1.0, 0.0, 1.0],
+                          [1.0, 1.0, 0.0]])
+
+# two-digit upper case hex code for every channel value 0-255
+_HEX_DIGITS = np.array([f"{i:02X}" for i in range(256)])
+
+
+def subtractive_color_mixing_batch(fractions) -> np.ndarray:
+    """
+    Vectorized version of PseudoColorMixer.subtractive_color_mixing.
+
+    Args:
+        fractions: array-like of shape (N, 3) with red/green/blue fractions per mixture
+
+    Returns:
+        np.ndarray: float array of shape (N, 3) with red/green/blue values
+
+    Raises:
+        ValueError: If the shape is not (N, 3) or a fraction is larger than 1
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    if fractions.ndim != 2 or fractions.shape[1] != 3:
+        raise ValueError(f"fractions must have shape (N, 3), got {fractions.shape}")
+    if np.any(fractions > 1):
+        raise ValueError("fractions must be less than or equal to 1")
+    return (1 - fractions @ MIXING_MATRIX) * 255
+
+
+def rgb_to_hex_array(rgb_array) -> np.ndarray:
+    """
+    Vectorized version of rgb_to_hex.
+
+    Args:
+        rgb_array: array-like of shape (N, 3) with red/green/blue values
+
+    Returns:
+        np.ndarray: array of N hexadecimal color codes (e.g., '#FF5733')
+
+    Raises:
+        ValueError: If RGB values are not in valid range (0-255)
+    """
+    rgb = np.rint(np.asarray(rgb_array, dtype=float).reshape(-1, 3))
+    invalid = (rgb < 0) | (rgb > 255)
+    if np.any(invalid):
+        raise ValueError(f"RGB values must be between 0-255, got {int(rgb[invalid][0])}")
+    digits = _HEX_DIGITS[rgb.astype(np.intp)]
+    return np.char.add(np.char.add(np.char.add("#", digits[:, 0]), digits[:, 1]), digits[:, 2])
+
+
+def hex_to_rgb_array(hex_colors) -> np.ndarray:
+    """
+    Vectorized version of hex_to_RGBValue.
+
+    Args:
+        hex_colors: iterable of hex color strings (e.g., '#FF5733')
+
+    Returns:
+        np.ndarray: int array of shape (N, 3) with red/green/blue values
+    """
+    codes = np.array([int(hex_color.lstrip('#')[:6], 16) for hex_color in hex_colors], dtype=np.int64)
+    return np.stack([(codes >> 16) & 0xFF, (codes >> 8) & 0xFF, codes & 0xFF], axis=1)
+
+
+def rgb_array_to_RGBValues(rgb_array) -> List[RGBValue]:
+    """Converts an (N, 3) array to RGBValue objects. Only use this at the edges, e.g. for documentation."""
+    return [RGBValue(red_value=r, green_value=g, blue_value=b)
+            for r, g, b in np.asarray(rgb_array, dtype=float).tolist()]
+
 class ColorMixerOutput(BaseModel):
     extracted_color: RGBValue
     raw_image: Optional[str] = Field(description="link to raw image of the color mixing experiment")
@@ -69,120 +160,64 @@ class ColorOptimizerInput(BaseModel):
 class PseudoColorMixer():
     def __init__(self, tool_id = "Item:OSW10960c5f551f4697b0b472315a78699a"):
         self.last_svg_code = None
+        self.last_svg_bytes = None
         self.last_rgb_value: RGBValue = None
         self.last_input: ColorMixerInput = None
+        self.last_documented_process: PseudoColorMixing = None
         self.thread:Thread = None
-        self.stop_flag = False
+        self.scheduler = AdaptivePollingScheduler()
         self.tool_id=tool_id
 
-    def subtractive_color_mixing(self, inp: ColorMixerInput):
+    @OPERATION_SECONDS.time(OPERATION_ERRORS, operation="mix")
+    def mix(self, inp: ColorMixerInput) -> RGBValue:
+        """Mixes the input without remembering it as last result, so it can be used by several threads at once."""
 
         r = (1 - inp.green_fraction - inp.blue_fraction) * 255
         g = (1 - inp.red_fraction - inp.blue_fraction) * 255
         b = (1 - inp.red_fraction - inp.green_fraction) * 255
 
+        return RGBValue(red_value=r, green_value=g, blue_value=b)
+
+    def subtractive_color_mixing(self, inp: ColorMixerInput):
+
         self.last_input = inp
-        self.last_rgb_value = RGBValue(red_value=r, green_value=g, blue_value=b)
+        self.last_rgb_value = self.mix(inp)
         return self.last_rgb_value
 
-    def create_beaker_svg(self, filling_percent: float, rgb_value: RGBValue, filename="beaker.svg"):
+    def subtractive_color_mixing_batch(self, fractions) -> np.ndarray:
+        """
+        Mixes many inputs at once without creating pydantic objects.
+
+        Args:
+            fractions: array-like of shape (N, 3) with red/green/blue fractions
+
+        Returns:
+            np.ndarray: float array of shape (N, 3) with red/green/blue values
+        """
+        return subtractive_color_mixing_batch(fractions)
+
+    def create_beaker_svg(self, filling_percent: float, rgb_value: RGBValue, filename=None):
         """
         Erstellt ein SVG-Bild eines Becherglases mit Flüssigkeit.
 
         Args:
             filling_percent (float): Füllhöhe in Prozent (0-100)
-            liquid_color (str): Farbe der Flüssigkeit (z.B. 'blue', '#FF0000', 'rgb(255,0,0)')
-            filename (str): Name der zu speichernden SVG-Datei
+            rgb_value (RGBValue): Farbe der Flüssigkeit
+            filename (str): Name der zu speichernden SVG-Datei, optional. Ohne Dateiname wird nichts gespeichert.
 
         Returns:
             str: SVG-Code als String
         """
 
         liquid_color = rgb_to_hex(rgb_value)
+        with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="render"):
+            svg_code = render_beaker_svg(filling_percent, liquid_color)
+            self.last_svg_bytes = render_beaker_svg(filling_percent, liquid_color, as_bytes=True)
 
-        # Begrenze Füllhöhe auf 0-100%
-        filling_percent = max(0, min(100, filling_percent))
-
-        # SVG-Dimensionen und Becherglas-Parameter
-
-
-        width, height = 100, 150
-        beaker_bottom_width = 40
-        beaker_top_width = 50
-        beaker_height = 100
-        beaker_x = (width - beaker_bottom_width) // 2
-        beaker_y = 25
-
-        # Berechne Flüssigkeitshöhe
-        liquid_height = (filling_percent / 100) * beaker_height
-        liquid_y = beaker_y + beaker_height - liquid_height
-
-        # Berechne Breite der Flüssigkeit basierend auf der trapezförmigen Form
-        width_diff = beaker_top_width - beaker_bottom_width
-        liquid_bottom_width = beaker_bottom_width
-        liquid_top_width = beaker_bottom_width + (width_diff * (liquid_height / beaker_height))
-
-        # SVG-Code generieren
-        svg_code = f'''<?xml version="1.0" encoding="UTF-8"?>
-    <svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
-        <!-- Hintergrund -->
-        <rect width="{width}" height="{height}" fill="white"/>
-
-        <!-- Becherglas (Trapezform) -->
-        <polygon points="{beaker_x},{beaker_y + beaker_height} 
-                         {beaker_x + beaker_bottom_width},{beaker_y + beaker_height}
-                         {beaker_x + (beaker_top_width - beaker_bottom_width) // 2 + beaker_bottom_width},{beaker_y}
-                         {beaker_x - (beaker_top_width - beaker_bottom_width) // 2},{beaker_y}"
-                 fill="none" 
-                 stroke="black" 
-                 stroke-width="3"/>
-
-        <!-- Flüssigkeit (falls vorhanden) -->'''
-
-        if filling_percent > 0:
-            liquid_x_left = beaker_x - (beaker_top_width - beaker_bottom_width) // 2 * (liquid_height / beaker_height)
-            liquid_x_right = beaker_x + beaker_bottom_width + (beaker_top_width - beaker_bottom_width) // 2 * (
-                    liquid_height / beaker_height)
-
-            svg_code += f'''
-        <polygon points="{beaker_x},{beaker_y + beaker_height}
-                         {beaker_x + beaker_bottom_width},{beaker_y + beaker_height}
-                         {liquid_x_right},{liquid_y}
-                         {liquid_x_left},{liquid_y}"
-                 fill="{liquid_color}"
-                 opacity="0.8"/>'''
-
-        svg_code += f'''
-
-        <!-- Becherrand (oben) -->
-        <line x1="{beaker_x - (beaker_top_width - beaker_bottom_width) // 2 - 5}" 
-              y1="{beaker_y}" 
-              x2="{beaker_x + (beaker_top_width - beaker_bottom_width) // 2 + beaker_bottom_width + 5}" 
-              y2="{beaker_y}" 
-              stroke="black" 
-              stroke-width="4"/>
-
-        <!-- Ausgießer -->
-        <path d="M {beaker_x + (beaker_top_width - beaker_bottom_width) // 2 + beaker_bottom_width + 5} {beaker_y}
-                 Q {beaker_x + (beaker_top_width - beaker_bottom_width) // 2 + beaker_bottom_width + 15} {beaker_y - 5}
-                 {beaker_x + (beaker_top_width - beaker_bottom_width) // 2 + beaker_bottom_width + 20} {beaker_y + 5}"
-              fill="none"
-              stroke="black"
-              stroke-width="2"/>
-
-        <!-- Füllstand-Text 
-        <text x="{width - 30}" y="{beaker_y + beaker_height - 10}" 
-              font-family="Arial" font-size="12" fill="black">
-              {filling_percent:.1f}%
-        </text>
-        -->
-    </svg>'''
-
-        # SVG in Datei speichern
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(svg_code)
+        # SVG nur auf Wunsch in Datei speichern
+        if filename is not None:
+            save_svg(svg_code, filename)
         self.last_svg_code = svg_code
-        print(f"SVG-Datei '{filename}' wurde erstellt.")
         return svg_code
 
     def document_color_mixing(self,rgb_value: RGBValue, beaker_svg: str):
@@ -194,42 +229,48 @@ class PseudoColorMixer():
             filling_percent=80,
 
             liquid_color=rgb_to_hex(rgb_value),
-            filename="color_mixing_beaker.svg"
         )
 
-    def document_last_color_mixing(self, osw_obj:OSW, process_instance:PseudoColorMixing = None):
-        """
-        Document the last color mixing process in open semantic lab
-        """
-        if self.last_svg_code is None:
-            print("No color mixing has been performed yet.")
-            return
+    def render_beaker(self, rgb_value: RGBValue, filling_percent: float = 80) -> bytes:
+        """Renders the beaker image of a result as SVG bytes without remembering it as last result."""
+        with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="render"):
+            return render_beaker_svg(filling_percent, rgb_to_hex(rgb_value), as_bytes=True)
 
-        self.document_color_mixing(rgb_value=self.last_rgb_value, beaker_svg=self.last_svg_code)
-
-        # upload image
-        beaker_image_uuid = uuid.uuid4()
-        beaker_image_wf = WikiFileController(
+    def create_beaker_image_file(self, osw_obj: OSW, beaker_image_uuid: uuid.UUID = None) -> WikiFileController:
+        """Creates the (not yet uploaded) wiki file for a beaker image."""
+        if beaker_image_uuid is None:
+            beaker_image_uuid = uuid.uuid4()
+        return WikiFileController(
             label = [Label(text=f"Beaker Image {datetime.now().strftime('%y-%m-%d %H:%M.%S')}", lang="en")],
             title = f"OSW{str(beaker_image_uuid).replace("-","")}.svg",
             uuid=beaker_image_uuid,
 
             osw=osw_obj)
 
-        beaker_image_io = BytesIO()
-        beaker_image_io.write(self.last_svg_code.encode('utf-8'))
-        beaker_image_io.name = "beaker_image.svg"
+    def upload_beaker_image(self, beaker_image_wf: WikiFileController, svg_bytes: bytes) -> str:
+        """
+        Uploads a beaker image to the wiki.
 
-        try:
-            beaker_image_wf.put(beaker_image_io, overwrite=True)
-        except Exception as e:
-            print("Error uploading bar chart file: ", e)
+        Returns:
+            str: full title of the file page
+        """
+        with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="upload"):
+            beaker_image_wf.put(svg_io(svg_bytes, name="beaker_image.svg"), overwrite=True)
+        return get_full_title(beaker_image_wf)
 
+    def create_documentation_entities(self, inp: ColorMixerInput, rgb_value: RGBValue, image_title: str,
+                                      process_instance: PseudoColorMixing = None):
+        """
+        Creates the output entity of a color mixing result and creates or completes the process entity.
+
+        Returns:
+            tuple: (process_instance, output_instance)
+        """
         output_instance = PseudoColoredLiquid(
             uuid = str(uuid.uuid4()),
             label = [Label(text=f"Pseudo Colored Liquid {datetime.now().strftime('%y-%m-%d %H:%M.%S')}", lang="en")],
-            color=self.last_rgb_value,
-            image = get_full_title(beaker_image_wf),
+            color=rgb_value,
+            image = image_title,
         )
 
 
@@ -238,21 +279,64 @@ class PseudoColorMixer():
             process_instance = PseudoColorMixing(
                 label=[Label(text=f"Pseudo Color Mixing {datetime.now().strftime('%y-%m-%d %H:%M.%S')}", lang="en")],
                 uuid=str(process_uuid),
-                red_fraction=self.last_input.red_fraction,
-                green_fraction=self.last_input.green_fraction,
-                blue_fraction=self.last_input.blue_fraction,
+                red_fraction=inp.red_fraction,
+                green_fraction=inp.green_fraction,
+                blue_fraction=inp.blue_fraction,
                 output=[get_full_title(output_instance)],
-                image=get_full_title(beaker_image_wf),
+                image=image_title,
                 tool=[self.tool_id]
             )
         else:
             process_instance.output = [get_full_title(output_instance)]
             process_instance.execution_trigger=False
-            process_instance.image= get_full_title(beaker_image_wf)
+            process_instance.image= image_title
             process_instance.tool= [self.tool_id]
 
-        osw_obj.store_entity(OSW.StoreEntityParam(entities=[process_instance, output_instance],
-                                                  overwrite=True))
+        return process_instance, output_instance
+
+    def document_last_color_mixing(self, osw_obj:OSW, process_instance:PseudoColorMixing = None, documenter=None):
+        """
+        Document the last color mixing process in open semantic lab
+
+        Args:
+            osw_obj: the OSW instance to document in
+            process_instance: the PseudoColorMixing task that was executed, a new process is created if None
+            documenter (BulkDocumenter): if given, the result is spooled and documented with the next bulk flush
+        """
+        if self.last_svg_code is None:
+            print("No color mixing has been performed yet.")
+            return
+
+        if documenter is not None:
+            spooled_result = documenter.submit(self.last_input, self.last_rgb_value, self.last_svg_bytes,
+                                               process_instance=process_instance)
+            process_instance, output_instance = spooled_result.process_instance, spooled_result.output_instance
+        else:
+            self.document_color_mixing(rgb_value=self.last_rgb_value, beaker_svg=self.last_svg_code)
+
+            # upload image
+            beaker_image_wf = self.create_beaker_image_file(osw_obj)
+            uploaded = None
+            try:
+                self.upload_beaker_image(beaker_image_wf, self.last_svg_bytes)
+                uploaded = time.time()
+            except Exception as e:
+                print("Error uploading bar chart file: ", e)
+            beaker_image_title = get_full_title(beaker_image_wf)
+
+            process_instance, output_instance = self.create_documentation_entities(self.last_input,
+                                                                                   self.last_rgb_value,
+                                                                                   beaker_image_title,
+                                                                                   process_instance=process_instance)
+            if uploaded is not None:
+                experiment_trace.record(process_instance, "uploaded", uploaded)
+            experiment_trace.record(process_instance, "documented")
+            with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="store"):
+                osw_obj.store_entity(OSW.StoreEntityParam(entities=[process_instance, output_instance],
+                                                          overwrite=True))
+            STORED_ENTITIES.inc(2)
+            experiment_trace.observe(process_instance)
+        self.last_documented_process = process_instance
 
         process_link = f"https://{osw_obj.domain}/wiki/{get_full_title(process_instance)}"
         output_link = f"https://{osw_obj.domain}/wiki/{get_full_title(output_instance)}"
@@ -261,32 +345,35 @@ class PseudoColorMixer():
 
     def check_for_open_tasks(self, osw_obj):
         """Checks if there is an instance of PseudoColorMixing that has its flag"""
-        open_tasks = osw_obj.site.semantic_search("[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]][["
-                                                       "ShallBeExecuted::true]]")
+        open_tasks = osw_obj.site.semantic_search(OPEN_TASK_QUERY)
 
         return open_tasks
 
     def continuous_loop(self, osw_obj: OSW):
-        self.stop_flag = False
-        while not self.stop_flag:
-            open_tasks = self.check_for_open_tasks(osw_obj)
-            if len(open_tasks) > 0:
+        open_task_query = get_shared_open_task_query(osw_obj)
+        while not self.scheduler.stopped:
+            task_title = open_task_query.take()
+            if task_title is not None:
                 # download task and work on it
-                mixing_process: PseudoColorMixing = osw_obj.load_entity(open_tasks[0])
-                print("mixing_process:", mixing_process)
+                try:
+                    mixing_process: PseudoColorMixing = osw_obj.load_entity(task_title)
+                    print("mixing_process:", mixing_process)
+                finally:
+                    open_task_query.release(task_title)
+                self.scheduler.work_found()
             else:
-                time.sleep(2)
+                self.scheduler.wait_idle()
 
     def start_continuous_loop(self, osw_obj):
+        if self.thread is not None and self.thread.is_alive():
+            print("Thread is already running.")
+            return
+        self.scheduler.reset()
         self.thread = Thread(target=self.continuous_loop, args=(osw_obj,))
-        if self.thread is not None:
-            if self.thread.is_alive():
-                print("Thread is already running.")
-                return
         self.thread.start()
 
     def stop_continuous_loop(self):
-        self.stop_flag = True
+        self.scheduler.stop()
 
 
 if __name__ == '__main__':
@@ -295,7 +382,7 @@ if __name__ == '__main__':
     mixer_input = ColorMixerInput(red_fraction=0.7, green_fraction=0.1, blue_fraction=0.2)
     result_rgb = color_mixer.subtractive_color_mixing(mixer_input)
     print(result_rgb)
-    beaker_svg = color_mixer.create_beaker_svg(80, result_rgb)
+    beaker_svg = color_mixer.create_beaker_svg(80, result_rgb, filename="beaker.svg")
 
     test_documentation = False
     if test_documentation:
@@ -2,18 +2,36 @@ from pseudo_color_mixer import PseudoColorMixer, ColorMixerInput, PseudoColorMix
 from osw.model.entity import RGBValue
 from osw.express import OswExpress
 from osw.core import OSW
+from osw.utils.wiki import get_full_title
+from experiment_repository import ExperimentRepository
 import panel as pn
-from io import BytesIO
+from beaker_renderer import svg_io
+from task_leases import LeaseClaimer, LeaseLostError, clear_lease, load_uncached
+from task_quarantine import TaskQuarantine
+from task_polling import OPEN_TASK_QUERY, AdaptivePollingScheduler, get_shared_open_task_query
 import time
 from threading import Thread
 from datetime import datetime
+import experiment_trace
+import metrics
+
+CALLBACK_SECONDS = metrics.histogram("panel_callback_seconds", "Duration of panel callbacks that do work.")
+CALLBACK_ERRORS = metrics.counter("panel_callback_errors_total", "Panel callbacks that raised.")
+LOOP_TASKS = metrics.counter("continuous_loop_tasks_total", "Tasks taken by the continuous loop, by result.")
 
 class PseudoColorMixerPanel:
-    def __init__(self, color_mixer: PseudoColorMixer, osw_obj:OSW=None):
+    def __init__(self, color_mixer: PseudoColorMixer, osw_obj:OSW=None, documenter=None,
+                 repository: ExperimentRepository = None, claimer: LeaseClaimer = None):
         self.color_mixer = color_mixer
         self.osw_obj = osw_obj
+        self.documenter = documenter  # optional BulkDocumenter
+        self.repository = repository  # optional, receives every documented result
+        # optional, claims the tasks of the continuous loop when other loops or daemons work on the same wiki
+        self.claimer = claimer
         self.current_input = ColorMixerInput(red_fraction=0, green_fraction=0, blue_fraction=0)
         self.last_beaker_svg = None
+        self.thread: Thread = None
+        self.scheduler = AdaptivePollingScheduler()
         self.build_panel()
 
     def build_panel(self):
@@ -72,6 +90,7 @@ class PseudoColorMixerPanel:
                                       , green_value = self.g_input.value
                                       , blue_value = self.b_input.value)
 
+    @CALLBACK_SECONDS.time(CALLBACK_ERRORS, panel="mixer", callback="mix")
     def color_mixing_callback(self, event):
         self.input_callback()
         color_mixed = self.color_mixer.subtractive_color_mixing(ColorMixerInput(
@@ -81,23 +100,28 @@ class PseudoColorMixerPanel:
         ))
         self.last_beaker_svg = self.color_mixer.create_beaker_svg(80, color_mixed)
 
-        svg_bytes = BytesIO()
-        svg_bytes.write(self.last_beaker_svg.encode('utf-8'))
-
-        self.image_panel.object = svg_bytes#self.last_beaker_svg
+        self.image_panel.object = svg_io(self.color_mixer.last_svg_bytes)
         self.result_markdown.object = (f"**Resulting Color:**\nRed: {color_mixed.red_value}, "
                                        f"Green: {color_mixed.green_value},Blue: {color_mixed.blue_value}")
         self.document_result_alert.object = (f"Click the button to document the last result in the OSW.")
         self.document_result_alert.alert_type = "info"
 
-    def document_last_result_callback(self, event, process_instance = None):
+    @CALLBACK_SECONDS.time(CALLBACK_ERRORS, panel="mixer", callback="document")
+    def document_last_result_callback(self, event, process_instance = None, raise_errors: bool = False):
         print("documenting last result")
         self.document_result_alert.object = (f"documentation in progress...")
         self.document_result_alert.alert_type  = "warning"
 
         try:
             process_link, output_link = self.color_mixer.document_last_color_mixing(self.osw_obj, process_instance =
-            process_instance)
+            process_instance, documenter=self.documenter)
+            if self.repository is not None:
+                last_input = self.color_mixer.last_input
+                last_rgb_value = self.color_mixer.last_rgb_value
+                self.repository.add_experiment(
+                    get_full_title(self.color_mixer.last_documented_process),
+                    [last_input.red_fraction, last_input.green_fraction, last_input.blue_fraction],
+                    [last_rgb_value.red_value, last_rgb_value.green_value, last_rgb_value.blue_value])
 
             ## write the links to the result in the markdown
             self.document_result_alert.object = (f"Documentation of last Result:\n"
@@ -109,57 +133,124 @@ class PseudoColorMixerPanel:
             self.document_result_alert.object = (f"Error documenting last result: {e}")
             self.document_result_alert.alert_type = "danger"
             print("Error documenting last result:", e)
+            # the continuous loop records the failure of the task, the timer counts the error of a raising call
+            if raise_errors:
+                raise
+            CALLBACK_ERRORS.inc(panel="mixer", callback="document")
 
     def check_for_open_tasks(self, osw_obj):
         """Checks if there is an instance of PseudoColorMixing that has its flag"""
-        open_tasks = osw_obj.site.semantic_search("[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]][["
-                                                       "ShallBeExecuted::true]]")
+        open_tasks = osw_obj.site.semantic_search(OPEN_TASK_QUERY)
 
         return open_tasks
 
     def continuous_loop(self, osw_obj: OSW):
-        self.stop_flag = False
-        while not self.stop_flag:
-            open_tasks = self.check_for_open_tasks(osw_obj)
-            if len(open_tasks) > 0:
-                # download task and work on it
-                mixing_process: PseudoColorMixing = osw_obj.load_entity(open_tasks[0])
-
-                self.continuous_loop_alert.object = (f"Found open task at {datetime.now()}. "
-                                                     f"Working on it now: {mixing_process}")
-                self.continuous_loop_alert.alert_type = "success"
-
-                print("mixing_process:", mixing_process)
-                self.r_input.value = mixing_process.red_fraction
-                self.g_input.value = mixing_process.green_fraction
-                self.b_input.value = mixing_process.blue_fraction
-                self.color_mixing_callback(event=None)
-
-                self.document_last_result_callback(event=None, process_instance=mixing_process)
+        open_task_query = get_shared_open_task_query(osw_obj)
+        # with a claimer, tasks are claimed with a lease, so other loops and daemons rarely execute them at the same
+        # time. Without one, the loop does not pay for claiming (settle time and two more round trips per task).
+        # A task that fails backs off before it is taken again and is quarantined after too many attempts.
+        quarantine = TaskQuarantine(osw_obj)
+        # tasks backing off according to the wiki, unix time until which they are skipped
+        skip_until = {}
+        while not self.scheduler.stopped:
+            now = time.time()
+            task_title = open_task_query.take(
+                skip=lambda title: max(skip_until.get(title, 0.0), quarantine.not_before(title)) > now)
+            mixing_process: PseudoColorMixing = None
+            if task_title is not None:
+                try:
+                    mixing_process = self.load_task(osw_obj, task_title, quarantine, skip_until)
+                except Exception as e:
+                    print(f"Error loading {task_title}: {e}")
+                if mixing_process is None:
+                    open_task_query.release(task_title)
+            if mixing_process is not None:
+                # a spooled task is released by the documenter once its flush stored it
+                spooled = False
+                try:
+                    # work on the claimed task
+                    detected = open_task_query.detected_at(task_title)
+                    experiment_trace.record(mixing_process, "detected", detected)
+                    experiment_trace.record(mixing_process, "loaded")
+
+                    self.continuous_loop_alert.object = (f"Found open task at {datetime.now()}. "
+                                                         f"Working on it now: {mixing_process}")
+                    self.continuous_loop_alert.alert_type = "success"
+
+                    print("mixing_process:", mixing_process)
+                    self.r_input.value = mixing_process.red_fraction
+                    self.g_input.value = mixing_process.green_fraction
+                    self.b_input.value = mixing_process.blue_fraction
+                    self.color_mixing_callback(event=None)
+                    experiment_trace.record(mixing_process, "mixed")
+
+                    # a documenter checks the lease with its flush
+                    if self.claimer is not None and self.documenter is None:
+                        if not self.claimer.holds(mixing_process):
+                            raise LeaseLostError(f"another worker claimed {task_title}")
+                        clear_lease(mixing_process)
+                    self.document_last_result_callback(event=None, process_instance=mixing_process,
+                                                       raise_errors=True)
+                    spooled = self.documenter is not None
+                    LOOP_TASKS.inc(result="done")
+                except LeaseLostError as e:
+                    # not a failure of the task, the other worker executes it
+                    LOOP_TASKS.inc(result="lease_lost")
+                    self.continuous_loop_alert.object = f"Stopped working on {task_title}: {e}"
+                    self.continuous_loop_alert.alert_type = "warning"
+                except Exception as e:
+                    LOOP_TASKS.inc(result="error")
+                    quarantine.record_failure(task_title, e)
+                    self.continuous_loop_alert.object = f"Error executing {task_title}: {e}"
+                    self.continuous_loop_alert.alert_type = "danger"
+                finally:
+                    if not spooled:
+                        open_task_query.release(task_title)
+                self.scheduler.work_found()
 
             else:
-                self.continuous_loop_alert.object = (f"No open tasks found at {datetime.now()}. Waiting for 2 "
-                                                     f"seconds "
-                                                     f"before "
-                                                     f"checking again.")
+                self.continuous_loop_alert.object = (f"No unclaimed open tasks found at {datetime.now()}. Waiting "
+                                                     f"for {self.scheduler.interval:.1f} seconds before checking "
+                                                     f"again.")
                 self.continuous_loop_alert.alert_type = "success"
-                time.sleep(2)
+                self.scheduler.wait_idle()
+
+    def load_task(self, osw_obj: OSW, task_title: str, quarantine: TaskQuarantine,
+                  skip_until: dict) -> PseudoColorMixing:
+        """
+        Claims the task with the claimer. Without one, the task is loaded unless it is backing off.
+
+        Returns:
+            PseudoColorMixing: the task, None if it is not executed now
+        """
+        if self.claimer is not None:
+            return self.claimer.claim([task_title]).get(task_title)
+        mixing_process = load_uncached(osw_obj, [task_title]).get(task_title)
+        if mixing_process is None or not mixing_process.execution_trigger:
+            return None
+        not_before = quarantine.not_before(task_title, mixing_process)
+        if not_before > time.time():
+            skip_until[task_title] = not_before
+            return None
+        return mixing_process
 
     def start_continuous_loop(self, osw_obj):
+        if self.thread is not None and self.thread.is_alive():
+            print("Thread is already running.")
+            return
+        self.scheduler.reset()
         self.thread = Thread(target=self.continuous_loop, args=(osw_obj,))
-        if self.thread is not None:
-            if self.thread.is_alive():
-                print("Thread is already running.")
-                return
         self.thread.start()
 
     def stop_continuous_loop(self):
-        self.stop_flag = True
+        self.scheduler.stop()
 
     def start_loop_callback(self,event):
         try:
             self.start_continuous_loop(osw_obj=self.osw_obj)
-            self.continuous_loop_alert.object = (f"Continuous loop started. It will check for open tasks every 2 seconds.")
+            self.continuous_loop_alert.object = (f"Continuous loop started. It checks for open tasks every "
+                                                 f"{self.scheduler.min_interval} to {self.scheduler.max_interval} "
+                                                 f"seconds, depending on how busy it is.")
             self.continuous_loop_alert.alert_type = "success"
         except Exception as e:
             self.continuous_loop_alert.object = (f"Error starting continuous loop: {e}")
@@ -168,13 +259,9 @@ class PseudoColorMixerPanel:
     def stop_loop_callback(self, event):
         self.stop_continuous_loop()
 
-        ## wait for thread to be finished
-        while True:
-            if self.thread is None:
-                break
-            if not self.thread.is_alive():
-                break
-            time.sleep(0.1)
+        ## wait for thread to be finished, the scheduler wakes it up immediately
+        if self.thread is not None:
+            self.thread.join()
         self.continuous_loop_alert.object = (f"Continuous loop stopped. Click on 'Start continuous loop' to start it again.")
         self.continuous_loop_alert.alert_type = "info"
 
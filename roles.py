@@ -0,0 +1,92 @@
+### the panels a process can serve, every role imports its modules when it is built, so a process only loads
+### what it serves (a mixer worker does not load Ax/torch, plotly or scipy)
+from threading import Thread
+from typing import Dict, List
+
+# port of every role, the metrics endpoint is on metrics.DEFAULT_PORT
+ROLE_PORTS: Dict[str, int] = {
+    "mixer": 20200,
+    "visualization": 20201,
+    "optimizer": 20202,
+    "dashboard": 20204,
+}
+ROLES: List[str] = list(ROLE_PORTS)
+
+
+def needs_repository(roles: List[str]) -> bool:
+    """The mixer works without the experiment dataset, every other role reads it."""
+    return any(role != "mixer" for role in roles)
+
+
+def create_repository(osw_obj, experiment_cache=None):
+    """One dataset for all panels of the process, kept current for open pages."""
+    from experiment_repository import ExperimentRepository
+
+    repository = ExperimentRepository(osw_obj, experiment_cache=experiment_cache)
+    repository.start_auto_refresh()
+    return repository
+
+
+def build_mixer(osw_obj, repository=None):
+    from pseudo_color_mixer import PseudoColorMixer
+    from pseudo_color_mixer_panel import PseudoColorMixerPanel
+
+    return PseudoColorMixerPanel(PseudoColorMixer(), osw_obj=osw_obj, repository=repository)
+
+
+def build_visualization(osw_obj, repository=None):
+    from color_database_visualization_panel import ColorDatabaseVisualizationPanel
+
+    return ColorDatabaseVisualizationPanel(osw_obj=osw_obj, repository=repository)
+
+
+def build_optimizer(osw_obj, repository=None):
+    from suggestion_panel import SuggestionPanel
+
+    return SuggestionPanel(osw_obj=osw_obj, repository=repository)
+
+
+def build_dashboard(osw_obj, repository=None):
+    from trace_dashboard_panel import TraceDashboardPanel
+
+    return TraceDashboardPanel(osw_obj=osw_obj, repository=repository)
+
+
+BUILDERS = {
+    "mixer": build_mixer,
+    "visualization": build_visualization,
+    "optimizer": build_optimizer,
+    "dashboard": build_dashboard,
+}
+
+
+def build(role: str, osw_obj, repository=None):
+    """Builds the panel of a role."""
+    return BUILDERS[role](osw_obj, repository)
+
+
+def serve(roles: List[str], osw_obj, repository=None) -> Dict[str, object]:
+    """
+    Builds and serves the panels of the roles, each on its port of ROLE_PORTS.
+
+    Args:
+        roles: names out of ROLES
+        osw_obj: OSW instance
+        repository: shared ExperimentRepository, created if a role needs it
+
+    Returns:
+        dict: panel by role
+    """
+    import panel as pn
+
+    if repository is None and needs_repository(roles):
+        repository = create_repository(osw_obj)
+    panels = {}
+    for role in roles:
+        panels[role] = build(role, osw_obj, repository)
+        pn.serve(panels[role], port=ROLE_PORTS[role], threaded=True)
+    if "optimizer" in roles:
+        # Ax is imported on the first suggestion request, loading it now keeps that request fast
+        from color_optimizer import preload
+        Thread(target=preload, daemon=True, name="optimizer-preload").start()
+    return panels
@@ -0,0 +1,230 @@
+### installs the data models of the wiki schemas only when they changed, with parallel fetching and offline bundles
+import hashlib
+import importlib
+import importlib.metadata
+import json
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from osw.core import OSW
+from osw.wtsite import WtSite
+import osw.model.entity as model
+
+MODEL_DIR = os.path.dirname(os.path.abspath(model.__file__))
+ENTITY_PATH = os.path.join(MODEL_DIR, "entity.py")
+
+
+def file_checksum(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def schema_refs(schema) -> Set[str]:
+    """Titles of the schemas a schema references with $ref, like OSW._fetch_schema resolves them."""
+    refs = set()
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if key == "$ref" and isinstance(value, str) and not value.startswith("#"):
+                refs.add(value.replace("/wiki/", "").split("?")[0].split("#")[0])
+            else:
+                refs |= schema_refs(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            refs |= schema_refs(value)
+    return refs
+
+
+class CachedSchemaInstaller:
+    """
+    Wraps OSW.install_dependencies with a local state of what was installed: the revision and checksum of every
+    schema (the dependencies and everything they reference), the checksum of the generated entity.py and the osw
+    version. install() skips the code generation when one batched revision query shows that nothing changed.
+    Otherwise all schemas are fetched in parallel into the page cache of the site before the generation reads them.
+
+    install_dependencies appends to entity.py and keeps classes that already exist, so changed classes would never
+    be regenerated. The installer keeps a copy of entity.py as it was before the first generation and starts every
+    generation from it.
+    """
+
+    def __init__(self, osw_obj: OSW = None, dependencies: Dict[str, str] = None,
+                 cache_dir: str = ".osw_schema_cache", workers: int = 8):
+        self.osw_obj = osw_obj
+        self.dependencies = dependencies or {}
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.state_path = os.path.join(cache_dir, "state.json")
+        self.base_entity_path = os.path.join(cache_dir, "entity.base.py")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ## state
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, schemas: Dict[str, dict]):
+        state = dict(osw_version=importlib.metadata.version("osw"),
+                     domain=getattr(self.osw_obj, "domain", None),
+                     dependencies=self.dependencies,
+                     schemas=schemas,
+                     entity_sha256=file_checksum(ENTITY_PATH),
+                     installed_at=time.time())
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    def local_state_valid(self, state: dict) -> bool:
+        """True if entity.py is the one generated for the same dependencies with the same osw version."""
+        return (bool(state)
+                and state.get("dependencies") == self.dependencies
+                and state.get("osw_version") == importlib.metadata.version("osw")
+                and state.get("entity_sha256") == file_checksum(ENTITY_PATH)
+                and all(hasattr(model, name) for name in self.dependencies))
+
+    ## remote
+
+    def remote_revisions(self, titles: List[str]) -> Dict[str, Optional[int]]:
+        """Latest revision id of every page with one query per 50 titles (the api limit), None if it is missing."""
+        revisions = {title: None for title in titles}
+        for i in range(0, len(titles), 50):
+            res = self.osw_obj.mw_site.api("query", prop="revisions", titles="|".join(titles[i:i + 50]),
+                                           rvprop="ids", format="json")
+            # the pages are listed by their normalized titles, e.g. with a capitalized first letter
+            requested = {item["to"]: item["from"] for item in res["query"].get("normalized", [])}
+            for page in res["query"]["pages"].values():
+                if page.get("revisions"):
+                    revisions[requested.get(page["title"], page["title"])] = page["revisions"][0]["revid"]
+        return revisions
+
+    def fetch_schemas(self) -> Dict[str, dict]:
+        """
+        Fetches the dependencies and all schemas they reference, level by level with parallel requests.
+        The pages stay in the page cache of the site, so the code generation does not fetch them again.
+
+        Returns:
+            dict: revision id and checksum by schema title
+        """
+        site = self.osw_obj.site
+        site.enable_cache()
+        schemas = {}
+        level = sorted(set(self.dependencies.values()))
+        seen = set(level)
+
+        def fetch(title: str):
+            return site.get_page(WtSite.GetPageParam(titles=[title], raise_warning=False)).pages[0]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while level:
+                next_level = set()
+                # queried before the content, so a schema changed meanwhile is fetched again with the next install
+                revisions = self.remote_revisions(level)
+                for title, page in zip(level, pool.map(fetch, level)):
+                    if page is None or not page.exists:
+                        continue
+                    schema = page.get_slot_content("main" if title.startswith("JsonSchema:") else "jsonschema")
+                    schema_text = json.dumps(schema or {}, sort_keys=True)
+                    schemas[title] = dict(revision=revisions[title],
+                                          sha256=hashlib.sha256(schema_text.encode("utf-8")).hexdigest())
+                    next_level |= schema_refs(schema) - seen
+                seen |= next_level
+                level = sorted(next_level)
+        return schemas
+
+    ## install
+
+    def is_up_to_date(self) -> bool:
+        state = self.load_state()
+        if not self.local_state_valid(state):
+            return False
+        titles = sorted(state["schemas"])
+        try:
+            revisions = self.remote_revisions(titles)
+        except Exception as e:
+            print(f"Could not check the schema revisions, keeping the installed models: {e}")
+            return True
+        changed = [title for title in titles if revisions[title] != state["schemas"][title]["revision"]]
+        if changed:
+            print(f"Changed schemas: {', '.join(changed)}")
+        return not changed
+
+    def install(self, force: bool = False) -> bool:
+        """
+        Installs the dependencies unless the installed models are up to date.
+
+        Returns:
+            bool: True if the models were generated
+        """
+        start = time.perf_counter()
+        if not force and self.is_up_to_date():
+            print(f"Data models are up to date ({time.perf_counter() - start:.1f} s).")
+            return False
+
+        generated = self.load_state().get("entity_sha256") == file_checksum(ENTITY_PATH)
+        if generated and os.path.exists(self.base_entity_path):
+            # start from the entity.py the classes were generated into, so changed classes are replaced
+            shutil.copyfile(self.base_entity_path, ENTITY_PATH)
+            importlib.reload(model)
+        else:
+            # entity.py is not one generated by this installer (e.g. a fresh osw package), it is the new base
+            shutil.copyfile(ENTITY_PATH, self.base_entity_path)
+
+        cache_enabled = self.osw_obj.site.get_cache_enabled()
+        try:
+            schemas = self.fetch_schemas()
+            fetched = time.perf_counter()
+            print(f"Fetched {len(schemas)} schemas in {fetched - start:.1f} s.")
+            self.osw_obj.install_dependencies(self.dependencies)
+        finally:
+            if not cache_enabled:
+                self.osw_obj.site.disable_cache()
+        print(f"Generated the data models in {time.perf_counter() - fetched:.1f} s.")
+        self.save_state(schemas)
+        return True
+
+    ## offline bundles
+
+    def write_bundle(self, path: str):
+        """Writes the generated models, the schema files and the state to a zip file."""
+        state = self.load_state()
+        if not self.local_state_valid(state):
+            raise ValueError("The installed data models were not generated by this installer, install them first.")
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            bundle.write(ENTITY_PATH, "entity.py")
+            bundle.write(self.base_entity_path, "entity.base.py")
+            bundle.write(self.state_path, "state.json")
+            for title in state["schemas"]:
+                schema_path = os.path.join(MODEL_DIR, title.split(":")[-1] + ".json")
+                if os.path.exists(schema_path):
+                    bundle.write(schema_path, os.path.join("schemas", os.path.relpath(schema_path, MODEL_DIR)))
+        print(f"Wrote the data models of {len(state['schemas'])} schemas to {path}.")
+
+    def install_bundle(self, path: str, force: bool = False):
+        """Installs the models of a bundle without contacting the wiki."""
+        with zipfile.ZipFile(path) as bundle:
+            state = json.loads(bundle.read("state.json"))
+            osw_version = importlib.metadata.version("osw")
+            if state["osw_version"] != osw_version and not force:
+                raise ValueError(f"The bundle was generated with osw {state['osw_version']}, "
+                                 f"installed is {osw_version}.")
+            with open(ENTITY_PATH, "wb") as f:
+                f.write(bundle.read("entity.py"))
+            with open(self.base_entity_path, "wb") as f:
+                f.write(bundle.read("entity.base.py"))
+            for name in bundle.namelist():
+                if name.startswith("schemas/") and not name.endswith("/"):
+                    schema_path = os.path.join(MODEL_DIR, os.path.relpath(name, "schemas"))
+                    os.makedirs(os.path.dirname(schema_path), exist_ok=True)
+                    with open(schema_path, "wb") as f:
+                        f.write(bundle.read(name))
+        importlib.reload(model)
+        self.dependencies = state["dependencies"]
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(dict(state, entity_sha256=file_checksum(ENTITY_PATH), installed_at=time.time()), f, indent=2)
+        print(f"Installed the data models of {len(state['schemas'])} schemas from {path}.")
@@ -0,0 +1,111 @@
+### runs suggestion jobs off the UI thread, with progress stages and cancellation
+import itertools
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, Lock
+from typing import Any, Callable
+
+import metrics
+
+_job_ids = itertools.count(1)
+
+JOB_SECONDS = metrics.histogram("suggestion_job_seconds", "Run time of suggestion jobs, by result.")
+JOBS = metrics.counter("suggestion_jobs_total", "Finished suggestion jobs, by result.")
+QUEUED_JOBS = metrics.gauge("suggestion_jobs_queued", "Suggestion jobs waiting for the job runner's thread.")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it reaches a stage after it was cancelled."""
+
+
+class SuggestionJob:
+    """
+    One suggestion request. The work function reports its stages with progress(), which also is the point
+    where a cancelled job stops. Running Ax computations can not be interrupted, so a cancelled job stops at
+    the next stage and its result is never applied.
+    """
+
+    def __init__(self, target_key, on_progress: Callable[["SuggestionJob", str], None] = None):
+        self.job_id = next(_job_ids)
+        self.target_key = target_key
+        self.on_progress = on_progress
+        self.stage = "queued"
+        self.cancel_reason: str = None
+        self.result: Any = None
+        self.error: Exception = None
+        self._cancel_event = Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self.cancelled:
+            self.cancel_reason = reason
+            self._cancel_event.set()
+
+    def progress(self, stage: str):
+        """Enters the next stage. Raises JobCancelled if the job was cancelled."""
+        if self.cancelled:
+            raise JobCancelled(self.cancel_reason)
+        self.stage = stage
+        if self.on_progress is not None:
+            self.on_progress(self, stage)
+
+
+class SuggestionJobRunner:
+    """
+    Runs suggestion jobs one after another on a single worker thread, so the optimizer is only ever used by
+    one job. A new job supersedes the current one: it is cancelled and its result dropped.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggestion-job")
+        self.current_job: SuggestionJob = None
+        self._lock = Lock()
+
+    def submit(self, job: SuggestionJob, work: Callable[[SuggestionJob], Any],
+               on_done: Callable[[SuggestionJob], None] = None) -> Future:
+        """
+        Queues a job. work(job) returns the result, on_done(job) is called from the worker thread when the job
+        finished, failed or was cancelled.
+        """
+        with self._lock:
+            if self.current_job is not None:
+                self.current_job.cancel("superseded by a newer request")
+            self.current_job = job
+        QUEUED_JOBS.inc()
+
+        def run():
+            QUEUED_JOBS.dec()
+            start = time.perf_counter()
+            result = "done"
+            try:
+                job.progress("started")
+                job.result = work(job)
+            except JobCancelled:
+                result = "cancelled"
+            except Exception as e:
+                print(f"Error in suggestion job {job.job_id}: {e}")
+                job.error = e
+                result = "error"
+            finally:
+                JOB_SECONDS.observe(time.perf_counter() - start, result=result)
+                JOBS.inc(result=result)
+                if on_done is not None:
+                    on_done(job)
+
+        return self.executor.submit(run)
+
+    def is_current(self, job: SuggestionJob) -> bool:
+        return job is self.current_job
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancels the current job, if any."""
+        with self._lock:
+            if self.current_job is not None:
+                self.current_job.cancel(reason)
+
+    def shutdown(self):
+        self.cancel("shutdown")
+        self.executor.shutdown(wait=False)
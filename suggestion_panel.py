@@ -1,54 +1,73 @@
 ### a panel that helps to find parameters for the next experiment
-from ax.service.ax_client import AxClient, ObjectiveProperties
-from ax.modelbridge.generation_strategy import GenerationStep, GenerationStrategy
-from ax.modelbridge.factory import Models
-from ax.plot.contour import interact_contour_plotly
-
 import panel as pn
 from osw.model.entity import RGBValue, PseudoColorMixing, PseudoColoredLiquid
 from osw.express import OswExpress
+from osw.core import OSW
+from pseudo_color_mixer import (OPERATION_ERRORS, OPERATION_SECONDS, STORED_ENTITIES, hex_to_rgb_array,
+                                rgb_to_hex_array)
+from color_metrics import METRICS, rate_colors
+from experiment_repository import ExperimentRepository
+from color_optimizer import IncrementalColorOptimizer
+from inverse_solver import solve_hex
+from osw.utils.wiki import get_full_title
+from suggestion_jobs import SuggestionJob, SuggestionJobRunner
+from surrogate_plots import PARAMETER_PAIRS, SurrogatePlotCache, contour_figure
+import numpy as np
 from datetime import datetime
+from functools import partial
+from typing import List
+import experiment_trace
+import metrics
+
+CALLBACK_SECONDS = metrics.histogram("panel_callback_seconds", "Duration of panel callbacks that do work.")
+CALLBACK_ERRORS = metrics.counter("panel_callback_errors_total", "Panel callbacks that raised.")
 
-def color_rating(measured_rgb:RGBValue, target_rgb) -> float:
+def color_rating(measured_rgb:RGBValue, target_rgb, metric: str = "l1") -> float:
     """rates a color based on measured color_mixer_output and ColorOptimizerInput. Lower is better"""
-    target_r = target_rgb.red_value     # Fraunhofer-Green: 0,151,117; Bigmap-Green: 4,92,97
-    target_g = target_rgb.green_value
-    target_b = target_rgb.blue_value
-
-    r = measured_rgb.red_value
-    g = measured_rgb.green_value
-    b = measured_rgb.blue_value
-
-    max_error = 3*255
-    r_error = abs(r-target_r)
-    g_error = abs(g-target_g)
-    b_error = abs(b-target_b)
-
-    rating = sum([r_error, g_error, b_error])/max_error
-    return rating
-
-def hex_to_RGBValue(hex_color: str) -> RGBValue:
-    """Converts a hex color string to an RGBValue object."""
-    hex_color = hex_color.lstrip('#')
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    return RGBValue(red_value=r, green_value=g, blue_value=b)
+    # Fraunhofer-Green: 0,151,117; Bigmap-Green: 4,92,97
+    return float(rate_colors([[measured_rgb.red_value, measured_rgb.green_value, measured_rgb.blue_value]],
+                             [target_rgb.red_value, target_rgb.green_value, target_rgb.blue_value],
+                             metric=metric)[0])
 
 class SuggestionPanel:
-    def __init__(self, osw_obj = None):
+    def __init__(self, osw_obj = None, repository: ExperimentRepository = None):
         self.osw_obj = osw_obj
+        self.repository = repository if repository is not None else ExperimentRepository(osw_obj)
+        self.optimizer = IncrementalColorOptimizer()
+        self.job_runner = SuggestionJobRunner()
+        # the model of the last suggestions, its plots are computed when they are shown
+        self.surrogate_cache = SurrogatePlotCache()
+        self.surrogate_model = None
+        self.observed_fractions = np.zeros((0, 3))
         self.build_panel()
-        self.finished_processes = []
-        self.finished_rgb_values = []
-        self.suggested_process:PseudoColorMixing = None
+        # the closest experiments follow the database without the optimizer
+        self.repository.subscribe(lambda dataset: self.update_nearest_experiments())
+        self.dataset = None
+        self.suggested_processes: List[PseudoColorMixing] = []
+        self.suggested_trial_indices: List[int] = []
+        self.ax_client = None
+        if self.osw_obj is not None:
+            self.repository.refresh_in_background()
 
     def build_panel(self):
 
         self.target_color_picker = pn.widgets.ColorPicker(name="Target Color", value="#009777",width=200)
-      #  self.batch_size_input = pn.widgets.IntInput(name="batch size", value = 1, start = 1)
+        self.metric_select = pn.widgets.Select(name="Rating", options=METRICS, value="l1", width=200)
+        self.batch_size_input = pn.widgets.IntInput(name="batch size", value=1, start=1,
+                                                    end=self.optimizer.max_parallelism, width=200)
       #  self.budget_input = pn.widgets.IntInput(name="budget", value = 10, start = 0)
         self.ploty_panel = pn.pane.Plotly(width=800)
+        self.surrogate_view_select = pn.widgets.Select(name="view", width=200, options={
+            f"{param_x} / {param_y}": i for i, (param_x, param_y) in enumerate(PARAMETER_PAIRS)})
+        self.grid_resolution_input = pn.widgets.IntInput(name="grid resolution", value=30, start=5, end=200,
+                                                         step=5, width=200)
+        self.surrogate_markdown = pn.pane.Markdown("No model yet.")
+        self.surrogate_card = pn.Card(pn.Row(self.surrogate_view_select, self.grid_resolution_input),
+                                      self.surrogate_markdown, self.ploty_panel,
+                                      title="Surrogate model", collapsed=True)
+        for widget, parameter in [(self.surrogate_card, "collapsed"), (self.surrogate_view_select, "value"),
+                                  (self.grid_resolution_input, "value")]:
+            widget.param.watch(lambda event: self.update_surrogate_plot(), parameter)
         self.best_tried_parameters_alert = pn.pane.Alert( "No parameters loaded yet.",
                                                           name= "Best tried parameters",
                                                           alert_type="info")
@@ -56,25 +75,36 @@ class SuggestionPanel:
         #                                                       name="Best predicted parameters",
         #                                                       alert_type="info")
         self.best_tried_parameters = None
-        self.visualization_col = pn.Column(self.target_color_picker,self.ploty_panel,
+        self.gamut_alert = pn.pane.Alert(alert_type="info", width=400)
+        self.update_gamut_alert()
+        self.nearest_experiments_html = pn.pane.HTML(width=400)
+        self.update_nearest_experiments()
+        self.visualization_col = pn.Column(self.target_color_picker, self.gamut_alert, self.metric_select,
+                                           self.nearest_experiments_html, self.surrogate_card,
                                            self.best_tried_parameters_alert,
                                           # self.best_predicted_parameters_alert
                                            )
 
         self.suggestion_text = pn.pane.Alert("No suggestions yet.", alert_type="info")
+        self.timing_markdown = pn.pane.Markdown("")
         self.suggestion_button = pn.widgets.Button(name="Get Suggestion", button_type="primary")
         self.suggestion_button.on_click(self.get_suggestions_callback)
+        self.cancel_button = pn.widgets.Button(name="Cancel", button_type="default", disabled=True)
+        self.cancel_button.on_click(self.cancel_callback)
+        self.target_color_picker.param.watch(self.target_changed_callback, "value")
+        self.metric_select.param.watch(self.target_changed_callback, "value")
 
-        self.execute_suggestion_button = pn.widgets.Button(name="Hand in Suggestion", button_type="primary")
+        self.execute_suggestion_button = pn.widgets.Button(name="Hand in Suggestions", button_type="primary")
         self.execute_suggestion_button.on_click(self.execute_suggestions_callback)
 
         self.suggestion_preview = pn.pane.Alert()
         self.target_color_col = pn.Column(self.target_color_picker,
-                                          #self.batch_size_input,
+                                          self.batch_size_input,
                                           #self.budget_input
                                           )
 
-        self.control_column = pn.Column(self.suggestion_text, self.suggestion_button,
+        self.control_column = pn.Column(self.suggestion_text, self.timing_markdown, self.batch_size_input,
+                                        pn.Row(self.suggestion_button, self.cancel_button),
                                         self.suggestion_preview,
                                         self.execute_suggestion_button)
 
@@ -86,157 +116,224 @@ class SuggestionPanel:
 
 
     def get_inputs_outputs(self):
-        ## query for all PseudoColorMixing processes
-        query = """[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]]
-               |?ShallBeExecuted=execute
-               |?HasRedMixtureFraction=red_fraction
-               |?HasGreenMixtureFraction=green_fraction
-               |?HasBlueMixtureFraction=blue_fraction
-               |?HasOutput.HasColor.HasRedValue=red_value
-               |?HasOutput.HasColor.HasGreenValue=green_value
-               |?HasOutput.HasColor.HasBlueValue=blue_value"""
-        res = self.osw_obj.mw_site.api("ask", query=query, format="json", limit=1000)
-        print(res)
-
-        res_dict = res["query"]["results"]
-
-        ## convert them to PseudoColorMixing objects and RGBValue objects
-
-        self.finished_processes = []
-        self.finished_rgb_values = []
-        for fullpagename, process_dict in res_dict.items():
-            printout_dict = process_dict["printouts"]
-
-            try:
-                process = PseudoColorMixing(
-                    label = [{"language":"en", "text": "a temporary pseudo color mixing process"}],
-                    red_fraction=printout_dict["red_fraction"][0],
-                    green_fraction=printout_dict["green_fraction"][0],
-                    blue_fraction=printout_dict["blue_fraction"][0],
-                    name=fullpagename)
-
-
-                rgb_value = RGBValue(red_value=printout_dict["red_value"][0],
-                                        green_value=printout_dict["green_value"][0],
-                                        blue_value=printout_dict["blue_value"][0],
-                                        name=f"{fullpagename}/HasOutput.HasColor")
-                self.finished_processes.append(process)
-                self.finished_rgb_values.append(rgb_value)
-
-            except Exception as e:
-                print(f"Error processing {fullpagename}: {e}")
-    def get_suggestions_callback(self, event):
-        # get current database
-        self.suggestion_text.object = "Re-Building Database..."
-        self.suggestion_text.alert_type= "warning"
-        #build model
-        gs = GenerationStrategy(
-            steps=[
-               # GenerationStep(
-               #     model=Models.SOBOL,
-               #     num_trials=4,  # how many sobol trials to perform (rule of thumb: 2 * number of params)
-               #     min_trials_observed=3,
-               #     max_parallelism=5,
-               #     model_kwargs={"seed": 999},
-               # ),
-                GenerationStep(
-                    #model=Models.SAASBO, #a bit slow
-                    model=Models.BOTORCH_MODULAR,
-                    num_trials=-1,
-                    max_parallelism=3,
-                    model_kwargs={},
-                ),
-            ]
-        )
-
-        self.ax_client = AxClient(
-            generation_strategy=gs
-            )
-
-        self.ax_client.create_experiment(
-            name="color_mixing_simulation",
-            parameters=[
-                {"name": "red_fraction", "type": "range", "bounds": [0.0, 1.0]},
-                {"name": "green_fraction", "type": "range", "bounds": [0.0, 1.0]},
-                {"name": "blue_fraction", "type": "range", "bounds": [0.0, 1.0]},
-            ],
-            objectives={
-                "rating": ObjectiveProperties(minimize=True),
-            },
-            parameter_constraints=["red_fraction + green_fraction + blue_fraction <= 1.0"]
-        )
-
-        self.get_inputs_outputs()
-
+        ## take the PseudoColorMixing processes from the shared repository, it refreshes them if they are outdated
+        self.dataset = self.repository.get_dataset()
 
+    ## suggestion jobs: computed on the job runner's thread, only finished results are applied on the UI thread
 
+    def _on_ui_thread(self, doc, callback):
+        if doc is None:
+            callback()
+        else:
+            doc.add_next_tick_callback(callback)
 
-        for i, (process, rgb) in enumerate(zip(self.finished_processes, self.finished_rgb_values)):
-            self.ax_client.attach_trial(parameters={"red_fraction": process.red_fraction,
-                                               "green_fraction": process.green_fraction,
-                                               "blue_fraction": process.blue_fraction},
-                                        run_metadata={"uuid": process.uuid}
-                                        )
-            # calculate (new) rating with (old) raw data
-            rating = color_rating(rgb, target_rgb = hex_to_RGBValue(self.target_color_picker.value))
-            self.ax_client.complete_trial(trial_index=i, raw_data={"rating": rating})
-
-
-        self.suggestion_text.object = "Database successfully rebuilt. Getting suggestions with Bayesian Optimization..."
+    def get_suggestions_callback(self, event):
+        doc = pn.state.curdoc
+        job = SuggestionJob(target_key=(self.target_color_picker.value, self.metric_select.value),
+                            on_progress=lambda job, stage: self._on_ui_thread(
+                                doc, partial(self.show_job_progress, job, stage)))
+        self.suggestion_text.object = "Suggestion request queued..."
         self.suggestion_text.alert_type = "warning"
+        self.execute_suggestion_button.disabled = True
+        self.cancel_button.disabled = False
+        self.job_runner.submit(job, partial(self.compute_suggestions, batch_size=self.batch_size_input.value),
+                               on_done=lambda job: self._on_ui_thread(doc, partial(self.apply_suggestions, job)))
+
+    def cancel_callback(self, event):
+        self.job_runner.cancel("cancelled")
+
+    def target_changed_callback(self, event):
+        # a running request rates and fits for the old target, its result is useless now
+        self.job_runner.cancel("target changed")
+        self.update_gamut_alert()
+        self.update_nearest_experiments()
+
+    def update_gamut_alert(self):
+        ## the simulator's inverse tells right away whether the target can be mixed at all
+        solution = solve_hex(self.target_color_picker.value)
+        fractions = ", ".join(f"{name}: {value:.3f}" for name, value in solution.parameters(0).items())
+        if solution.reachable[0]:
+            self.gamut_alert.object = f"Target is reachable in the simulation with {fractions}."
+            self.gamut_alert.alert_type = "success"
+        else:
+            nearest = solution.hex_colors()[0]
+            self.gamut_alert.object = (f"Target is not reachable in the simulation. The nearest reachable color is "
+                                       f"<span style='color:{nearest}'>&#9632;</span> {nearest} "
+                                       f"(RGB distance {solution.distance[0]:.1f}) with {fractions}.")
+            self.gamut_alert.alert_type = "warning"
+
+    def update_nearest_experiments(self, k: int = 5):
+        ## the closest documented experiments from the repository's color index, fast enough for every picker move
+        target_hex = self.target_color_picker.value
+        nearest = self.repository.nearest_experiments(hex_to_rgb_array([target_hex])[0], k=k,
+                                                      metric=self.metric_select.value)
+        if not nearest:
+            self.nearest_experiments_html.object = "No documented experiments yet."
+            return
+        rows = "".join(f"<tr><td><span style='color:{hex_color}'>&#9632;</span> {hex_color}</td>"
+                       f"<td>{experiment['fractions'][0]:.3f} / {experiment['fractions'][1]:.3f} / "
+                       f"{experiment['fractions'][2]:.3f}</td>"
+                       f"<td>{experiment['rating']:.4f}</td><td>{experiment['page']}</td></tr>"
+                       for experiment, hex_color in zip(nearest, rgb_to_hex_array([e["rgb"] for e in nearest])))
+        self.nearest_experiments_html.object = (f"<b>Closest experiments to {target_hex}</b><table>"
+                                                f"<tr><th>color</th><th>red / green / blue</th><th>rating</th>"
+                                                f"<th>page</th></tr>{rows}</table>")
+
+    def show_job_progress(self, job: SuggestionJob, stage: str):
+        if self.job_runner.is_current(job) and not job.cancelled:
+            self.suggestion_text.object = stage
+            self.suggestion_text.alert_type = "warning"
+
+    def compute_suggestions(self, job: SuggestionJob, batch_size: int = 1) -> dict:
+        """Runs on the job runner's thread. Returns everything apply_suggestions needs."""
+        # Ax is loaded by the first request, see color_optimizer
+        from ax.exceptions.generation_strategy import MaxParallelismReachedException
+
+        target_hex, metric = job.target_key
+        # the experiment lives as long as the target color and metric, a new one of them starts a new experiment
+        if self.optimizer.set_target(job.target_key):
+            # the analytic solution for the simulator is the first suggestion for a new target
+            self.optimizer.set_seed_candidate(solve_hex(target_hex).parameters(0))
+
+        job.progress("Updating Database...")
+        self.get_inputs_outputs()
 
-        # get suggestions using bayesian optimization from ax-platform
-        #self.suggestion_dict, completed = self.ax_client.get_next_trials(max_trials = self.batch_size_input.value)
-        self.parametrization, completed = self.ax_client.get_next_trial()
-
-        # visualize the model belief:
-        self.contour_plot = self.ax_client.get_contour_plot(param_x="red_fraction", param_y="green_fraction",
-                                                  metric_name="rating")
+        # calculate (new) ratings with (old) raw data, only for experiments that are not attached yet
+        job.progress("Rating new experiments...")
+        target_rgb = hex_to_rgb_array([target_hex])[0]
+        new_indices = self.optimizer.unseen_pages(self.dataset.pages)
+        self.optimizer.attach(pages=[self.dataset.pages[i] for i in new_indices],
+                              fractions=self.dataset.fractions[new_indices].tolist(),
+                              ratings=rate_colors(self.dataset.rgb[new_indices], target_rgb, metric=metric).tolist())
+
+        # get suggestions using bayesian optimization from ax-platform, the whole batch in one request
+        job.progress("Database successfully updated. Fitting the model...")
+        self.optimizer.fit()
+        job.progress("Optimizing the acquisition function...")
+        try:
+            suggestion_dict = self.optimizer.generate(n=batch_size)
+        except MaxParallelismReachedException:
+            return dict(max_parallelism_reached=True)
+
+        # the model belief is only plotted when the surrogate view is opened, see update_surrogate_plot
+        job.progress("Finishing...")
+        return dict(max_parallelism_reached=False,
+                    batch_size=batch_size,
+                    attached=len(new_indices),
+                    timings=dict(self.optimizer.timings),
+                    suggestion_dict=suggestion_dict,
+                    # None without experiments for the target, then only the seed candidate is suggested
+                    model=self.optimizer.ax_client.generation_strategy.model,
+                    observed_fractions=self.optimizer.observed_fractions(),
+                    best_tried_parameters=self.optimizer.best_tried_parameters())
+
+    def keep_live_suggestions(self):
+        """
+        After a request without new suggestions, the previous ones can still be handed in if their trials are live.
+        generate() abandons the trials that were not handed in, and Ax only completes running trials.
+        """
+        live = (self.ax_client is self.optimizer.ax_client
+                and set(self.suggested_trial_indices) <= set(self.optimizer.generated_trials))
+        if not live:
+            self.suggested_processes = []
+            self.suggested_trial_indices = []
+            self.suggestion_preview.object = "The previous suggestions were dropped, get new ones."
+        self.execute_suggestion_button.disabled = not self.suggested_processes
+
+    def apply_suggestions(self, job: SuggestionJob):
+        """Runs on the UI thread when a job is done."""
+        if not self.job_runner.is_current(job):
+            # superseded by a newer request, which updates the panel itself
+            return
+        self.cancel_button.disabled = True
+        if job.cancelled:
+            self.suggestion_text.object = f"Suggestion request dropped: {job.cancel_reason}."
+            self.suggestion_text.alert_type = "info"
+            self.keep_live_suggestions()
+            return
+        if job.error is not None:
+            self.suggestion_text.object = f"Error getting suggestions: {job.error}"
+            self.suggestion_text.alert_type = "danger"
+            self.keep_live_suggestions()
+            return
+        result = job.result
+        if result["max_parallelism_reached"]:
+            self.suggestion_text.object = (f"{self.optimizer.max_parallelism} handed in suggestions are still waiting "
+                                           f"for execution. Execute them before asking for new ones.")
+            self.suggestion_text.alert_type = "danger"
+            self.keep_live_suggestions()
+            return
+        self.execute_suggestion_button.disabled = False
 
-        self.plotly_fig = interact_contour_plotly(
-            model = self.ax_client.generation_strategy.model,
-            metric_name = "rating",
-        )
+        self.ax_client = self.optimizer.ax_client
+        self.suggestion_dict = result["suggestion_dict"]
+        timings = result["timings"]
+        self.timing_markdown.object = (f"attached {result['attached']} new experiments in "
+                                       f"{timings['attach']:.2f} s, "
+                                       f"model fit: {timings['fit']:.2f} s, "
+                                       f"generation: {timings['generate']:.2f} s")
 
-        self.ploty_panel.object = self.plotly_fig
-        print("type of fig_r_g:", type(self.plotly_fig))
         # format suggested processes
 
-        self.suggested_process = PseudoColorMixing(
+        self.suggested_trial_indices = list(self.suggestion_dict)
+        self.suggested_processes = [PseudoColorMixing(
                 label = [{"language":"en", "text": f"Pseudo Color Mixing Suggested by Bayesian Optimizer "
                                                    f"{datetime.now()}"}],
-                red_fraction=self.parametrization["red_fraction"],
-                green_fraction=self.parametrization["green_fraction"],
-                blue_fraction=self.parametrization["blue_fraction"],
+                red_fraction=parametrization["red_fraction"],
+                green_fraction=parametrization["green_fraction"],
+                blue_fraction=parametrization["blue_fraction"],
                 execution_trigger=True
-            )
-
-
-
-        self.suggestion_text.object = "Suggestions successfully generated."
+            ) for parametrization in self.suggestion_dict.values()]
+        for suggested_process in self.suggested_processes:
+            experiment_trace.record(suggested_process, "suggested")
+
+        if len(self.suggested_processes) < result["batch_size"]:
+            self.suggestion_text.object = (f"Only {len(self.suggested_processes)} suggestions generated, "
+                                           f"handed in suggestions are still waiting for execution.")
+        else:
+            self.suggestion_text.object = "Suggestions successfully generated."
         self.suggestion_text.alert_type = "success"
-        self.suggestion_preview.object = str(f"suggestd process: "
-                                             f"<br>red_fraction = "
-                                             f" {self.suggested_process.red_fraction} <br>"
-                                             f"green_fraction = "
-                                                f" {self.suggested_process.green_fraction} <br>"
-                                                f"blue_fraction = "
-                                                f" {self.suggested_process.blue_fraction} <br>"
-                                             )
-
-        self.best_tried_parameters = self.ax_client.get_best_parameters(
-            use_model_predictions=False
-        )
-        self.best_tried_parameters_alert.object = (f"Best tried parameters so far: {self.best_tried_parameters[0]} ")
+        self.suggestion_preview.object = "<br>".join(f"suggested process {i + 1}: "
+                                                     f"<br>red_fraction = "
+                                                     f" {suggested_process.red_fraction} <br>"
+                                                     f"green_fraction = "
+                                                     f" {suggested_process.green_fraction} <br>"
+                                                     f"blue_fraction = "
+                                                     f" {suggested_process.blue_fraction} <br>"
+                                                     for i, suggested_process in enumerate(self.suggested_processes))
+
+        self.best_tried_parameters = result["best_tried_parameters"]
+        self.best_tried_parameters_alert.object = (f"Best tried parameters so far: {self.best_tried_parameters} ")
         self.best_tried_parameters_alert.alert_type = "success"
 
+        self.surrogate_model = result["model"]
+        self.observed_fractions = np.array(result["observed_fractions"]).reshape(-1, 3)
+        self.update_surrogate_plot()
+
     #   self.best_predicted_parameters_alert.object = (f"Best predicted parameters so far:
     #   {self.best_predicted_parameters[0]}")
     #    self.best_predicted_parameters_alert.alert_type="success"
 
 
+    @CALLBACK_SECONDS.time(CALLBACK_ERRORS, panel="suggestion", callback="surrogate_plot")
+    def update_surrogate_plot(self):
+        ## predicts the grid only when the plot is visible, grids of the current model come from the cache
+        if self.surrogate_card.collapsed:
+            return
+        if self.surrogate_model is None:
+            self.surrogate_markdown.object = "No model yet, get suggestions first."
+            self.ploty_panel.object = None
+            return
+        grid, cached = self.surrogate_cache.get_grid(self.surrogate_model,
+                                                     resolution=self.grid_resolution_input.value,
+                                                     slice_parameters=self.best_tried_parameters)
+        self.ploty_panel.object = contour_figure(grid, self.surrogate_view_select.value, self.observed_fractions)
+        self.surrogate_markdown.object = (f"{grid.resolution}x{grid.resolution} grid per view, "
+                                          + ("cached" if cached else f"predicted in {grid.predict_time:.2f} s"))
+
+    @CALLBACK_SECONDS.time(CALLBACK_ERRORS, panel="suggestion", callback="execute_suggestions")
     def execute_suggestions(self):
-        if self.suggested_process is None:
+        if not self.suggested_processes:
             self.suggestion_text.object = "No suggestions to execute."
             self.suggestion_text.alert_type = "danger"
             return
@@ -244,7 +341,23 @@ class SuggestionPanel:
         self.suggestion_text.object = "Uploading suggestions ..."
         self.suggestion_text.alert_type = "warning"
 
-        self.osw_obj.store_entity(self.suggested_process)
+        # hand in the whole batch with one store_entity call
+        for suggested_process in self.suggested_processes:
+            experiment_trace.record(suggested_process, "stored")
+        with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="store"):
+            self.osw_obj.store_entity(OSW.StoreEntityParam(entities=self.suggested_processes))
+        STORED_ENTITIES.inc(len(self.suggested_processes))
+        pages = [get_full_title(suggested_process) for suggested_process in self.suggested_processes]
+        for trial_index, page in zip(self.suggested_trial_indices, pages):
+            self.optimizer.hand_in(trial_index, page)
+        self.repository.add_pending_experiments(pages,
+                                                [[suggested_process.red_fraction,
+                                                  suggested_process.green_fraction,
+                                                  suggested_process.blue_fraction]
+                                                 for suggested_process in self.suggested_processes])
+        # a second click must not hand in the same batch again
+        self.suggested_processes = []
+        self.suggested_trial_indices = []
 
         self.suggestion_text.object = "Suggestions successfully uploaded"
         self.suggestion_text.alert_type = "success"
@@ -0,0 +1,133 @@
+### contour plots of the surrogate model, predicted on a grid only when they are shown and cached per fitted model
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+import numpy as np
+
+from color_optimizer import PARAMETER_NAMES
+
+# Ax and plotly are imported when a surrogate is first predicted and plotted
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+    from ax.modelbridge.base import ModelBridge
+
+# the views of the three dimensional parameter space, the third fraction is fixed at a slice value
+PARAMETER_PAIRS: List[Tuple[str, str]] = [("red_fraction", "green_fraction"),
+                                          ("red_fraction", "blue_fraction"),
+                                          ("green_fraction", "blue_fraction")]
+
+
+class SurrogateGrid:
+    """Predicted mean and standard error of the surrogate on a grid for every parameter pair."""
+
+    def __init__(self, resolution: int, slice_parameters: Dict[str, float], mean: np.ndarray, sem: np.ndarray,
+                 predict_time: float):
+        self.resolution = resolution
+        self.slice_parameters = slice_parameters
+        self.axis = np.linspace(0, 1, resolution)
+        # shape (pairs, resolution (y), resolution (x)), nan where the fractions add up to more than 1
+        self.mean = mean
+        self.sem = sem
+        self.predict_time = predict_time
+
+
+def predict_grid(model: "ModelBridge", resolution: int = 30, slice_parameters: Dict[str, float] = None,
+                 metric_name: str = "rating") -> SurrogateGrid:
+    """
+    Predicts the metric on a resolution x resolution grid for every parameter pair with one batched call of the
+    model. Grid points outside the constraint (fractions add up to more than 1) are not predicted.
+
+    Args:
+        model: fitted model, e.g. generation_strategy.model
+        resolution: grid points per axis
+        slice_parameters: values of the fraction that is not plotted, defaults to 0
+        metric_name: predicted metric
+
+    Returns:
+        SurrogateGrid: mean and sem per pair
+    """
+    from ax.core.observation import ObservationFeatures
+
+    slice_parameters = {name: 0.0 for name in PARAMETER_NAMES} | (slice_parameters or {})
+    axis = np.linspace(0, 1, resolution)
+    grid_x, grid_y = np.meshgrid(axis, axis)
+    fractions = np.zeros((len(PARAMETER_PAIRS), resolution, resolution, len(PARAMETER_NAMES)))
+    for pair_index, (param_x, param_y) in enumerate(PARAMETER_PAIRS):
+        for i, name in enumerate(PARAMETER_NAMES):
+            fractions[pair_index, :, :, i] = (grid_x if name == param_x else grid_y if name == param_y
+                                              else slice_parameters[name])
+    feasible = fractions.sum(axis=-1) <= 1 + 1e-9
+    features = [ObservationFeatures(parameters=dict(zip(PARAMETER_NAMES, row)))
+                for row in fractions[feasible].tolist()]
+    mean = np.full(feasible.shape, np.nan)
+    sem = np.full(feasible.shape, np.nan)
+    start = time.perf_counter()
+    if features:
+        means, covariances = model.predict(features)
+        mean[feasible] = means[metric_name]
+        sem[feasible] = np.sqrt(covariances[metric_name][metric_name])
+    return SurrogateGrid(resolution, slice_parameters, mean, sem, time.perf_counter() - start)
+
+
+class SurrogatePlotCache:
+    """
+    Keeps the grids of the last few fitted models. Ax creates a new model object with every fit, so the
+    model object identifies the model version.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._grids: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get_grid(self, model: "ModelBridge", resolution: int = 30,
+                 slice_parameters: Dict[str, float] = None) -> Tuple[SurrogateGrid, bool]:
+        """Returns the grid and whether it came from the cache."""
+        key = (id(model), resolution, tuple(sorted((slice_parameters or {}).items())))
+        with self._lock:
+            entry = self._grids.get(key)
+            # the model is kept in the entry, so its id can not be reused by another one
+            if entry is not None and entry[0] is model:
+                self._grids.move_to_end(key)
+                return entry[1], True
+        grid = predict_grid(model, resolution=resolution, slice_parameters=slice_parameters)
+        with self._lock:
+            self._grids[key] = (model, grid)
+            while len(self._grids) > self.max_entries:
+                self._grids.popitem(last=False)
+        return grid, False
+
+
+def contour_figure(grid: SurrogateGrid, pair_index: int = 0, observed: np.ndarray = None) -> "go.Figure":
+    """
+    Mean and standard error of the surrogate for one parameter pair, with the observed experiments on top.
+
+    Args:
+        grid: predicted grid
+        pair_index: index in PARAMETER_PAIRS
+        observed: (N, 3) fractions of the experiments the model was fitted on
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    param_x, param_y = PARAMETER_PAIRS[pair_index]
+    sliced = [f"{name} = {value:.2f}" for name, value in grid.slice_parameters.items()
+              if name not in (param_x, param_y)]
+    fig = make_subplots(rows=1, cols=2, subplot_titles=["predicted rating", "standard error"],
+                        horizontal_spacing=0.15)
+    fig.add_trace(go.Contour(x=grid.axis, y=grid.axis, z=grid.mean[pair_index], colorscale="Viridis",
+                             colorbar=dict(x=0.43)), row=1, col=1)
+    fig.add_trace(go.Contour(x=grid.axis, y=grid.axis, z=grid.sem[pair_index], colorscale="Plasma",
+                             colorbar=dict(x=1.0)), row=1, col=2)
+    if observed is not None and len(observed):
+        x, y = observed[:, PARAMETER_NAMES.index(param_x)], observed[:, PARAMETER_NAMES.index(param_y)]
+        for col in (1, 2):
+            fig.add_trace(go.Scatter(x=x, y=y, mode="markers", showlegend=False, hoverinfo="skip",
+                                     marker=dict(color="white", size=5, line=dict(color="black", width=1))),
+                          row=1, col=col)
+    fig.update_xaxes(title=param_x, range=[0, 1])
+    fig.update_yaxes(title=param_y, range=[0, 1])
+    fig.update_layout(title=f"slice at {', '.join(sliced)}", height=450)
+    return fig
@@ -0,0 +1,311 @@
+### executes all open PseudoColorMixing tasks as a pipeline of mixing, rendering, upload and storage
+import time
+from queue import Queue
+from threading import Lock, Thread
+from typing import Callable, Dict, List
+
+from osw.core import OSW
+from osw.express import OswExpress
+from osw.model.entity import PseudoColorMixing
+import experiment_trace
+import metrics
+from pseudo_color_mixer import (OPERATION_ERRORS, OPERATION_SECONDS, STORED_ENTITIES, PseudoColorMixer,
+                                ColorMixerInput)
+from task_leases import LeaseClaimer, LeaseLostError, by_title, clear_lease
+from task_quarantine import TaskQuarantine
+from task_polling import AdaptivePollingScheduler, get_shared_open_task_query
+
+STAGES = ("mix", "render", "upload", "store")
+
+DEFAULT_CONCURRENCY = {
+    "mix": 1,       # cpu bound and fast
+    "render": 1,    # cached, fast
+    "upload": 4,    # one http round trip per task
+    "store": 4,     # one http round trip per task
+}
+
+STAGE_SECONDS = metrics.histogram("task_pipeline_stage_seconds", "Service time of a task in a pipeline stage.")
+STAGE_TASKS = metrics.counter("task_pipeline_tasks_total", "Tasks that left a pipeline stage, by result.")
+QUEUE_DEPTH = metrics.gauge("task_pipeline_queue_depth", "Tasks waiting in front of a pipeline stage.")
+TASKS_PER_MINUTE = metrics.gauge("task_pipeline_tasks_per_minute",
+                                 "Tasks per minute a pipeline stage processed since its workers started.")
+
+
+class StageCounter:
+    """Throughput counters of one pipeline stage."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+        self._lock = Lock()
+
+    def record(self, duration: float, error: bool = False):
+        with self._lock:
+            self.busy_time += duration
+            if error:
+                self.errors += 1
+            else:
+                self.processed += 1
+
+    def snapshot(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        return dict(stage=self.name,
+                    workers=self.workers,
+                    processed=self.processed,
+                    errors=self.errors,
+                    tasks_per_second=self.processed / elapsed if elapsed > 0 else 0.0,
+                    mean_service_time=self.busy_time / max(self.processed + self.errors, 1))
+
+
+class PipelineTask:
+    """A PseudoColorMixing task on its way through the pipeline."""
+
+    def __init__(self, title: str, process: PseudoColorMixing):
+        self.title = title
+        self.process = process
+        self.input: ColorMixerInput = None
+        self.rgb_value = None
+        self.svg_bytes: bytes = None
+        self.image_title: str = None
+
+
+class PipelinedTaskExecutor:
+    """
+    Fetches all open tasks with one batched load_entity call and runs mixing, SVG rendering, file upload
+    and entity storage as overlapping stages. Each stage has its own bounded queue and a fixed number of
+    worker threads, so the total number of threads is the sum of the configured concurrencies.
+    With a BulkDocumenter, the store stage spools the results and the upload happens with its bulk flushes.
+    With a LeaseClaimer, tasks are claimed with a lease before they enter the pipeline, so several executors
+    (on several machines) share the open tasks without executing one twice.
+    With a TaskQuarantine, a task that fails in a stage backs off before it is tried again and is quarantined
+    after too many attempts.
+    """
+
+    def __init__(self, color_mixer: PseudoColorMixer, osw_obj: OSW, concurrency: Dict[str, int] = None,
+                 queue_size: int = 32, on_task_done: Callable[[PipelineTask], None] = None, documenter=None,
+                 claimer: LeaseClaimer = None, quarantine: TaskQuarantine = None):
+        self.color_mixer = color_mixer
+        self.osw_obj = osw_obj
+        self.documenter = documenter
+        self.claimer = claimer
+        self.quarantine = quarantine
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.queue_size = queue_size
+        self.on_task_done = on_task_done
+        self.open_task_query = get_shared_open_task_query(osw_obj)
+        self.scheduler = AdaptivePollingScheduler()
+        self.counters: Dict[str, StageCounter] = {}
+        self.queues: Dict[str, Queue] = {}
+        self.workers: List[Thread] = []
+        self.thread: Thread = None
+        self._stage_functions = {
+            "mix": self._mix,
+            "render": self._render,
+            "upload": self._upload,
+            "store": self._store,
+        }
+
+    ## stages
+
+    def _mix(self, task: PipelineTask):
+        task.input = ColorMixerInput(red_fraction=task.process.red_fraction,
+                                     green_fraction=task.process.green_fraction,
+                                     blue_fraction=task.process.blue_fraction)
+        task.rgb_value = self.color_mixer.mix(task.input)
+        experiment_trace.record(task.process, "mixed")
+
+    def _render(self, task: PipelineTask):
+        task.svg_bytes = self.color_mixer.render_beaker(task.rgb_value)
+
+    def _upload(self, task: PipelineTask):
+        if self.documenter is not None:
+            return
+        beaker_image_wf = self.color_mixer.create_beaker_image_file(self.osw_obj)
+        task.image_title = self.color_mixer.upload_beaker_image(beaker_image_wf, task.svg_bytes)
+        experiment_trace.record(task.process, "uploaded")
+
+    def _store(self, task: PipelineTask):
+        if self.claimer is not None and not self.claimer.holds(task.process):
+            raise LeaseLostError(f"another worker claimed {task.title}")
+        if self.documenter is not None:
+            # the documenter checks the lease again before its flush and removes it
+            self.documenter.submit(task.input, task.rgb_value, task.svg_bytes, process_instance=task.process)
+            return
+        clear_lease(task.process)
+        process_instance, output_instance = self.color_mixer.create_documentation_entities(
+            task.input, task.rgb_value, task.image_title, process_instance=task.process)
+        experiment_trace.record(process_instance, "documented")
+        with OPERATION_SECONDS.time(OPERATION_ERRORS, operation="store"):
+            self.osw_obj.store_entity(OSW.StoreEntityParam(entities=[process_instance, output_instance],
+                                                           overwrite=True))
+        STORED_ENTITIES.inc(2)
+        experiment_trace.observe(process_instance)
+
+    ## pipeline
+
+    def _worker(self, stage_index: int):
+        stage = STAGES[stage_index]
+        in_queue = self.queues[stage]
+        out_queue = self.queues[STAGES[stage_index + 1]] if stage_index + 1 < len(STAGES) else None
+        while True:
+            task = in_queue.get()
+            if task is None:
+                in_queue.task_done()
+                return
+            start = time.perf_counter()
+            try:
+                self._stage_functions[stage](task)
+            except Exception as e:
+                duration = time.perf_counter() - start
+                self.counters[stage].record(duration, error=True)
+                STAGE_SECONDS.observe(duration, stage=stage)
+                STAGE_TASKS.inc(stage=stage, result="error")
+                print(f"Error in stage '{stage}' for {task.title}: {e}")
+                # a lost lease is not a failure of the task, another worker executes it
+                if self.quarantine is not None and not isinstance(e, LeaseLostError):
+                    self.quarantine.record_failure(task.title, e)
+                self.open_task_query.release(task.title)
+            else:
+                duration = time.perf_counter() - start
+                self.counters[stage].record(duration)
+                STAGE_SECONDS.observe(duration, stage=stage)
+                STAGE_TASKS.inc(stage=stage, result="done")
+                if out_queue is not None:
+                    out_queue.put(task)
+                else:
+                    # a spooled task is released by the documenter once its flush stored it
+                    if self.documenter is None:
+                        self.open_task_query.release(task.title)
+                    if self.on_task_done is not None:
+                        self.on_task_done(task)
+            finally:
+                in_queue.task_done()
+
+    def start_workers(self):
+        if self.workers:
+            return
+        self.counters = {stage: StageCounter(stage, self.concurrency[stage]) for stage in STAGES}
+        self.queues = {stage: Queue(maxsize=self.queue_size) for stage in STAGES}
+        for stage in STAGES:
+            QUEUE_DEPTH.set_function(self.queues[stage].qsize, stage=stage)
+            TASKS_PER_MINUTE.set_function(
+                lambda counter=self.counters[stage]: counter.snapshot()["tasks_per_second"] * 60, stage=stage)
+        for stage_index, stage in enumerate(STAGES):
+            for _ in range(self.concurrency[stage]):
+                worker = Thread(target=self._worker, args=(stage_index,), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def stop_workers(self):
+        if not self.workers:
+            return
+        for stage in STAGES:
+            for _ in range(self.concurrency[stage]):
+                self.queues[stage].put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def fetch_open_tasks(self) -> List[PipelineTask]:
+        """
+        Loads all open tasks that are not in progress in this process with one batched call. With a claimer only
+        the tasks it claimed.
+        """
+        titles = self.open_task_query.take_all()
+        if not titles:
+            return []
+        try:
+            if self.claimer is not None:
+                # the claimed tasks are loaded with their lease, the others are left to other workers
+                claimed = self.claimer.claim(titles)
+                for title in titles:
+                    if title not in claimed:
+                        self.open_task_query.release(title)
+                titles = list(claimed)
+                processes = claimed
+            else:
+                # load_entity leaves out entities it could not load, so they are matched by title
+                processes = by_title(self.osw_obj.load_entity(OSW.LoadEntityParam(titles=titles)).entities)
+        except Exception:
+            for title in titles:
+                self.open_task_query.release(title)
+            raise
+        tasks = []
+        loaded = time.time()
+        for title in titles:
+            process = processes.get(title)
+            if process is None:
+                print(f"Could not load {title}")
+                self.open_task_query.release(title)
+                continue
+            experiment_trace.record(process, "detected", self.open_task_query.detected_at(title))
+            experiment_trace.record(process, "loaded", loaded)
+            tasks.append(PipelineTask(title, process))
+        return tasks
+
+    def run_batch(self) -> int:
+        """
+        Runs all currently open tasks through the pipeline and waits until they are finished.
+
+        Returns:
+            int: number of tasks that entered the pipeline
+        """
+        self.start_workers()
+        tasks = self.fetch_open_tasks()
+        for task in tasks:
+            self.queues[STAGES[0]].put(task)
+        # every stage hands its tasks on before marking them done, so joining in order waits for all of them
+        for stage in STAGES:
+            self.queues[stage].join()
+        return len(tasks)
+
+    def continuous_loop(self):
+        while not self.scheduler.stopped:
+            try:
+                found = self.run_batch()
+            except Exception as e:
+                print("Error fetching open tasks:", e)
+                found = 0
+            if found > 0:
+                self.scheduler.work_found()
+            else:
+                self.scheduler.wait_idle()
+
+    def start_continuous_loop(self):
+        if self.thread is not None and self.thread.is_alive():
+            print("Thread is already running.")
+            return
+        self.scheduler.reset()
+        self.start_workers()
+        self.thread = Thread(target=self.continuous_loop)
+        self.thread.start()
+
+    def stop_continuous_loop(self):
+        self.scheduler.stop()
+        if self.thread is not None:
+            self.thread.join()
+        self.stop_workers()
+
+    def stats(self) -> List[Dict]:
+        """Returns throughput counters and queue depths of all stages."""
+        return [dict(**self.counters[stage].snapshot(), queue_depth=self.queues[stage].qsize())
+                for stage in STAGES if stage in self.counters]
+
+
+if __name__ == '__main__':
+    osw_obj = OswExpress(
+        # domain="demo.open-semantic-lab.org"
+        # domain = "mat-o-lab.open-semantic-lab.org",
+        domain="wiki-dev.open-semantic-lab.org"
+    )
+    executor = PipelinedTaskExecutor(PseudoColorMixer(), osw_obj, concurrency={"upload": 8, "store": 8})
+    start = time.perf_counter()
+    n_tasks = executor.run_batch()
+    print(f"executed {n_tasks} tasks in {time.perf_counter() - start:.1f} s")
+    for stage_stats in executor.stats():
+        print(stage_stats)
+    executor.stop_workers()
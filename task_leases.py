@@ -0,0 +1,198 @@
+### leases on PseudoColorMixing tasks, stored as statements of the process, so workers on several machines do not
+### execute the same task twice
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from osw.core import OSW
+from osw.model.entity import DataStatement
+from osw.utils.wiki import get_full_title
+
+import metrics
+
+LEASE_OWNER_PROPERTY = "HasLeaseOwner"
+LEASE_EXPIRY_PROPERTY = "HasLeaseExpiry"
+
+CLAIMS = metrics.counter("task_lease_claims_total", "Tasks a worker tried to claim, by result.")
+
+
+class LeaseLostError(Exception):
+    """The lease of a task expired and another worker claimed it."""
+
+
+def new_owner_id() -> str:
+    """An id of this worker that is unique across machines and restarts."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+## statements
+
+def _property(statement) -> str:
+    # loaded without a model the statements are dicts
+    return statement.get("property") if isinstance(statement, dict) else getattr(statement, "property", None)
+
+
+def get_statement(process, prop: str) -> Optional[str]:
+    """The value of the data statement with property prop, None if the process has none."""
+    for statement in process.statements or []:
+        if _property(statement) == prop:
+            return statement["value"] if isinstance(statement, dict) else statement.value
+    return None
+
+
+def set_statements(process, values: Dict[str, Optional[str]]):
+    """Replaces the data statements of the properties in values, a value of None removes the statement."""
+    statements = [statement for statement in (process.statements or []) if _property(statement) not in values]
+    process.statements = statements + [DataStatement(property=prop, value=value)
+                                       for prop, value in values.items() if value is not None]
+
+
+def by_title(entities: list) -> Dict[str, object]:
+    """
+    Maps the full title (namespace:title of meta.wiki_page) to each loaded entity. load_entity leaves out
+    entities whose schema could not be fetched, so its result is not aligned with the requested titles.
+    """
+    return {get_full_title(entity): entity for entity in entities if entity is not None}
+
+
+def load_uncached(osw_obj: OSW, titles: List[str]) -> Dict[str, object]:
+    """
+    Loads entities as they are on the wiki now. With osw 0.33, LoadEntityParam(disable_cache=True) turns the
+    page cache on for the call when it is off, so a page that was loaded before would come from the cache.
+    The titles are dropped from the page cache before (and after) the call.
+
+    Returns:
+        dict: loaded entity by full title, titles that could not be loaded are missing
+    """
+    page_cache = getattr(osw_obj.site, "_page_cache", None)
+    if page_cache is not None:
+        for title in titles:
+            page_cache.pop(title, None)
+    try:
+        return by_title(osw_obj.load_entity(OSW.LoadEntityParam(titles=titles, disable_cache=True)).entities)
+    finally:
+        if page_cache is not None:
+            for title in titles:
+                page_cache.pop(title, None)
+
+
+## leases
+
+def read_lease(process) -> Tuple[Optional[str], float]:
+    """
+    Returns:
+        tuple: owner and expiry (unix time) of the lease, (None, 0.0) if the process has none
+    """
+    owner = get_statement(process, LEASE_OWNER_PROPERTY)
+    expiry = get_statement(process, LEASE_EXPIRY_PROPERTY)
+    try:
+        return owner, datetime.fromisoformat(expiry).timestamp() if expiry else 0.0
+    except ValueError:
+        return owner, 0.0
+
+
+def write_lease(process, owner: str, expires: float):
+    set_statements(process, {LEASE_OWNER_PROPERTY: owner,
+                             LEASE_EXPIRY_PROPERTY: datetime.fromtimestamp(expires, tz=timezone.utc).isoformat()})
+
+
+def clear_lease(process):
+    """Removes the lease, e.g. before the documented process is stored."""
+    set_statements(process, {LEASE_OWNER_PROPERTY: None, LEASE_EXPIRY_PROPERTY: None})
+
+
+class LeaseClaimer:
+    """
+    Claims tasks for one worker by writing a lease (owner and expiry) to the PseudoColorMixing entity.
+    The wiki has no compare-and-swap, so a claim writes the leases of a batch with one store_entity call, waits
+    and reads them back uncached: the worker that wrote last owns the task. This is not mutual exclusion. The
+    wait is twice the slowest recent load and store of this worker, at least settle seconds, and a worker whose
+    load and store take longer than that can overwrite a lease that was already read back. Then both execute
+    the task. holds() checks the lease on the wiki again right before the documentation is stored, so the
+    second one usually finds out before documenting, but duplicates are unlikely rather than impossible.
+    A live lease is never claimed, also not one of this worker, whose task is still in progress (e.g. spooled
+    for documentation). A lease that expired is claimed again, e.g. the one of a worker that crashed. Leases
+    compare the clocks of different machines, so duration has to be much larger than their offset.
+    With a TaskQuarantine, tasks that failed are not claimed before their back-off passed.
+    """
+
+    def __init__(self, osw_obj: OSW, owner: str = None, duration: float = 60.0, settle: float = 1.0,
+                 max_claims: int = 8, quarantine=None):
+        self.osw_obj = osw_obj
+        self.owner = owner or new_owner_id()
+        self.duration = duration
+        self.settle = settle
+        self.max_claims = max_claims
+        self.quarantine = quarantine
+        # slowest recent time from loading a batch until its leases were written
+        self.write_window = 0.0
+        # tasks that are leased or backing off, they are not loaded again before the time
+        self._skip_until: Dict[str, float] = {}
+
+    def _load(self, titles: List[str]) -> Dict[str, object]:
+        return load_uncached(self.osw_obj, titles)
+
+    def claim(self, titles: List[str]) -> Dict[str, object]:
+        """
+        Claims up to max_claims of the tasks, in a random order so workers start with different ones.
+
+        Args:
+            titles: titles of open tasks
+
+        Returns:
+            dict: claimed process by title
+        """
+        now = time.time()
+        self._skip_until = {title: until for title, until in self._skip_until.items() if until > now}
+        candidates = [title for title in titles if title not in self._skip_until
+                      and (self.quarantine is None or self.quarantine.not_before(title) <= now)]
+        candidates = random.sample(candidates, min(len(candidates), self.max_claims))
+        if not candidates:
+            return {}
+
+        loaded = time.monotonic()
+        claimed = []
+        processes = self._load(candidates)
+        for title in candidates:
+            process = processes.get(title)
+            # documented since the query ran
+            if process is None or not getattr(process, "execution_trigger", True):
+                continue
+            owner, expiry = read_lease(process)
+            if owner is not None and expiry > now:
+                self._skip_until[title] = expiry
+                CLAIMS.inc(result="leased" if owner == self.owner else "leased_elsewhere")
+                continue
+            not_before = self.quarantine.not_before(title, process) if self.quarantine is not None else 0.0
+            if not_before > now:
+                self._skip_until[title] = not_before
+                CLAIMS.inc(result="backing_off")
+                continue
+            write_lease(process, self.owner, now + self.duration)
+            claimed.append((title, process))
+        if not claimed:
+            return {}
+        self.osw_obj.store_entity(OSW.StoreEntityParam(entities=[process for _, process in claimed],
+                                                       overwrite=True))
+        # a competing lease lands at most one write window after the task was loaded, the read back has to be later
+        self.write_window = max(time.monotonic() - loaded, 0.9 * self.write_window)
+        time.sleep(max(self.settle, 2 * self.write_window))
+        claimed_titles = [title for title, _ in claimed]
+        result = {title: process for title, process in self._load(claimed_titles).items()
+                  if read_lease(process)[0] == self.owner}
+        CLAIMS.inc(len(result), result="claimed")
+        CLAIMS.inc(len(claimed) - len(result), result="lost")
+        return result
+
+    def holds(self, process) -> bool:
+        """
+        True if the lease of this worker is on the wiki, checked right before the documentation is stored.
+        An expired lease is still held if no other worker claimed the task in the meantime.
+        """
+        title = get_full_title(process)
+        current = self._load([title]).get(title)
+        return current is not None and read_lease(current)[0] == self.owner
@@ -0,0 +1,153 @@
+### polling of open PseudoColorMixing tasks, shared by all continuous loops of a process
+import random
+import time
+import weakref
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Set
+
+import metrics
+
+# PseudoColorMixing instances that have their execution flag set
+OPEN_TASK_QUERY = "[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]][[ShallBeExecuted::true]]"
+
+ASK_SECONDS = metrics.histogram("smw_ask_seconds", "Duration of semantic mediawiki queries.")
+ASK_ERRORS = metrics.counter("smw_ask_errors_total", "Failed semantic mediawiki queries.")
+OPEN_TASKS = metrics.gauge("open_tasks", "Open PseudoColorMixing tasks found by the last query.")
+
+
+class AdaptivePollingScheduler:
+    """
+    Decides how long a loop waits before polling again.
+    Right after work was found the loop polls with min_interval, every idle poll multiplies the interval
+    by backoff_factor up to max_interval. A random jitter keeps loops of several workers from polling in lockstep.
+    Waiting happens on a threading.Event, so stop() ends a wait immediately.
+    """
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 30.0, backoff_factor: float = 2.0,
+                 jitter: float = 0.1, stop_event: Event = None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.stop_event = stop_event if stop_event is not None else Event()
+        self.interval = min_interval
+
+    def work_found(self):
+        """Resets the interval after a poll found work."""
+        self.interval = self.min_interval
+
+    def next_delay(self) -> float:
+        """Returns the (jittered) delay of the next wait."""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def wait_idle(self) -> bool:
+        """
+        Waits after a poll found no work and backs off for the next one.
+
+        Returns:
+            bool: True if the scheduler was stopped while waiting
+        """
+        stopped = self.stop_event.wait(self.next_delay())
+        self.interval = min(self.interval * self.backoff_factor, self.max_interval)
+        return stopped
+
+    def stop(self):
+        self.stop_event.set()
+
+    def reset(self):
+        """Prepares the scheduler for a new loop."""
+        self.stop_event.clear()
+        self.interval = self.min_interval
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+
+class SharedOpenTaskQuery:
+    """
+    Runs the open task query at most once per max_age for all loops of a process.
+    Concurrent callers wait for the running query instead of sending their own.
+    Titles handed out by take() are hidden from other loops of the process until release() is called.
+    """
+
+    def __init__(self, osw_obj, query: str = OPEN_TASK_QUERY, max_age: float = 0.5):
+        # a weak reference, so the queries of get_shared_open_task_query do not keep their site alive
+        self._site = weakref.ref(osw_obj.site)
+        self.query = query
+        self.max_age = max_age
+        self._lock = Lock()
+        self._result: Optional[List[str]] = None
+        self._timestamp = 0.0
+        self._in_progress: Set[str] = set()
+        # unix time at which a title first showed up in the query result
+        self._detected: Dict[str, float] = {}
+        self.query_count = 0
+
+    def _refresh(self, max_age: float):
+        if self._result is not None and time.monotonic() - self._timestamp < max_age:
+            return
+        with ASK_SECONDS.time(ASK_ERRORS, query="open_tasks"):
+            self._result = self._site().semantic_search(self.query)
+        OPEN_TASKS.set(len(self._result))
+        now = time.time()
+        self._detected = {title: self._detected.get(title, now) for title in self._result}
+        self._timestamp = time.monotonic()
+        self.query_count += 1
+
+    def get(self, max_age: float = None) -> List[str]:
+        """Returns the titles of all open tasks that are not in progress in this process."""
+        with self._lock:
+            self._refresh(self.max_age if max_age is None else max_age)
+            return [title for title in self._result if title not in self._in_progress]
+
+    def take(self, max_age: float = None, skip: Callable[[str], bool] = None) -> Optional[str]:
+        """Returns the title of an open task and marks it as in progress, None if there is no open task."""
+        tasks = self.take_all(limit=1, max_age=max_age, skip=skip)
+        return tasks[0] if tasks else None
+
+    def take_all(self, limit: int = None, max_age: float = None, skip: Callable[[str], bool] = None) -> List[str]:
+        """Returns the titles of up to limit open tasks and marks them as in progress, except the skipped ones."""
+        with self._lock:
+            self._refresh(self.max_age if max_age is None else max_age)
+            tasks = [title for title in self._result
+                     if title not in self._in_progress and (skip is None or not skip(title))][:limit]
+            self._in_progress.update(tasks)
+            return tasks
+
+    def mark_in_progress(self, titles: List[str]):
+        """Marks tasks as in progress that were not handed out by take(), e.g. results recovered from a spool."""
+        with self._lock:
+            self._in_progress.update(titles)
+
+    def detected_at(self, title: str) -> Optional[float]:
+        """Unix time at which the task first showed up in the query result of this process."""
+        return self._detected.get(title)
+
+    def release(self, title: str):
+        """Marks a task as no longer in progress, e.g. after it was documented."""
+        with self._lock:
+            self._in_progress.discard(title)
+            self._detected.pop(title, None)
+            # the cached result was fetched before the task was documented
+            if self._result is not None and title in self._result:
+                self._result = [t for t in self._result if t != title]
+
+    def invalidate(self):
+        """Forces the next call to query the wiki."""
+        with self._lock:
+            self._result = None
+
+
+# SharedOpenTaskQuery by wiki site, an entry is dropped with its site
+_shared_queries: "weakref.WeakKeyDictionary[object, SharedOpenTaskQuery]" = weakref.WeakKeyDictionary()
+_shared_queries_lock = Lock()
+
+
+def get_shared_open_task_query(osw_obj) -> SharedOpenTaskQuery:
+    """Returns the SharedOpenTaskQuery of the wiki site of osw_obj, creating it on first use."""
+    with _shared_queries_lock:
+        query = _shared_queries.get(osw_obj.site)
+        if query is None:
+            query = _shared_queries[osw_obj.site] = SharedOpenTaskQuery(osw_obj)
+        return query
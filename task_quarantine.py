@@ -0,0 +1,226 @@
+### failed attempts of PseudoColorMixing tasks with exponential back-off, tasks that keep failing are quarantined
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List, Optional
+
+from osw.core import OSW
+
+import metrics
+from task_leases import LEASE_EXPIRY_PROPERTY, LEASE_OWNER_PROPERTY, get_statement, load_uncached, set_statements
+
+ATTEMPTS_PROPERTY = "HasFailedAttempts"
+NEXT_ATTEMPT_PROPERTY = "HasNextAttemptTimestamp"
+LAST_ERROR_PROPERTY = "HasLastError"
+DEAD_LETTER_PROPERTY = "HasDeadLetterTimestamp"
+
+# PseudoColorMixing instances that are not flagged for execution, dead letters are among them
+NOT_EXECUTED_QUERY = "[[Category:OSW25e748d2fa7a4b19a6a74e0b7f2d0211]][[ShallBeExecuted::false]]|?HasOutput=output"
+
+FAILURES = metrics.counter("task_failures_total", "Failed task attempts, by what happened to the task.")
+
+
+def _timestamp(value: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+def read_attempts(process) -> Dict:
+    """
+    Returns:
+        dict: attempts, next_attempt (unix time, 0.0 if none), last_error and dead_letter (unix time, 0.0 if none)
+    """
+    try:
+        attempts = int(get_statement(process, ATTEMPTS_PROPERTY) or 0)
+    except ValueError:
+        attempts = 0
+    return dict(attempts=attempts,
+                next_attempt=_timestamp(get_statement(process, NEXT_ATTEMPT_PROPERTY)),
+                last_error=get_statement(process, LAST_ERROR_PROPERTY),
+                dead_letter=_timestamp(get_statement(process, DEAD_LETTER_PROPERTY)))
+
+
+class TaskQuarantine:
+    """
+    Records failed attempts on the PseudoColorMixing entity: the number of attempts, the last error and the time
+    before which the task is not tried again. The delay doubles with every attempt (base_delay * factor ** n, with
+    jitter, at most max_delay). After max_attempts the task is a dead letter: its execution flag is removed, so
+    it leaves the open task query, and the time of the quarantine is stored. retry() flags it again.
+    If the failure can not be stored, e.g. because the wiki is down, the back-off is kept in this process.
+    """
+
+    def __init__(self, osw_obj: OSW, max_attempts: int = 5, base_delay: float = 30.0, factor: float = 2.0,
+                 max_delay: float = 3600.0, jitter: float = 0.1):
+        self.osw_obj = osw_obj
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._local_next_attempt: Dict[str, float] = {}
+        self._lock = Lock()
+
+    def _load(self, title: str):
+        # the claimer loaded the task before, a cached page would have the attempts of before the claim
+        return load_uncached(self.osw_obj, [title]).get(title)
+
+    def delay(self, attempts: int) -> float:
+        """Seconds to wait after the attempts-th failed attempt."""
+        delay = min(self.base_delay * self.factor ** (attempts - 1), self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def not_before(self, title: str, process=None) -> float:
+        """Unix time before which the task must not be tried again, 0.0 if it can be tried now."""
+        next_attempt = read_attempts(process)["next_attempt"] if process is not None else 0.0
+        with self._lock:
+            return max(next_attempt, self._local_next_attempt.get(title, 0.0))
+
+    def record_failure(self, title: str, error: Exception) -> Dict:
+        """
+        Records a failed attempt of a task. The task is loaded again, so changes of the failed attempt (e.g. a
+        documentation that was prepared but not stored) are not written.
+
+        Returns:
+            dict: the attempts of the task, see read_attempts
+        """
+        now = time.time()
+        message = f"{type(error).__name__}: {error}"[:500]
+        try:
+            process = self._load(title)
+            if process is None:
+                return {}
+            attempts = read_attempts(process)["attempts"] + 1
+            dead_letter = attempts >= self.max_attempts
+            next_attempt = now + self.delay(attempts)
+            set_statements(process, {ATTEMPTS_PROPERTY: str(attempts),
+                                     LAST_ERROR_PROPERTY: message,
+                                     NEXT_ATTEMPT_PROPERTY: None if dead_letter else _isoformat(next_attempt),
+                                     DEAD_LETTER_PROPERTY: _isoformat(now) if dead_letter else None,
+                                     # other workers can take over once the back-off passed
+                                     LEASE_OWNER_PROPERTY: None,
+                                     LEASE_EXPIRY_PROPERTY: None})
+            if dead_letter:
+                process.execution_trigger = False
+            self.osw_obj.store_entity(OSW.StoreEntityParam(entities=[process], overwrite=True))
+        except Exception as e:
+            # back off in this process at least, the attempt is not counted
+            next_attempt = now + self.delay(1)
+            with self._lock:
+                self._local_next_attempt[title] = next_attempt
+            print(f"Error recording the failure of {title}: {e}")
+            FAILURES.inc(result="not_recorded")
+            return {}
+        with self._lock:
+            self._local_next_attempt[title] = 0.0 if dead_letter else next_attempt
+        if dead_letter:
+            print(f"{title} failed {attempts} times and was quarantined: {message}")
+            FAILURES.inc(result="dead_letter")
+        else:
+            print(f"{title} failed (attempt {attempts} of {self.max_attempts}), next attempt in "
+                  f"{next_attempt - now:.0f} s: {message}")
+            FAILURES.inc(result="backoff")
+        return read_attempts(process)
+
+    ## operator
+
+    def list_dead_letters(self, page_size: int = 500) -> List[Dict]:
+        """
+        Finds the quarantined tasks. Candidates are processes without execution flag and without output, they are
+        loaded to check their quarantine.
+
+        Returns:
+            list: per task a dict with title and its attempts, see read_attempts
+        """
+        candidates = []
+        offset = 0
+        while True:
+            res = self.osw_obj.mw_site.api("ask", query=f"{NOT_EXECUTED_QUERY}|limit={page_size}|offset={offset}",
+                                           format="json")
+            # an empty result is an empty list
+            for title, result in (res["query"]["results"] or {}).items():
+                if not result.get("printouts", {}).get("output"):
+                    candidates.append(title)
+            if "query-continue-offset" not in res:
+                break
+            offset = res["query-continue-offset"]
+        dead_letters = []
+        for i in range(0, len(candidates), 100):
+            for title, process in load_uncached(self.osw_obj, candidates[i:i + 100]).items():
+                attempts = read_attempts(process)
+                if attempts["dead_letter"]:
+                    dead_letters.append(dict(title=title, **attempts))
+        return dead_letters
+
+    def retry(self, titles: List[str]):
+        """Flags quarantined (or backing off) tasks for execution again and resets their attempts."""
+        processes = []
+        loaded = load_uncached(self.osw_obj, titles)
+        for title in titles:
+            process = loaded.get(title)
+            if process is None:
+                print(f"Could not load {title}")
+                continue
+            set_statements(process, {ATTEMPTS_PROPERTY: None, NEXT_ATTEMPT_PROPERTY: None,
+                                     DEAD_LETTER_PROPERTY: None})
+            process.execution_trigger = True
+            processes.append(process)
+            with self._lock:
+                self._local_next_attempt.pop(title, None)
+        if processes:
+            self.osw_obj.store_entity(OSW.StoreEntityParam(entities=processes, overwrite=True))
+        print(f"Flagged {len(processes)} task(s) for execution again.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lists and retries quarantined pseudo color mixing tasks.")
+    parser.add_argument("--retry", nargs="+", default=None, metavar="TITLE", help="tasks to flag again")
+    parser.add_argument("--retry-all", action="store_true", help="flag all quarantined tasks again")
+    parser.add_argument("--check", action="store_true",
+                        help="fail a task of an in-process fake wiki until it is quarantined and retry it (testing)")
+    args = parser.parse_args()
+
+    if args.check:
+        from fake_osw import FakeOSW
+        from task_leases import LeaseClaimer
+        osw_obj = FakeOSW.create()
+        osw_obj.populate(0, n_pending=1)
+        title = next(iter(osw_obj.backend.pages))
+        quarantine = TaskQuarantine(osw_obj, max_attempts=3, base_delay=0.0)
+        claimer = LeaseClaimer(osw_obj, settle=0.1, quarantine=quarantine)
+        # the claim loads the task before the failures are recorded
+        assert title in claimer.claim([title]), "the task was not claimed"
+        for attempt in range(1, 4):
+            # every failure has to read the attempts stored by the one before, not a cached page
+            attempts = quarantine.record_failure(title, RuntimeError("check"))
+            assert attempts["attempts"] == attempt, f"attempt {attempt} was recorded as {attempts['attempts']}"
+        assert [dead_letter["title"] for dead_letter in quarantine.list_dead_letters()] == [title]
+        assert not claimer.claim([title]), "a quarantined task was claimed"
+        quarantine.retry([title])
+        assert read_attempts(load_uncached(osw_obj, [title])[title])["attempts"] == 0
+        assert title in claimer.claim([title]), "the retried task was not claimed"
+        print("check passed")
+        raise SystemExit
+
+    from osw.express import OswExpress
+    osw_obj = OswExpress(
+        domain="wiki-dev.open-semantic-lab.org"
+    )
+    quarantine = TaskQuarantine(osw_obj)
+    if args.retry:
+        quarantine.retry(args.retry)
+    else:
+        dead_letters = quarantine.list_dead_letters()
+        for dead_letter in dead_letters:
+            print(f"{dead_letter['title']}: {dead_letter['attempts']} attempts, quarantined "
+                  f"{datetime.fromtimestamp(dead_letter['dead_letter'])}, last error: {dead_letter['last_error']}")
+        print(f"{len(dead_letters)} quarantined task(s).")
+        if args.retry_all and dead_letters:
+            quarantine.retry([dead_letter["title"] for dead_letter in dead_letters])
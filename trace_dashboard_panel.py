@@ -0,0 +1,92 @@
+### a panel with queue wait and service time percentiles of the traced experiments, for sizing workers and polling
+import math
+
+import numpy as np
+import panel as pn
+from osw.core import OSW
+from osw.express import OswExpress
+
+from experiment_repository import ExperimentRepository
+from experiment_trace import hop_statistics, load_traces
+
+PERCENTILES = (50, 90, 99)
+
+
+class TraceDashboardPanel:
+    """Loads the traces of the most recent experiments and shows the percentiles of every hop."""
+
+    def __init__(self, osw_obj: OSW = None, repository: ExperimentRepository = None):
+        self.osw_obj = osw_obj
+        self.repository = repository if repository is not None else ExperimentRepository(osw_obj)
+        self.traces = []
+        self.build_panel()
+
+    def build_panel(self):
+        self.experiments_input = pn.widgets.IntInput(name="latest experiments", value=200, start=10, step=50,
+                                                     width=200)
+        self.load_button = pn.widgets.Button(name="load traces")
+        self.load_button.on_click(self.load_traces_callback)
+        self.summary_markdown = pn.pane.Markdown("Load traces to see where experiments spend their time.")
+        self.statistics_html = pn.pane.HTML("")
+        self.main_column = pn.Column(pn.Row(self.experiments_input, self.load_button),
+                                     self.summary_markdown, self.statistics_html)
+
+    def __panel__(self):
+        return self.main_column
+
+    def load_traces_callback(self, event):
+        self.summary_markdown.object = "Loading traces..."
+        try:
+            # the dataset is ordered by modification date, the last pages were documented last
+            pages = self.repository.get_dataset().pages[-self.experiments_input.value:]
+            self.traces = load_traces(self.osw_obj, list(pages))
+        except Exception as e:
+            self.summary_markdown.object = f"Error loading traces: {e}"
+            return
+        self.update_statistics()
+
+    def update_statistics(self):
+        if not self.traces:
+            self.summary_markdown.object = "None of the latest experiments has a trace yet."
+            self.statistics_html.object = ""
+            return
+        statistics = hop_statistics(self.traces, percentiles=PERCENTILES)
+
+        def cell(value):
+            return "" if value is None else f"{value:.2f}"
+
+        rows = "".join(f"<tr><td>{entry['hop']}</td><td>{entry['kind']}</td><td>{entry['count']}</td>"
+                       + "".join(f"<td>{cell(entry[f'p{percentile}'])}</td>" for percentile in PERCENTILES)
+                       + f"<td>{cell(entry['max'])}</td></tr>"
+                       for entry in statistics)
+        header = "".join(f"<th>p{percentile} [s]</th>" for percentile in PERCENTILES)
+        self.statistics_html.object = (f"<table><tr><th>hop</th><th>kind</th><th>count</th>{header}"
+                                       f"<th>max [s]</th></tr>{rows}</table>")
+        self.summary_markdown.object = self.sizing_summary(statistics)
+
+    def sizing_summary(self, statistics) -> str:
+        ## Little's law: busy workers = arrival rate * service time
+        documented = np.array(sorted(trace["documented"] for trace in self.traces if "documented" in trace))
+        by_hop = {entry["hop"]: entry for entry in statistics}
+        lines = [f"{len(self.traces)} traced experiments."]
+        if len(documented) > 1 and documented[-1] > documented[0]:
+            rate = (len(documented) - 1) / (documented[-1] - documented[0]) * 60
+            lines.append(f"Documented {rate:.1f} experiments per minute.")
+            service = by_hop["service time"]
+            if service["count"]:
+                mean_service = float(np.mean([trace["documented"] - trace["loaded"] for trace in self.traces
+                                              if "documented" in trace and "loaded" in trace]))
+                lines.append(f"Mean service time {mean_service:.2f} s, so the load keeps "
+                             f"{math.ceil(rate / 60 * mean_service)} worker(s) busy.")
+        detection = by_hop["detection"]
+        if detection["count"]:
+            lines.append(f"Median detection delay {detection['p50']:.2f} s, it is bound by the polling interval.")
+        return " ".join(lines)
+
+
+if __name__ == "__main__":
+    osw_obj = OswExpress(
+        domain="wiki-dev.open-semantic-lab.org"
+    )
+    trace_dashboard_panel = TraceDashboardPanel(osw_obj=osw_obj)
+    pn.serve(trace_dashboard_panel, port=20204, threaded=True)
@@ -1,4 +1,6 @@
-from osw.express import OswExpress
+import argparse
+
+from schema_installer import CachedSchemaInstaller
 
 dependencies = {
     "File": "Category:OSW11a53cdfbdc24524bf8ac435cbf65d9d",
@@ -10,14 +12,21 @@ dependencies = {
 }
 
 if __name__ == "__main__":
-    osw_obj = OswExpress(
-        domain="wiki-dev.open-semantic-lab.org",
-    )
-    osw_obj.install_dependencies(dependencies)
-
-
-
-
-
-
-
+    parser = argparse.ArgumentParser(description="Installs the data models of the pseudo color mixing schemas.")
+    parser.add_argument("--force", action="store_true", help="generate the models even if nothing changed")
+    parser.add_argument("--bundle", metavar="ZIP", help="install from an offline bundle, without the wiki")
+    parser.add_argument("--write-bundle", metavar="ZIP", help="write the installed models to an offline bundle")
+    parser.add_argument("--workers", type=int, default=8, help="parallel schema downloads")
+    args = parser.parse_args()
+
+    if args.bundle:
+        CachedSchemaInstaller(dependencies=dependencies).install_bundle(args.bundle, force=args.force)
+    else:
+        from osw.express import OswExpress
+        osw_obj = OswExpress(
+            domain="wiki-dev.open-semantic-lab.org",
+        )
+        installer = CachedSchemaInstaller(osw_obj, dependencies, workers=args.workers)
+        installer.install(force=args.force)
+        if args.write_bundle:
+            installer.write_bundle(args.write_bundle)